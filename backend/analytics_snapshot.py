@@ -0,0 +1,333 @@
+import os
+import json
+import fcntl
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from update_history import BUCKET_FILTER
+
+# Columnar snapshot of `users` and the profile update log for admin
+# analytics. Each column is a typed .npy file that readers memory-map, with
+# categorical fields dictionary-encoded (small int codes + a value list in
+# meta.json). A refresh reads only documents past the previous watermarks,
+# writes a complete new version directory and then swaps meta.json, so
+# readers always see a consistent snapshot and never touch Mongo.
+#
+#   <dir>/meta.json          version, row counts, dictionaries, watermarks
+#   <dir>/v<N>/users.<column>.npy
+#   <dir>/v<N>/updates.<column>.npy
+#   <dir>/.lock              held (flock) by the one refresh running at a time
+
+ANALYTICS_DIR = os.getenv('ANALYTICS_DIR', os.path.join(tempfile.gettempdir(), 'balance-bite-analytics'))
+WATERMARK_LAG = timedelta(seconds=5)  # Writes newer than this wait for the next refresh, so none land behind the watermark
+KEEP_VERSIONS = 2  # Older version directories are removed; open maps of them stay valid on POSIX
+
+CATEGORIES = ('goal', 'a_level', 'diet_type', 'sex')
+USER_NUMBERS = ('age', 'height', 'weight', 'meals', 'tdee', 'target_calories', 'total_protein', 'total_fat', 'total_carbs')
+USER_COLUMNS = ('uid', 'created_at', 'updated_at') + CATEGORIES + USER_NUMBERS
+USER_PROJECTION = {field: 1 for field in ('created_at', 'updated_at') + CATEGORIES + USER_NUMBERS}
+UPDATE_COLUMNS = ('updated_at', 'weight', 'target_calories', 'goal', 'a_level')
+MISSING = -1  # Code for a missing categorical value
+
+
+def _epoch(value):
+    return int((value - datetime(1970, 1, 1)).total_seconds()) if isinstance(value, datetime) else 0
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class Dictionary:
+    """
+    Value <-> code for one categorical column; codes only ever grow.
+    """
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self._codes = {v: i for i, v in enumerate(self.values)}
+
+    def encode(self, value):
+        if value is None or value == '':
+            return MISSING
+        value = str(value).lower()
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value):
+        return self._codes.get(str(value).lower(), MISSING)
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _load_columns(directory, meta, table, names):
+    if not meta or not meta['rows'].get(table):
+        return None
+    version_dir = os.path.join(directory, meta['dir'])
+    return {name: np.load(os.path.join(version_dir, f'{table}.{name}.npy'), mmap_mode='r') for name in names}
+
+
+def _user_rows(docs, dictionaries):
+    rows = {name: [] for name in USER_COLUMNS}
+    for doc in docs:
+        rows['uid'].append(str(doc['_id']))
+        rows['created_at'].append(_epoch(doc.get('created_at')))
+        rows['updated_at'].append(_epoch(doc.get('updated_at') or doc.get('created_at')))
+        for name in CATEGORIES:
+            rows[name].append(dictionaries[name].encode(doc.get(name)))
+        for name in USER_NUMBERS:
+            rows[name].append(_number(doc.get(name)))
+    return rows
+
+
+def _user_arrays(rows):
+    arrays = {
+        'uid': np.array(rows['uid'], dtype=str),
+        'created_at': np.array(rows['created_at'], dtype=np.int64),
+        'updated_at': np.array(rows['updated_at'], dtype=np.int64)
+    }
+    arrays.update({name: np.array(rows[name], dtype=np.int16) for name in CATEGORIES})
+    arrays.update({name: np.array(rows[name], dtype=np.float32) for name in USER_NUMBERS})
+    return arrays
+
+
+def _merge_users(old, new):
+    """
+    New rows replace old rows with the same uid; the rest are appended.
+    """
+    if old is None:
+        return new
+    if not len(new['uid']):
+        return {name: np.asarray(column) for name, column in old.items()}
+    changed = np.isin(old['uid'], new['uid'])
+    keep = ~changed
+    merged = {}
+    for name in USER_COLUMNS:
+        column = old[name]
+        if name == 'uid':
+            # Fixed-width strings: widen to the longer of the two
+            width = max(column.dtype.itemsize, new[name].dtype.itemsize) // 4
+            merged[name] = np.concatenate([column[keep].astype(f'<U{width}'), new[name].astype(f'<U{width}')])
+        else:
+            merged[name] = np.concatenate([column[keep], new[name]])
+    return merged
+
+
+def refresh_snapshot(users_collection, buckets_collection, directory=ANALYTICS_DIR, full=False):
+    """
+    Brings the snapshot up to date: users created or updated since the
+    last run replace their rows, newer update-log entries are appended.
+    `full` rebuilds from scratch. Returns the new meta.
+
+    Refreshes from any worker or cron run one at a time under an exclusive
+    lock on <dir>/.lock, so two never read the same meta and race to write
+    the same version.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return _refresh(users_collection, buckets_collection, directory, full)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _refresh(users_collection, buckets_collection, directory, full):
+    # Under the lock, dot-prefixed temp files are leftovers of a crashed run
+    for name in os.listdir(directory):
+        if name.startswith('.v') or name.startswith('.meta-'):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    meta = None if full else _read_meta(directory)
+    dictionaries = {name: Dictionary((meta or {}).get('dictionaries', {}).get(name, ())) for name in CATEGORIES}
+    watermarks = (meta or {}).get('watermarks', {})
+    since = datetime.fromisoformat(watermarks['users']) if watermarks.get('users') else None
+    until = datetime.utcnow() - WATERMARK_LAG
+
+    # Users: only documents touched in (since, until]
+    window = {'$gt': since, '$lte': until} if since else {'$lte': until}
+    user_query = {'$or': [{'updated_at': window}, {'created_at': window}]}
+    if not since:
+        # First run also picks up legacy documents without timestamps
+        user_query = {'$or': user_query['$or'] + [{'created_at': None, 'updated_at': None}]}
+    new_users = _user_arrays(_user_rows(users_collection.find(user_query, USER_PROJECTION), dictionaries))
+    users = _merge_users(_load_columns(directory, meta, 'users', USER_COLUMNS), new_users)
+
+    # Update log: append-only, so entries in (since, until] are exactly the new ones.
+    # A bucket's last_at is its newest entry, which may be past `until` while
+    # older entries in it are not, so buckets are bounded from below only.
+    rows = {name: [] for name in UPDATE_COLUMNS}
+    bucket_query = {'last_at': {'$gt': since}, **BUCKET_FILTER} if since else dict(BUCKET_FILTER)
+    for bucket in buckets_collection.find(bucket_query, {'entries': 1}):
+        for entry in bucket.get('entries') or []:
+            ts = entry.get('updated_at')
+            if not isinstance(ts, datetime) or ts > until or (since and ts <= since):
+                continue
+            rows['updated_at'].append(_epoch(ts))
+            rows['weight'].append(_number(entry.get('weight')))
+            rows['target_calories'].append(_number(entry.get('target_calories')))
+            rows['goal'].append(dictionaries['goal'].encode(entry.get('goal')))
+            rows['a_level'].append(dictionaries['a_level'].encode(entry.get('activity_level')))
+    new_updates = {
+        'updated_at': np.array(rows['updated_at'], dtype=np.int64),
+        'weight': np.array(rows['weight'], dtype=np.float32),
+        'target_calories': np.array(rows['target_calories'], dtype=np.float32),
+        'goal': np.array(rows['goal'], dtype=np.int16),
+        'a_level': np.array(rows['a_level'], dtype=np.int16)
+    }
+    old_updates = _load_columns(directory, meta, 'updates', UPDATE_COLUMNS)
+    updates = {
+        name: np.concatenate([old_updates[name], column]) if old_updates else column
+        for name, column in new_updates.items()
+    }
+
+    version = (meta or {}).get('version', 0) + 1
+    version_dir = f'v{version:06d}'
+    # Columns go to a unique temp directory, renamed into place once complete
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{version_dir}-', dir=directory)
+    os.chmod(tmp_dir, 0o755)  # mkdtemp's 0700 would hide it from readers running as another user
+    for table, columns in (('users', users), ('updates', updates)):
+        for name, column in columns.items():
+            np.save(os.path.join(tmp_dir, f'{table}.{name}.npy'), np.ascontiguousarray(column))
+    final_dir = os.path.join(directory, version_dir)
+    if os.path.exists(final_dir):
+        # Written by a run that died before swapping meta.json; nothing reads it
+        shutil.rmtree(final_dir)
+    os.rename(tmp_dir, final_dir)
+
+    new_meta = {
+        'version': version,
+        'dir': version_dir,
+        'rows': {'users': int(len(users['uid'])), 'updates': int(len(updates['updated_at']))},
+        'dictionaries': {name: d.values for name, d in dictionaries.items()},
+        'watermarks': {'users': until.isoformat(), 'updates': until.isoformat()},
+        'refreshed_at': datetime.utcnow().isoformat(),
+        'delta': {'users': int(len(new_users['uid'])), 'updates': int(len(new_updates['updated_at']))}
+    }
+    fd, tmp_path = tempfile.mkstemp(prefix='.meta-', suffix='.tmp', dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        os.fchmod(fd, 0o644)
+        json.dump(new_meta, f)
+    os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+    old_dirs = sorted(d for d in os.listdir(directory) if d.startswith('v') and d != version_dir)
+    for old in old_dirs[:max(0, len(old_dirs) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return new_meta
+
+
+class AnalyticsSnapshot:
+    """
+    Read side: memory-maps the current version and answers aggregate
+    questions with vectorized numpy. Reopens when a refresh swaps meta.json.
+    """
+
+    def __init__(self, directory=ANALYTICS_DIR):
+        self.directory = directory
+        self.meta = None
+        self.users = None
+        self.updates = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        try:
+            mtime = os.stat(os.path.join(self.directory, 'meta.json')).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if mtime != self._mtime:
+                meta = _read_meta(self.directory)
+                self.users = _load_columns(self.directory, meta, 'users', USER_COLUMNS)
+                self.updates = _load_columns(self.directory, meta, 'updates', UPDATE_COLUMNS)
+                self.meta, self._mtime = meta, mtime
+        return self.meta is not None
+
+    def _decode(self, column, counts):
+        values = self.meta['dictionaries'][column]
+        return {(values[code] if code != MISSING else 'unknown'): int(n) for code, n in counts}
+
+    def distribution(self, column):
+        """
+        Users per value of a categorical column.
+        """
+        codes = np.asarray(self.users[column]).astype(np.int64)
+        counts = np.bincount(codes + 1, minlength=len(self.meta['dictionaries'][column]) + 1)
+        return self._decode(column, ((code - 1, n) for code, n in enumerate(counts) if n))
+
+    def mean_by(self, value_column, group_column):
+        """
+        Mean of a numeric user column per value of a categorical one (NaNs ignored).
+        """
+        values = np.asarray(self.users[value_column], dtype=np.float64)
+        groups = np.asarray(self.users[group_column]).astype(np.int64) + 1
+        valid = ~np.isnan(values)
+        size = len(self.meta['dictionaries'][group_column]) + 1
+        sums = np.bincount(groups[valid], weights=values[valid], minlength=size)
+        counts = np.bincount(groups[valid], minlength=size)
+        names = self.meta['dictionaries'][group_column]
+        return {
+            (names[i - 1] if i else 'unknown'): round(float(sums[i] / counts[i]), 1)
+            for i in range(size) if counts[i]
+        }
+
+    def weekly_weight(self, weeks=12, now=None):
+        """
+        Population mean logged weight and update count per week, oldest first.
+        """
+        if not self.updates:
+            return []
+        now = now or datetime.utcnow()
+        this_week = datetime(now.year, now.month, now.day) - timedelta(days=now.weekday())
+        start = _epoch(this_week - timedelta(weeks=weeks - 1))
+        ts = np.asarray(self.updates['updated_at'])
+        weight = np.asarray(self.updates['weight'], dtype=np.float64)
+        mask = (ts >= start) & ~np.isnan(weight)
+        index = (ts[mask] - start) // (7 * 24 * 3600)
+        counts = np.bincount(index, minlength=weeks)[:weeks]
+        sums = np.bincount(index, weights=weight[mask], minlength=weeks)[:weeks]
+        return [
+            {
+                'week_start': (this_week - timedelta(weeks=weeks - 1 - i)).strftime('%Y-%m-%d'),
+                'updates': int(counts[i]),
+                'mean_weight': round(float(sums[i] / counts[i]), 2) if counts[i] else None
+            }
+            for i in range(weeks)
+        ]
+
+    def summary(self, weeks=12):
+        """
+        The admin dashboard's numbers, or None when no snapshot exists yet.
+        """
+        if not self._current() or not self.users:
+            return None
+        return {
+            'users': self.meta['rows']['users'],
+            'updates': self.meta['rows']['updates'],
+            'snapshot_at': self.meta['watermarks']['users'],
+            'goal_distribution': self.distribution('goal'),
+            'activity_distribution': self.distribution('a_level'),
+            'diet_distribution': self.distribution('diet_type'),
+            'avg_target_calories_by_activity': self.mean_by('target_calories', 'a_level'),
+            'avg_weight_by_goal': self.mean_by('weight', 'goal'),
+            'weekly_weight': self.weekly_weight(weeks)
+        }
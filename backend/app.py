@@ -1,101 +1,226 @@
-from flask import Flask, request, jsonify, send_file
+import click
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 import logging
 from datetime import datetime
 import os
-import io
+import json
+import math
+import hashlib
+import threading
 from functools import wraps
-from firebase_config import verify_token
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from reportlab.lib import colors
+from firebase_config import init_firebase, verify_token, token_cache_stats
 from dotenv import load_dotenv
 
 # Import Constants
-from constants import ACTIVITY_MULTIPLIERS, GOAL_MODIFIERS, MACRO_RATIOS, MEAL_DISTRIBUTION
-from recipes import generate_recipes_with_mistral
+from calculations import get_bmr, get_tdee, calculate_macros, generate_meal_plan_logic, build_meal_plan, find_meal, parse_meal_plan, parse_meals, profile_update
+from recipes import generate_recipes_with_mistral, generate_day_recipes, stream_recipe_with_mistral, configure_recipe_cache, configure_recipe_corpus, configure_upstream_limiter, recipe_cache, recipe_corpus, recipe_request_key, reset_client
+from recipe_jobs import RecipeJobQueue, MongoJobStore, QueueFull
+from rate_limit import AdmissionRejected, RateLimited, build_limiters
+from pagination import fetch_page, iter_all, page_size, wants_ndjson
+from json_codec import OrjsonProvider, ndjson_chunks, sse_event
+from indexes import ensure_indexes, check_query_plans, assert_query_plans, strict_query_checks
+from user_store import UserStore
+from write_buffer import WriteBehindBuffer, BufferFull, WRITE_BEHIND, WRITE_BEHIND_DELAY
+from workout_rollups import apply_workout_rollups, rebuild_workout_rollups
+from update_history import record_update, migrate_user_updates, rebuild_update_series, series_point, series_report_rows, PERIODS
+from metrics import Gauge, ADMISSION_REJECTED, instrument_app, mongo_command_metrics, pool_metrics, start_flusher, render as render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from reports import ReportCache, report_version, stream_file, SERIES_REPORT_PROJECTION, REPORT_FETCH_ROWS
 
 load_dotenv()
 
-logging.basicConfig(level=logging.ERROR)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'ERROR').upper())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)  # BSON-aware orjson for every jsonify
 CORS(app)  # Enable CORS for all routes
+instrument_app(app)  # Per-route latency for /metrics
 
 # MongoDB Configuration
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 DB_NAME = 'meal_plan_db'
 
-try:
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    users_collection = db['users']
-    weekly_workout_collection = db['weekly_workout']
-    suggestions_collection = db['suggestions']
-    user_updates_collection = db['user_updates']
-    print(f"Connected to MongoDB at {MONGO_URI}")
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
+# Per-process pool settings; total connections are workers x MONGO_MAX_POOL_SIZE
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 0)) or None
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 20000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0)) or None  # None = no timeout
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 0)) or None
+
+# Importing this module connects to nothing: create_app() (or init_clients()
+# for Mongo alone) sets these up, once per process.
+client = None
+db = None
+users_collection = user_store = None
+weekly_workout_collection = suggestions_collection = user_updates_collection = None
+workout_rollups_collection = None
+update_buckets_collection = None
+portions_collection = admin_jobs_collection = None
+workout_buffer = suggestion_buffer = None
+recipe_jobs = None
+ai_rate_limiter = llm_limiter = None
+_clients_pid = None
+
+def mongo_client_options():
+    return {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': MONGO_SOCKET_TIMEOUT_MS,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'event_listeners': [mongo_command_metrics, pool_metrics]
+    }
+
+def init_clients(database=None):
+    """
+    Creates this process's Mongo client, collections and background workers.
+    Must run after fork: sockets, locks and threads don't survive it.
+    `database` substitutes an existing database object (e.g. an in-memory
+    stand-in for benchmarks) for connecting to MONGO_URI.
+    """
+    global client, db, users_collection, user_store, weekly_workout_collection, suggestions_collection
+    global user_updates_collection, workout_rollups_collection, workout_buffer, suggestion_buffer, recipe_jobs
+    global update_buckets_collection, portions_collection, admin_jobs_collection
+    global ai_rate_limiter, llm_limiter, _clients_pid
+    if database is None and _clients_pid == os.getpid():
+        return  # Already set up in this process
+    try:
+        if database is None:
+            client = MongoClient(MONGO_URI, **mongo_client_options())
+            db = client[DB_NAME]
+        else:
+            client, db = database.client, database
+        users_collection = db['users']
+        user_store = UserStore(users_collection)
+        weekly_workout_collection = db['weekly_workout']
+        suggestions_collection = db['suggestions']
+        user_updates_collection = db['user_updates']  # Pre-bucketing log, read only by migrate-user-updates
+        update_buckets_collection = db['user_update_buckets']  # Update log buckets and their week/month series
+        portions_collection = db['meal_portions']
+        admin_jobs_collection = db['admin_jobs']  # Cross-worker state of admin background jobs
+        configure_recipe_cache(db['recipe_cache'])
+        configure_recipe_corpus(db['recipe_corpus'])
+        workout_rollups_collection = db['workout_rollups']
+        # Opt-in: group single-row inserts into batched insert_many calls
+        workout_buffer = WriteBehindBuffer(
+            weekly_workout_collection,
+            on_flush=lambda docs: apply_workout_rollups(workout_rollups_collection, docs)
+        ) if WRITE_BEHIND else None
+        suggestion_buffer = WriteBehindBuffer(suggestions_collection) if WRITE_BEHIND else None
+        recipe_jobs = RecipeJobQueue(MongoJobStore(db['recipe_jobs']), generate_recipes_with_mistral)
+        ai_rate_limiter, llm_limiter = build_limiters(db)
+        configure_upstream_limiter(llm_limiter)
+        _clients_pid = os.getpid()
+        if database is None:
+            print(f"Connected to MongoDB at {MONGO_URI}")
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        return
+    if database is None:
+        # Idempotent, so every serving mode (gunicorn, flask run, hypercorn)
+        # gets the unique and TTL indexes no matter which process starts first
+        try:
+            ensure_indexes(db)
+        except Exception as e:
+            logger.error(f"Error creating indexes: {e}")
+
+def close_clients():
+    """
+    Graceful shutdown: flushes buffered writes, lets queued recipe jobs
+    finish, then closes the Mongo client.
+    """
+    for buffer in (workout_buffer, suggestion_buffer):
+        if buffer:
+            buffer.close()
+    if recipe_jobs:
+        recipe_jobs.shutdown(wait=True)
+    if client:
+        client.close()
+
+def create_app():
+    """
+    App factory: sets up Firebase, Mongo and the Mistral client for this
+    process. Pre-fork servers call it in each worker after fork; for
+    development use `flask --app "app:create_app()" run` or `python app.py`.
+    """
+    init_firebase()
+    reset_client()
+    init_clients()
+    start_flusher()  # Snapshots for /metrics across workers, when METRICS_DIR is set
+    return app
+
+# Rendered PDF reports, keyed by user and their latest update
+report_cache = ReportCache()
+
+# Optional bearer token for /metrics; unset leaves it open (scrape from the private network)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+Gauge('token_cache_entries', 'Verified ID tokens cached.',
+      collect=lambda: {(): token_cache_stats()['size']})
+Gauge('recipe_cache_hit_rate', 'Recipe cache hit rate since start.',
+      collect=lambda: {(): recipe_cache.stats()['hit_rate']})
+Gauge('recipe_corpus_size', 'Stored recipes searchable in this process.',
+      collect=lambda: {(): len(recipe_corpus)} if recipe_corpus is not None else {})
+Gauge('recipe_jobs_pending', 'Queued or running recipe jobs.',
+      collect=lambda: {(): recipe_jobs.pending} if recipe_jobs else {})
+Gauge('llm_slot_waiters', 'Callers in this process waiting for an LLM slot.',
+      collect=lambda: {(): llm_limiter.stats()['waiting']} if llm_limiter else {})
+Gauge('write_behind_pending', 'Buffered inserts not yet flushed.', ('collection',),
+      collect=lambda: {
+          (name,): buffer.stats()['pending']
+          for name, buffer in (('weekly_workout', workout_buffer), ('suggestions', suggestion_buffer)) if buffer
+      })
+Gauge('write_behind_dropped', 'Buffered inserts dropped while Mongo was unavailable.', ('collection',),
+      collect=lambda: {
+          (name,): buffer.stats()['dropped']
+          for name, buffer in (('weekly_workout', workout_buffer), ('suggestions', suggestion_buffer)) if buffer
+      })
 
 # --- Helper Functions ---
 
-def get_bmr(sex, weight, height, age):
-    if sex.lower() == 'male':
-        return 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
-    else:
-        return 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+def write_behind_full():
+    # The buffer is at WRITE_BEHIND_MAX_PENDING because Mongo isn't keeping up
+    response = jsonify({'error': 'Too many writes waiting, try again shortly'})
+    response.headers['Retry-After'] = str(max(1, math.ceil(WRITE_BEHIND_DELAY)))
+    return response, 503
 
-def get_tdee(bmr, a_level):
-    return bmr * ACTIVITY_MULTIPLIERS.get(a_level.lower(), 1.2)
+def user_etag(user):
+    # Strong validator: changes whenever the stored `version` is bumped
+    return hashlib.sha1(f"{user['_id']}:{user.get('version', 0)}".encode()).hexdigest()
 
-def calculate_macros(tdee, goal):
-    goal_key = goal.lower()
-    # Apply goal modifier to TDEE
-    adjusted_calories = tdee * GOAL_MODIFIERS.get(goal_key, 1.0)
-    
-    # Get ratios
-    p_ratio, f_ratio, c_ratio = MACRO_RATIOS.get(goal_key, MACRO_RATIOS['maintenance'])
-    
-    # Calculate grams (Protein/Carbs = 4 kcal/g, Fat = 9 kcal/g)
-    protein_g = (adjusted_calories * p_ratio) / 4
-    fat_g = (adjusted_calories * f_ratio) / 9
-    carbs_g = (adjusted_calories * c_ratio) / 4
-    
-    return {
-        'calories': adjusted_calories,
-        'protein': round(protein_g, 1),
-        'fat': round(fat_g, 1),
-        'carbs': round(carbs_g, 1)
-    }
+def not_modified(etag):
+    """
+    Returns a 304 response if the client already holds `etag`, else None.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
 
-def generate_meal_plan_logic(daily_macros, num_meals):
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.errorhandler(AdmissionRejected)
+def too_many_requests(e):
     """
-    Distributes daily macros into meals based on weighted preference.
+    Fast 429 for rate-limited or over-capacity AI requests, with a
+    Retry-After hint instead of a request left waiting on the upstream.
     """
-    weights = MEAL_DISTRIBUTION.get(num_meals, [1/num_meals] * num_meals) # Fallback to equal split
-    
-    meal_plan = []
-    meal_names = {
-        3: ['Breakfast', 'Lunch', 'Dinner'],
-        4: ['Breakfast', 'Lunch', 'Snack', 'Dinner'],
-        5: ['Breakfast', 'Lunch', 'Snack 1', 'Snack 2', 'Dinner']
-    }
-    names = meal_names.get(num_meals, [f'Meal {i+1}' for i in range(num_meals)])
-
-    for i, weight in enumerate(weights):
-        meal = {
-            'name': names[i],
-            'calories': round(daily_macros['calories'] * weight, 1),
-            'protein': round(daily_macros['protein'] * weight, 1),
-            'fat': round(daily_macros['fat'] * weight, 1),
-            'carbs': round(daily_macros['carbs'] * weight, 1)
-        }
-        meal_plan.append(meal)
-    
-    return meal_plan
+    ADMISSION_REJECTED.inc('rate_limited' if isinstance(e, RateLimited) else 'overloaded')
+    retry_after = max(1, math.ceil(e.retry_after))
+    response = jsonify({'error': str(e), 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
 
 # --- Auth Middleware ---
 
@@ -122,6 +247,12 @@ def check_auth(f):
 def home():
     return jsonify({'message': 'Welcome to Balance Bite API'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
+
 @app.route('/api/signup', methods=['POST'])
 @check_auth
 def signup():
@@ -136,7 +267,10 @@ def signup():
     age = int(data.get('age', 0))
     height = float(data.get('height', 0))
     weight = float(data.get('weight', 0))
-    meals = int(data.get('meals', 3))
+    try:
+        meals = parse_meals(data.get('meals', 3))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     sex = data.get('sex', 'male')
     a_level = data.get('a_level', 'sedentary')
     is_admin = data.get('is_admin', False)
@@ -173,13 +307,15 @@ def signup():
         'total_carbs': daily_macros['carbs'],
         'total_protein': daily_macros['protein'],
         'total_fat': daily_macros['fat'],
+        'meal_plan': meal_plan,
         'is_admin': is_admin,
         'created_at': datetime.utcnow()
     }
 
     try:
-        users_collection.replace_one({'_id': uid}, user_doc, upsert=True)
-        return jsonify({'message': 'User profile created/updated successfully', 'user': user_doc})
+        fields = {k: v for k, v in user_doc.items() if k != '_id'}
+        user = user_store.update(uid, fields, upsert=True)
+        return jsonify({'message': 'User profile created/updated successfully', 'user': user})
     except Exception as e:
         logger.error(f"Error saving user: {e}")
         return jsonify({'error': str(e)}), 500
@@ -188,73 +324,44 @@ def signup():
 @check_auth
 def get_profile():
     uid = request.user['uid']
-    user = users_collection.find_one({'_id': uid})
+    user = user_store.get(uid)
     if not user:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify(user)
+
+    etag = user_etag(user)
+    return not_modified(etag) or with_etag(jsonify(user), etag)
 
 @app.route('/api/user/update', methods=['POST'])
 @check_auth
 def update_profile():
+    """
+    Applies profile changes and recomputes targets in two round trips:
+    one find_one_and_update that writes and returns the profile, and one
+    bulk write that appends to the history log and its week/month series.
+    Without USER_CACHE_TTL the profile is loaded first (three cold); the
+    load can't fold into the write, as the new targets are computed here
+    from the stored sex, height and age.
+    """
     uid = request.user['uid']
     data = request.get_json()
     
-    user = users_collection.find_one({'_id': uid})
+    user = user_store.get(uid)
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    # Update allowed fields
-    weight = float(data.get('weight', user['weight']))
-    meals = int(data.get('meals', user['meals']))
-    a_level = data.get('a_level', user['a_level'])
-    goal = data.get('goal', user.get('goal', 'maintenance'))
-    diet_type = data.get('diet_type', user.get('diet_type', 'Standard'))
-    
-    # Recalculate
-    bmr = get_bmr(user['sex'], weight, user['height'], user['age'])
-    tdee = get_tdee(bmr, a_level)
-    
-    # Recalculate Macros
-    daily_macros = calculate_macros(tdee, goal)
-    meal_plan = generate_meal_plan_logic(daily_macros, meals)
-    
-
-    update_doc = {
-        'weight': weight,
-        'meals': meals,
-        'a_level': a_level,
-        'goal': goal,
-        'diet_type': diet_type,
-        'bmr': bmr,
-        'tdee': tdee,
-        'target_calories': daily_macros['calories'],
-        'total_carbs': daily_macros['carbs'],
-        'total_protein': daily_macros['protein'],
-        'total_fat': daily_macros['fat']
-    }
-    
-    # Log update
-    log_entry = {
-        'user_id': uid,
-        'weight': weight,
-        'meals': meals,
-        'activity_level': a_level,
-        'goal': goal,
-        'diet_type': diet_type,
-        'tdee': tdee,
-        'target_calories': daily_macros['calories'],
-        'carbs': daily_macros['carbs'],
-        'protein': daily_macros['protein'],
-        'fat': daily_macros['fat'],
-        'updated_at': datetime.utcnow()
-    }
+    try:
+        update_doc, log_entry = profile_update(user, data or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    log_entry['updated_at'] = datetime.utcnow()
+    meal_plan = update_doc['meal_plan']
 
     try:
-        users_collection.update_one({'_id': uid}, {'$set': update_doc})
-        user_updates_collection.insert_one(log_entry)
+        # Returns the updated full profile in the same round trip
+        new_profile = user_store.update(uid, update_doc)
+        record_update(update_buckets_collection, uid, log_entry)
         
         # Return updated full profile + meal plan
-        new_profile = users_collection.find_one({'_id': uid})
         return jsonify({
             'message': 'Profile updated',
             'user': new_profile,
@@ -267,46 +374,203 @@ def update_profile():
 @check_auth
 def get_meal_plan():
     uid = request.user['uid']
-    user = users_collection.find_one({'_id': uid})
+    user = user_store.get(uid)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    # Re-generate meal plan on the fly to ensure it matches current stats
-    # (Or we could store the meal plan in DB, but calculating it is cheap)
-    daily_macros = {
-        'calories': user.get('target_calories', user['tdee']), # Fallback for old users
-        'protein': user['total_protein'],
-        'fat': user['total_fat'],
-        'carbs': user['total_carbs']
-    }
-    
-    meal_plan = generate_meal_plan_logic(daily_macros, user['meals'])
-    return jsonify({'meal_plan': meal_plan})
+    # The plan is stored with the profile and versioned with it, so a
+    # client holding the current ETag gets a 304 without rebuilding it
+    etag = user_etag(user)
+    response = not_modified(etag)
+    if response:
+        return response
 
+    meal_plan = build_meal_plan(user)
+    return with_etag(jsonify({'meal_plan': meal_plan}), etag)
 
-@app.route('/api/workout', methods=['POST'])
-@check_auth
-def add_workout():
-    uid = request.user['uid']
-    data = request.get_json()
-    
-    if not data or 'workoutType' not in data or 'weekStart' not in data:
-        return jsonify({'error': 'Missing required fields'}), 400
 
-    workout_entry = {
+MAX_WORKOUT_BATCH = 1000
+
+def build_workout_entry(uid, data):
+    """
+    Validates one workout payload. Returns (entry, error).
+    """
+    if not isinstance(data, dict) or 'workoutType' not in data or 'weekStart' not in data:
+        return None, 'Missing required fields'
+
+    return {
         'user_id': uid,
         'workout_type': data['workoutType'],
         'week_start': data['weekStart'],
         'week_data': data.get('weekData', {}),
         'created_at': datetime.utcnow()
-    }
+    }, None
+
+@app.route('/api/workout', methods=['POST'])
+@check_auth
+def add_workout():
+    uid = request.user['uid']
+    data = request.get_json()
+    
+    workout_entry, error = build_workout_entry(uid, data)
+    if error:
+        return jsonify({'error': error}), 400
 
     try:
+        if workout_buffer:
+            workout_buffer.add(workout_entry)
+            return jsonify({'message': 'Workout data accepted'}), 202
         weekly_workout_collection.insert_one(workout_entry)
-        return jsonify({'message': 'Workout data added'}), 201
+    except BufferFull:
+        return write_behind_full()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # The workout is stored; a stale summary is rebuilt by rebuild-workout-rollups
+    try:
+        apply_workout_rollups(workout_rollups_collection, [workout_entry])
+    except Exception as e:
+        logger.error(f"Error updating workout rollups: {e}")
+    return jsonify({'message': 'Workout data added'}), 201
+
+def read_batch_body():
+    """
+    Parses a JSON array or an NDJSON body into a list of items.
+    Unparseable NDJSON lines become None so they get a per-item error.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('workouts')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array or NDJSON body')
+    return data
+
+@app.route('/api/workout/batch', methods=['POST'])
+@check_auth
+def add_workout_batch():
+    """
+    Inserts many workouts in one unordered insert_many.
+    Invalid items are reported by index and do not stop the others.
+    """
+    uid = request.user['uid']
+    try:
+        items = read_batch_body()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if len(items) > MAX_WORKOUT_BATCH:
+        return jsonify({'error': f'Batch too large (max {MAX_WORKOUT_BATCH})'}), 413
+
+    entries, positions, errors = [], [], []
+    for i, item in enumerate(items):
+        entry, error = build_workout_entry(uid, item)
+        if error:
+            errors.append({'index': i, 'error': error})
+        else:
+            entries.append(entry)
+            positions.append(i)
+
+    inserted = 0
+    if entries:
+        written = entries
+        try:
+            weekly_workout_collection.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            failed = set()
+            for write_error in e.details.get('writeErrors', []):
+                failed.add(write_error['index'])
+                errors.append({'index': positions[write_error['index']], 'error': write_error.get('errmsg')})
+            written = [entry for i, entry in enumerate(entries) if i not in failed]
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+        inserted = len(written)
+        if written:
+            try:
+                apply_workout_rollups(workout_rollups_collection, written)
+            except Exception as e:
+                logger.error(f"Error updating workout rollups: {e}")
+
+    errors.sort(key=lambda err: err['index'])
+    if not inserted and errors:
+        status = 400
+    else:
+        status = 207 if errors else 201
+    return jsonify({'inserted': inserted, 'errors': errors}), status
+
+@app.route('/api/workout/summary', methods=['GET'])
+@check_auth
+def workout_summary():
+    """
+    Weekly workout totals, newest week first. Reads only the rollups,
+    so cost depends on the number of weeks asked for, not on history length.
+    """
+    uid = request.user['uid']
+    try:
+        weeks = max(1, min(int(request.args.get('weeks', 12)), 104))
+    except ValueError:
+        return jsonify({'error': 'Invalid weeks'}), 400
+
+    rollups = list(workout_rollups_collection.find(
+        {'user_id': uid}, {'_id': 0, 'user_id': 0}
+    ).sort('week_start', -1).limit(weeks))
+    return jsonify({'weeks': rollups})
+
+@app.route('/api/user/trends', methods=['GET'])
+@check_auth
+def user_trends():
+    """
+    Weekly or monthly weight and calorie-target trend, newest first, from
+    the downsampled series (one document per period however many edits).
+    """
+    uid = request.user['uid']
+    period = request.args.get('period', 'week')
+    if period not in PERIODS:
+        return jsonify({'error': 'Invalid period'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 26)), 260))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    series = update_buckets_collection.find(
+        {'user_id': uid, 'period': period}, {'_id': 0, 'user_id': 0}
+    ).sort('start', -1).limit(limit)
+    return jsonify({'period': period, 'points': [series_point(doc) for doc in series]})
+
+@app.route('/api/user/portions', methods=['GET'])
+@check_auth
+def user_portions():
+    """
+    The week's food portions for the user's meal plan, as stored by the
+    compute-portions batch job; solved on the spot if the profile changed
+    since (or the job hasn't run).
+    """
+    uid = request.user['uid']
+    user = user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    stored = portions_collection.find_one({'_id': uid})
+    if stored and stored.get('version') == user.get('version'):
+        return jsonify({'days': stored['days'], 'computed_at': stored['computed_at'], 'source': 'stored'})
+
+    from portions import plan_portions
+    days = plan_portions([user]).get(uid)
+    if days is None:
+        return jsonify({'error': 'Profile has no macro targets yet'}), 400
+    return jsonify({'days': days, 'source': 'computed'})
+
 @app.route('/api/suggestion', methods=['POST'])
 @check_auth
 def add_suggestion():
@@ -315,13 +579,19 @@ def add_suggestion():
     if not suggestion:
         return jsonify({'error': 'Empty suggestion'}), 400
         
+    entry = {
+        'user_id': request.user['uid'],
+        'suggestion': suggestion,
+        'created_at': datetime.utcnow()
+    }
     try:
-        suggestions_collection.insert_one({
-            'user_id': request.user['uid'],
-            'suggestion': suggestion,
-            'created_at': datetime.utcnow()
-        })
+        if suggestion_buffer:
+            suggestion_buffer.add(entry)
+            return jsonify({'message': 'Suggestion accepted'}), 202
+        suggestions_collection.insert_one(entry)
         return jsonify({'message': 'Suggestion submitted'}), 201
+    except BufferFull:
+        return write_behind_full()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -334,8 +604,11 @@ def get_ai_recipes():
     uid = request.user['uid']
     data = request.get_json()
     meal_name = data.get('meal_name', 'Meal')
+
+    # Raises RateLimited, answered with 429 by too_many_requests
+    ai_rate_limiter.check(uid)
     
-    user = users_collection.find_one({'_id': uid})
+    user = user_store.get(uid)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -351,13 +624,56 @@ def get_ai_recipes():
     diet_type = user.get('diet_type', 'Standard')
     excluded = user.get('disliked_ingredients', [])
 
+    # Size the prompt to this meal's share of the day when we know it
+    meal_macros = None
+    if user.get('meals') and user.get('total_protein') is not None:
+        meal_macros = find_meal(build_meal_plan(user), meal_name)
+
+    # Submit/poll mode: queue the generation and return a job id right away
+    if data.get('async') or request.args.get('async'):
+        key = recipe_request_key(daily_macros, meal_name, diet_type, excluded, meal_macros)
+        try:
+            job_id, created = recipe_jobs.submit(
+                key,
+                user_profile=user,
+                daily_macros=daily_macros,
+                meal_name=meal_name,
+                diet_type=diet_type,
+                excluded_ingredients=excluded,
+                meal_macros=meal_macros
+            )
+        except QueueFull:
+            return jsonify({'error': 'Recipe queue is full, try again shortly'}), 503
+        return jsonify({'job_id': job_id, 'deduplicated': not created}), 202
+
+    # Streaming mode: recipe fields as server-sent events while the model writes them
+    if data.get('stream') or request.args.get('stream') or request.accept_mimetypes.best == 'text/event-stream':
+        events = stream_recipe_with_mistral(
+            user_profile=user,
+            daily_macros=daily_macros,
+            meal_name=meal_name,
+            diet_type=diet_type,
+            excluded_ingredients=excluded,
+            meal_macros=meal_macros
+        )
+        if isinstance(events, dict):
+            return jsonify(events), 500 if "not configured" in events["error"] else 400
+        response = Response(stream_with_context(sse_event(event, payload) for event, payload in events),
+                            mimetype='text/event-stream')
+        # Frees the upstream slot and stream even if the body is never read
+        response.call_on_close(events.close)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Proxies pass each event on as it comes
+        return response
+
     # Call AI Helper
     result = generate_recipes_with_mistral(
         user_profile=user,
         daily_macros=daily_macros,
         meal_name=meal_name,
         diet_type=diet_type,
-        excluded_ingredients=excluded
+        excluded_ingredients=excluded,
+        meal_macros=meal_macros
     )
     
     if "error" in result:
@@ -365,58 +681,106 @@ def get_ai_recipes():
     
     return jsonify({'recipe': result})
 
+@app.route('/api/ai/generate-day-recipes', methods=['POST'])
+@check_auth
+def get_ai_day_recipes():
+    """
+    Generates a recipe for every meal of the user's day in one request.
+    The body may carry a `meal_plan` (as returned by /api/user/meal-plan);
+    otherwise the stored targets are used.
+    """
+    uid = request.user['uid']
+    data = request.get_json(silent=True) or {}
+
+    user = user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    if data.get('meal_plan') is not None:
+        try:
+            meal_plan = parse_meal_plan(data['meal_plan'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        meal_plan = build_meal_plan(user)
+    # One token per meal: a day costs what it calls upstream
+    try:
+        ai_rate_limiter.check(uid, cost=len(meal_plan))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = generate_day_recipes(
+        user_profile=user,
+        meal_plan=meal_plan,
+        diet_type=user.get('diet_type', 'Standard'),
+        excluded_ingredients=user.get('disliked_ingredients', [])
+    )
+
+    meals = []
+    for item in results:
+        entry = {'name': item['meal']['name'], 'targets': item['meal']}
+        if "error" in item['recipe']:
+            entry['error'] = item['recipe']['error']
+        else:
+            entry['recipe'] = item['recipe']
+        meals.append(entry)
+
+    if meals and all('error' in m for m in meals):
+        return jsonify({'error': meals[0]['error'], 'meals': meals}), 500
+    return jsonify({'meals': meals})
+
+@app.route('/api/ai/recipe-jobs/<job_id>', methods=['GET'])
+@check_auth
+def get_recipe_job(job_id):
+    job = recipe_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {'job_id': job['_id'], 'status': job['status']}
+    if job['status'] == 'done':
+        response['recipe'] = job['result']
+    elif job['status'] == 'error':
+        response['error'] = job['error']
+    return jsonify(response)
+
 # --- Reports ---
 
 @app.route('/api/report/user-updates', methods=['GET'])
 @check_auth
 def download_user_report():
     uid = request.user['uid']
-    updates = list(user_updates_collection.find({'user_id': uid}).sort('updated_at', -1))
-    
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    
-    elements.append(canvas.Canvas(buffer).drawString(100, 750, "User Updates Report"))
-    elements.append(canvas.Canvas(buffer).drawString(100, 730, f"User ID: {uid}"))
-    
-    # headers = ["Date", "Weight", "Meals", "Activity", "Carbs", "Protein", "Fat"]
-    # Updated headers to include Goal
-    data = [["Date", "Weight", "Goal", "Activity", "Cal", "P", "F", "C"]]
-    
-    for u in updates:
-        # Format date safely
-        date_str = u['updated_at'].strftime('%Y-%m-%d') if isinstance(u['updated_at'], datetime) else str(u['updated_at'])
-        
-        # Handle missing keys for backward compatibility
-        goal_val = u.get('goal', 'N/A')
-        cal_val = u.get('target_calories', u.get('tdee', 0))
-        
-        data.append([
-            date_str,
-            str(u['weight']),
-            goal_val,
-            u['activity_level'],
-            f"{int(cal_val)}",
-            f"{int(u['protein'])}",
-            f"{int(u['fat'])}",
-            f"{int(u['carbs'])}"
-        ])
-    
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTSIZE', (0, 0), (-1, -1), 8), # Smaller font to fit more columns
-    ]))
-    
-    elements.append(table)
+
+    period = request.args.get('period', 'week')
+    if period not in PERIODS:
+        return jsonify({'error': 'Invalid period'}), 400
+
     try:
-        doc.build(elements)
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='user_updates_report.pdf', mimetype='application/pdf')
+        # Rows are weeks or months of the downsampled series, not individual
+        # edits. The newest one's last update identifies the report version.
+        latest = update_buckets_collection.find_one(
+            {'user_id': uid, 'period': period}, {'_id': 0, 'last_at': 1}, sort=[('start', -1)]
+        )
+        version = report_version({'updated_at': latest['last_at']} if latest else None)
+        key = f"{period}-{version}"
+
+        # Opened once: a concurrent render of a newer version may remove the
+        # path, but not the file behind an open descriptor
+        report = report_cache.open(uid, key)
+        for _ in range(2):
+            if report is not None:
+                break
+            series = update_buckets_collection.find(
+                {'user_id': uid, 'period': period}, SERIES_REPORT_PROJECTION
+            ).sort('start', -1).batch_size(REPORT_FETCH_ROWS)
+            report_cache.render(uid, key, series_report_rows(series), period)
+            report = report_cache.open(uid, key)  # None if removed again before we opened it
+        if report is None:
+            raise FileNotFoundError(f"Report {key} was replaced while rendering")
+
+        response = Response(stream_file(report), mimetype='application/pdf')
+        response.headers['Content-Disposition'] = 'attachment; filename=user_updates_report.pdf'
+        response.headers['Content-Length'] = str(os.fstat(report.fileno()).st_size)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -426,7 +790,7 @@ def check_admin(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         uid = request.user['uid']
-        user = users_collection.find_one({'_id': uid})
+        user = user_store.get(uid)
         if not user or not user.get('is_admin'):
             return jsonify({'error': 'Forbidden: Admin access required'}), 403
         return f(*args, **kwargs)
@@ -434,18 +798,29 @@ def check_admin(f):
 
 # --- Admin Routes ---
 
+def list_collection(collection, projection, key):
+    """
+    Keyset-paginated listing: `?limit=&cursor=` returns one page plus a
+    `next` token; `?format=ndjson` (or Accept: application/x-ndjson)
+    streams every document as the cursor yields it.
+    """
+    token = request.args.get('cursor')
+    try:
+        if wants_ndjson(request):
+            docs = iter_all(collection, projection, token)
+            return Response(stream_with_context(ndjson_chunks(docs)), mimetype='application/x-ndjson')
+
+        docs, next_token = fetch_page(collection, projection, page_size(request.args.get('limit')), token)
+        return jsonify({key: docs, 'next': next_token})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/admin/users', methods=['GET'])
 @check_auth
 @check_admin
 def list_users():
     try:
-        users = list(users_collection.find({}, {'_id': 1, 'name': 1, 'email': 1, 'goal': 1, 'created_at': 1}))
-        # Convert ObjectId and datetime for JSON serialization
-        for user in users:
-            user['_id'] = str(user['_id'])
-            if 'created_at' in user and isinstance(user['created_at'], datetime):
-                user['created_at'] = user['created_at'].isoformat()
-        return jsonify({'users': users})
+        return list_collection(users_collection, {'_id': 1, 'name': 1, 'email': 1, 'goal': 1, 'created_at': 1}, 'users')
     except Exception as e:
         logger.error(f"Error listing users: {e}")
         return jsonify({'error': str(e)}), 500
@@ -455,17 +830,254 @@ def list_users():
 @check_admin
 def list_suggestions():
     try:
-        suggestions = list(suggestions_collection.find({}).sort('created_at', -1))
-        for s in suggestions:
-            s['_id'] = str(s['_id'])
-            if 'created_at' in s and isinstance(s['created_at'], datetime):
-                s['created_at'] = s['created_at'].isoformat()
-        return jsonify({'suggestions': suggestions})
+        return list_collection(suggestions_collection, None, 'suggestions')
     except Exception as e:
         logger.error(f"Error listing suggestions: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/counts', methods=['GET'])
+@check_auth
+@check_admin
+def admin_counts():
+    # Totals for the paged listings, from collection metadata rather than a scan
+    try:
+        return jsonify({
+            'users': users_collection.estimated_document_count(),
+            'suggestions': suggestions_collection.estimated_document_count()
+        })
+    except Exception as e:
+        logger.error(f"Error counting admin listings: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+@check_auth
+@check_admin
+def cache_stats():
+    return jsonify({
+        'token_cache': token_cache_stats(),
+        'recipe_cache': recipe_cache.stats(),
+        'recipe_corpus': recipe_corpus.stats() if recipe_corpus is not None else None
+    })
+
+# --- Admin Jobs ---
+
+RECOMPUTE_CHUNK_SIZE = 5000
+MAX_RECOMPUTE_CHUNK = 50000
+
+recompute_job = {'status': 'idle'}
+recompute_lock = threading.Lock()
+
+def run_recompute_job(chunk_size):
+    def progress(stats):
+        recompute_job.update(stats)
+
+    # numpy is only needed here; keep it out of startup
+    from batch_macros import recompute_user_targets
+
+    try:
+        stats = recompute_user_targets(users_collection, chunk_size=chunk_size, progress=progress)
+        user_store.clear()
+        recompute_job.update(stats, status='done', finished_at=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Error recomputing targets: {e}")
+        recompute_job.update(status='error', error=str(e), finished_at=datetime.utcnow())
+
+@app.route('/api/admin/recompute-targets', methods=['GET', 'POST'])
+@check_auth
+@check_admin
+def recompute_targets():
+    """
+    Recomputes every user's stored targets after the constants change.
+    POST starts the job in the background, GET reports its progress.
+    """
+    if request.method == 'GET':
+        return jsonify(recompute_job)
+
+    data = request.get_json(silent=True) or {}
+    try:
+        # Users per numpy batch; large enough to vectorize, small enough to hold in memory
+        chunk_size = max(1, min(int(data.get('chunk_size', RECOMPUTE_CHUNK_SIZE)), MAX_RECOMPUTE_CHUNK))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid chunk_size'}), 400
+
+    with recompute_lock:
+        if recompute_job['status'] == 'running':
+            return jsonify({'error': 'Recompute already running', 'job': recompute_job}), 409
+        recompute_job.clear()
+        recompute_job.update(status='running', processed=0, skipped=0, modified=0, started_at=datetime.utcnow())
+
+    threading.Thread(target=run_recompute_job, args=(chunk_size,), daemon=True).start()
+    return jsonify({'message': 'Recompute started', 'job': recompute_job}), 202
+
+def run_export_job(path, period):
+    # Pulls in the process pool machinery; only admins exporting need it
+    from report_export import run_export, update_export
+
+    try:
+        stats = run_export(users_collection, update_buckets_collection, path, period,
+                           progress=lambda stats: update_export(admin_jobs_collection, path, **stats))
+        update_export(admin_jobs_collection, path, **stats, status='done', finished_at=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Error exporting reports: {e}")
+        update_export(admin_jobs_collection, path, status='error', error=str(e), finished_at=datetime.utcnow())
+
+@app.route('/api/admin/report-export', methods=['GET', 'POST'])
+@check_auth
+@check_admin
+def report_export():
+    """
+    Every user's update report as one zip, rendered across a process pool.
+    POST starts the export in the background, GET reports its progress;
+    the archive is served by /api/admin/report-export/download when done.
+    The job is a Mongo document and the zip sits in the shared EXPORT_DIR,
+    so any worker can answer; only the one that started it renders.
+    """
+    from report_export import claim_export, export_status
+    if request.method == 'GET':
+        job = export_status(admin_jobs_collection)
+        return jsonify({k: v for k, v in job.items() if k not in ('_id', 'path')})
+
+    data = request.get_json(silent=True) or {}
+    period = data.get('period', 'week')
+    if period not in PERIODS:
+        return jsonify({'error': 'Invalid period'}), 400
+
+    job = claim_export(admin_jobs_collection, period)
+    if job is None:
+        return jsonify({'error': 'Export already running'}), 409
+
+    threading.Thread(target=run_export_job, args=(job['path'], period), daemon=True).start()
+    return jsonify({'message': 'Export started', 'status': 'running'}), 202
+
+@app.route('/api/admin/report-export/download', methods=['GET'])
+@check_auth
+@check_admin
+def download_report_export():
+    from report_export import export_status
+    job = export_status(admin_jobs_collection)
+    path = job.get('path') if job['status'] == 'done' else None
+    try:
+        # A new export removes this zip; the open descriptor keeps it readable
+        archive = open(path, 'rb') if path else None
+    except FileNotFoundError:
+        archive = None
+    if archive is None:
+        return jsonify({'error': 'No finished export'}), 404
+
+    response = Response(stream_file(archive), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename={os.path.basename(path)}'
+    response.headers['Content-Length'] = str(os.fstat(archive.fileno()).st_size)
+    return response
+
+analytics = None  # analytics_snapshot.AnalyticsSnapshot, opened on first use
+analytics_refresh = {'status': 'idle'}
+analytics_lock = threading.Lock()
+
+def run_analytics_refresh(full):
+    from analytics_snapshot import refresh_snapshot
+    try:
+        meta = refresh_snapshot(users_collection, update_buckets_collection, full=full)
+        analytics_refresh.update(status='done', delta=meta['delta'], rows=meta['rows'], finished_at=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Error refreshing analytics snapshot: {e}")
+        analytics_refresh.update(status='error', error=str(e), finished_at=datetime.utcnow())
+
+@app.route('/api/admin/analytics', methods=['GET', 'POST'])
+@check_auth
+@check_admin
+def admin_analytics():
+    """
+    Population aggregates computed from the memory-mapped columnar snapshot,
+    not from Mongo. POST refreshes the snapshot in the background (only
+    documents past its watermarks are read; `full` rebuilds it).
+    """
+    global analytics
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        with analytics_lock:
+            if analytics_refresh['status'] == 'running':
+                return jsonify({'error': 'Refresh already running'}), 409
+            analytics_refresh.clear()
+            analytics_refresh.update(status='running', started_at=datetime.utcnow())
+        threading.Thread(target=run_analytics_refresh, args=(bool(data.get('full')),), daemon=True).start()
+        return jsonify({'message': 'Refresh started', 'refresh': analytics_refresh}), 202
+
+    try:
+        weeks = max(1, min(int(request.args.get('weeks', 12)), 104))
+    except ValueError:
+        return jsonify({'error': 'Invalid weeks'}), 400
+
+    if analytics is None:
+        from analytics_snapshot import AnalyticsSnapshot
+        analytics = AnalyticsSnapshot()
+    summary = analytics.summary(weeks)
+    if summary is None:
+        return jsonify({'error': 'No analytics snapshot yet; POST to build one', 'refresh': analytics_refresh}), 404
+    return jsonify({**summary, 'refresh': analytics_refresh})
+
+# --- CLI ---
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create the indexes declared in indexes.py."""
+    init_clients()
+    for name, created in ensure_indexes(db).items():
+        print(f"{name}: {', '.join(created)}")
+
+@app.cli.command('check-queries')
+def check_queries_command():
+    """Explain the app's query shapes and fail on COLLSCAN or in-memory SORT."""
+    init_clients()
+    problems = check_query_plans(db)
+    for p in problems:
+        print(f"{p['collection']} {p['filter']} sort={p['sort']}: {', '.join(p['stages'])}")
+    if problems:
+        raise SystemExit(1)
+    print("All query shapes use indexes.")
+
+@app.cli.command('rebuild-workout-rollups')
+@click.option('--user', 'user_id', default=None, help='Only rebuild this user id.')
+def rebuild_workout_rollups_command(user_id):
+    """Rebuild weekly workout rollups from raw workouts."""
+    init_clients()
+    count = rebuild_workout_rollups(weekly_workout_collection, workout_rollups_collection, user_id)
+    print(f"Rebuilt {count} weekly rollups.")
+
+@app.cli.command('migrate-user-updates')
+@click.option('--user', 'user_id', default=None, help='Only migrate this user id.')
+@click.option('--drop-source', is_flag=True, help='Drop the old user_updates collection afterwards.')
+def migrate_user_updates_command(user_id, drop_source):
+    """Move the user_updates log into month buckets and rebuild the series."""
+    init_clients()
+    copied = migrate_user_updates(user_updates_collection, update_buckets_collection, user_id)
+    written = rebuild_update_series(update_buckets_collection, user_id)
+    print(f"Migrated {copied} updates; wrote {written} weekly/monthly series documents.")
+    if drop_source and not user_id:
+        user_updates_collection.drop()
+        print("Dropped user_updates.")
+
+@app.cli.command('compute-portions')
+@click.option('--chunk-size', default=2000, show_default=True, help='Users per solve.')
+def compute_portions_command(chunk_size):
+    """Plan every user's weekly food portions from the local food table (e.g. from cron)."""
+    init_clients()
+    from portions import compute_weekly_portions
+    stats = compute_weekly_portions(users_collection, portions_collection, chunk_size=chunk_size)
+    print(f"Planned {stats['processed']} users; skipped {stats['skipped']} without targets.")
+
+@app.cli.command('refresh-analytics')
+@click.option('--full', is_flag=True, help='Rebuild instead of reading past the watermarks.')
+def refresh_analytics_command(full):
+    """Refresh the columnar analytics snapshot (e.g. from cron)."""
+    init_clients()
+    from analytics_snapshot import refresh_snapshot
+    meta = refresh_snapshot(users_collection, update_buckets_collection, full=full)
+    print(f"Snapshot v{meta['version']}: {meta['rows']} rows, {meta['delta']} new or changed.")
+
 
 if __name__ == '__main__':
+    create_app()
+    if strict_query_checks():
+        assert_query_plans(db)
     app.run(debug=True, port=5001)
 
@@ -0,0 +1,321 @@
+import math
+import time
+import asyncio
+import logging
+from datetime import datetime
+from functools import wraps
+from quart import Quart, Response, request, jsonify, g
+from quart_cors import cors
+from pymongo import AsyncMongoClient
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+# The sync app keeps serving every route not ported here, and its helpers
+# are shared so both modes compute the same results.
+import app as sync_app
+from app import (
+    MONGO_URI, DB_NAME, mongo_client_options, build_meal_plan, find_meal, parse_meal_plan, profile_update, user_etag
+)
+from firebase_config import verify_token, cached_token
+from recipes import generate_recipes_with_mistral_async, generate_day_recipes_async, stream_recipe_with_mistral_async, recipe_request_key
+from recipe_jobs import QueueFull
+from rate_limit import AdmissionRejected, RateLimited, MongoSlots
+from user_store import AsyncUserStore
+from update_history import record_update_async
+from metrics import ADMISSION_REJECTED, observe_request
+from json_codec import OrjsonProvider, sse_event
+
+logger = logging.getLogger(__name__)
+
+# Async serving mode. Profile and recipe routes run on the event loop with
+# AsyncMongoClient and the async Mistral client, so one process can hold
+# many slow upstream calls at once. All other paths are passed to the
+# sync Flask app on a thread. Serve with an ASGI server, e.g.:
+#   hypercorn async_app:asgi_app
+app = cors(Quart(__name__))
+app.json = OrjsonProvider(app)
+
+client = None
+db = None
+user_store = None
+update_buckets_collection = None
+
+
+@app.before_serving
+async def connect_mongo():
+    # Created inside the serving loop; async clients are bound to it
+    global client, db, user_store, update_buckets_collection
+    sync_app.create_app()  # Firebase, plus the sync clients behind the fallback routes
+    client = AsyncMongoClient(MONGO_URI, **mongo_client_options())
+    db = client[DB_NAME]
+    user_store = AsyncUserStore(db['users'])
+    update_buckets_collection = db['user_update_buckets']
+    if isinstance(getattr(sync_app.llm_limiter, 'slots', None), MongoSlots):
+        # Slot polling on this loop instead of on executor threads
+        sync_app.llm_limiter.slots.bind_async(db['llm_slots'])
+
+
+@app.after_serving
+async def close_mongo():
+    await client.close()
+
+@app.before_request
+async def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request(response):
+    # Same histogram as the sync app; unported routes are timed there
+    started = g.pop('request_started', None)
+    if started is not None:
+        observe_request(request, started, response.status_code)
+    return response
+
+# --- Helper Functions ---
+
+def not_modified(etag):
+    if request.if_none_match.contains_weak(etag):
+        response = Response('', status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.errorhandler(AdmissionRejected)
+async def too_many_requests(e):
+    # Same 429 as app.too_many_requests
+    ADMISSION_REJECTED.inc('rate_limited' if isinstance(e, RateLimited) else 'overloaded')
+    retry_after = max(1, math.ceil(e.retry_after))
+    response = jsonify({'error': str(e), 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+# --- Auth Middleware ---
+
+def check_auth(f):
+    # Same contract as app.check_auth. A cached token is a dict lookup and
+    # runs inline; a miss fetches keys and checks the RSA signature (or
+    # calls the SDK), so it runs on a thread instead of blocking the loop.
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'Unauthorized: Missing or invalid token'}), 401
+
+        token = auth_header.split(' ')[1]
+        decoded_token = cached_token(token)
+        if decoded_token is None:
+            decoded_token = await asyncio.to_thread(verify_token, token)
+
+        if not decoded_token:
+            return jsonify({'error': 'Unauthorized: Invalid token'}), 401
+
+        request.user = decoded_token # Attach user info to request
+        return await f(*args, **kwargs)
+    return decorated_function
+
+# --- Routes ---
+
+@app.route('/api/user/profile', methods=['GET'])
+@check_auth
+async def get_profile():
+    uid = request.user['uid']
+    user = await user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    etag = user_etag(user)
+    return not_modified(etag) or with_etag(jsonify(user), etag)
+
+@app.route('/api/user/meal-plan', methods=['GET'])
+@check_auth
+async def get_meal_plan():
+    uid = request.user['uid']
+    user = await user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    etag = user_etag(user)
+    response = not_modified(etag)
+    if response:
+        return response
+
+    return with_etag(jsonify({'meal_plan': build_meal_plan(user)}), etag)
+
+@app.route('/api/user/update', methods=['POST'])
+@check_auth
+async def update_profile():
+    uid = request.user['uid']
+    data = await request.get_json()
+
+    user = await user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    try:
+        update_doc, log_entry = profile_update(user, data or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    log_entry['updated_at'] = datetime.utcnow()
+
+    try:
+        new_profile = await user_store.update(uid, update_doc)
+        await record_update_async(update_buckets_collection, uid, log_entry)
+        return jsonify({
+            'message': 'Profile updated',
+            'user': new_profile,
+            'meal_plan': update_doc['meal_plan']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ai/generate-recipes', methods=['POST'])
+@check_auth
+async def get_ai_recipes():
+    uid = request.user['uid']
+    data = await request.get_json()
+    meal_name = data.get('meal_name', 'Meal')
+
+    # Limiters are shared with the sync app; the Mongo backend blocks
+    await asyncio.to_thread(sync_app.ai_rate_limiter.check, uid)
+
+    user = await user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    daily_macros = {
+        'protein': user.get('total_protein'),
+        'fat': user.get('total_fat'),
+        'carbs': user.get('total_carbs')
+    }
+    diet_type = user.get('diet_type', 'Standard')
+    excluded = user.get('disliked_ingredients', [])
+
+    meal_macros = None
+    if user.get('meals') and user.get('total_protein') is not None:
+        meal_macros = find_meal(build_meal_plan(user), meal_name)
+
+    # Submit/poll mode goes through the shared (threaded) job queue
+    if data.get('async') or request.args.get('async'):
+        key = recipe_request_key(daily_macros, meal_name, diet_type, excluded, meal_macros)
+        try:
+            job_id, created = await asyncio.to_thread(
+                sync_app.recipe_jobs.submit,
+                key,
+                user_profile=user,
+                daily_macros=daily_macros,
+                meal_name=meal_name,
+                diet_type=diet_type,
+                excluded_ingredients=excluded,
+                meal_macros=meal_macros
+            )
+        except QueueFull:
+            return jsonify({'error': 'Recipe queue is full, try again shortly'}), 503
+        return jsonify({'job_id': job_id, 'deduplicated': not created}), 202
+
+    if data.get('stream') or request.args.get('stream') or request.accept_mimetypes.best == 'text/event-stream':
+        events = await stream_recipe_with_mistral_async(
+            user_profile=user,
+            daily_macros=daily_macros,
+            meal_name=meal_name,
+            diet_type=diet_type,
+            excluded_ingredients=excluded,
+            meal_macros=meal_macros
+        )
+        if isinstance(events, dict):
+            return jsonify(events), 500 if "not configured" in events["error"] else 400
+
+        async def body():
+            try:
+                async for event, payload in events:
+                    yield sse_event(event, payload)
+            finally:
+                await events.aclose()  # Client gone mid-stream: free the upstream slot now
+
+        response = Response(body(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.timeout = None  # Generation may outlast Quart's response timeout
+        return response
+
+    result = await generate_recipes_with_mistral_async(
+        user_profile=user,
+        daily_macros=daily_macros,
+        meal_name=meal_name,
+        diet_type=diet_type,
+        excluded_ingredients=excluded,
+        meal_macros=meal_macros
+    )
+
+    if "error" in result:
+        return jsonify(result), 500 if "not configured" in result["error"] else 400
+
+    return jsonify({'recipe': result})
+
+@app.route('/api/ai/generate-day-recipes', methods=['POST'])
+@check_auth
+async def get_ai_day_recipes():
+    uid = request.user['uid']
+    data = await request.get_json(silent=True) or {}
+
+    user = await user_store.get(uid)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    if data.get('meal_plan') is not None:
+        try:
+            meal_plan = parse_meal_plan(data['meal_plan'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        meal_plan = build_meal_plan(user)
+    try:
+        await asyncio.to_thread(sync_app.ai_rate_limiter.check, uid, len(meal_plan))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = await generate_day_recipes_async(
+        user_profile=user,
+        meal_plan=meal_plan,
+        diet_type=user.get('diet_type', 'Standard'),
+        excluded_ingredients=user.get('disliked_ingredients', [])
+    )
+
+    meals = []
+    for item in results:
+        entry = {'name': item['meal']['name'], 'targets': item['meal']}
+        if "error" in item['recipe']:
+            entry['error'] = item['recipe']['error']
+        else:
+            entry['recipe'] = item['recipe']
+        meals.append(entry)
+
+    if meals and all('error' in m for m in meals):
+        return jsonify({'error': meals[0]['error'], 'meals': meals}), 500
+    return jsonify({'meals': meals})
+
+# --- ASGI entry point ---
+
+sync_fallback = AsyncioWSGIMiddleware(sync_app.app)
+
+def is_async_route(scope):
+    adapter = app.url_map.bind('', url_scheme=scope.get('scheme', 'http'))
+    try:
+        adapter.match(scope['path'], method=scope['method'])
+    except (NotFound, MethodNotAllowed):
+        return False
+    return True
+
+async def asgi_app(scope, receive, send):
+    """
+    Routes ported to async (and their CORS preflights) are served here;
+    every other request goes to the sync app.
+    """
+    if scope['type'] == 'http' and not is_async_route(scope):
+        return await sync_fallback(scope, receive, send)
+    return await app(scope, receive, send)
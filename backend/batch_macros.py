@@ -0,0 +1,195 @@
+import numpy as np
+from datetime import datetime
+from pymongo import UpdateOne
+
+from constants import ACTIVITY_MULTIPLIERS, GOAL_MODIFIERS, MACRO_RATIOS, MEAL_DISTRIBUTION, MEAL_NAMES
+
+# Fields needed from a user document to recompute its targets
+PROFILE_PROJECTION = {'sex': 1, 'weight': 1, 'height': 1, 'age': 1, 'a_level': 1, 'goal': 1, 'meals': 1}
+
+
+def _lookup(keys, table, default):
+    """
+    Maps an array of string keys to floats from a dict, one lookup per distinct key.
+    """
+    keys = np.char.lower(np.asarray(keys, dtype=str))
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    values = np.array([table.get(k, default) for k in uniques], dtype=float)
+    return values[inverse.reshape(keys.shape)]
+
+
+def get_bmr_batch(sex, weight, height, age):
+    """
+    Vectorized Harris-Benedict BMR, same formula as app.get_bmr.
+    """
+    weight = np.asarray(weight, dtype=float)
+    height = np.asarray(height, dtype=float)
+    age = np.asarray(age, dtype=float)
+    is_male = np.char.lower(np.asarray(sex, dtype=str)) == 'male'
+
+    male = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+    female = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+    return np.where(is_male, male, female)
+
+
+def get_tdee_batch(bmr, a_level):
+    return np.asarray(bmr, dtype=float) * _lookup(a_level, ACTIVITY_MULTIPLIERS, 1.2)
+
+
+def calculate_macros_batch(tdee, goal):
+    """
+    Vectorized calculate_macros. Returns a dict of arrays keyed like the scalar version.
+    """
+    goal = np.asarray(goal, dtype=str)
+    calories = np.asarray(tdee, dtype=float) * _lookup(goal, GOAL_MODIFIERS, 1.0)
+
+    default = MACRO_RATIOS['maintenance']
+    p_ratio = _lookup(goal, {k: v[0] for k, v in MACRO_RATIOS.items()}, default[0])
+    f_ratio = _lookup(goal, {k: v[1] for k, v in MACRO_RATIOS.items()}, default[1])
+    c_ratio = _lookup(goal, {k: v[2] for k, v in MACRO_RATIOS.items()}, default[2])
+
+    # np.round rounds half to even on the binary value; it can differ from the
+    # builtin round() by 0.1 on exact ties, which is fine for stored targets.
+    return {
+        'calories': calories,
+        'protein': np.round((calories * p_ratio) / 4, 1),
+        'fat': np.round((calories * f_ratio) / 9, 1),
+        'carbs': np.round((calories * c_ratio) / 4, 1)
+    }
+
+
+def meal_weights_batch(num_meals):
+    """
+    Returns an (n, max_meals) matrix of meal weights, NaN-padded past each row's meal count.
+    """
+    num_meals = np.asarray(num_meals, dtype=int)
+    width = int(num_meals.max()) if num_meals.size else 0
+    weights = np.full((num_meals.size, width), np.nan)
+    for count in np.unique(num_meals):
+        count = int(count)
+        if count <= 0:
+            continue
+        row = MEAL_DISTRIBUTION.get(count, [1 / count] * count)
+        weights[num_meals == count, :count] = row
+    return weights
+
+
+def generate_meal_plan_batch(daily_macros, num_meals):
+    """
+    Vectorized generate_meal_plan_logic. Returns (n, max_meals) arrays per macro.
+    """
+    weights = meal_weights_batch(num_meals)
+    return {
+        key: np.round(np.asarray(daily_macros[key], dtype=float)[:, None] * weights, 1)
+        for key in ('calories', 'protein', 'fat', 'carbs')
+    }
+
+
+def compute_targets_batch(sex, weight, height, age, a_level, goal, num_meals):
+    """
+    Runs the whole BMR -> TDEE -> macros -> meal split pipeline over column arrays.
+    """
+    bmr = get_bmr_batch(sex, weight, height, age)
+    tdee = get_tdee_batch(bmr, a_level)
+    daily = calculate_macros_batch(tdee, goal)
+    return {
+        'bmr': bmr,
+        'tdee': tdee,
+        'daily': daily,
+        'meals': generate_meal_plan_batch(daily, num_meals)
+    }
+
+
+def meal_plan_rows(result, num_meals):
+    """
+    Converts the per-meal arrays back into generate_meal_plan_logic's list-of-dicts shape, one list per user.
+    """
+    meals = {key: result['meals'][key].tolist() for key in ('calories', 'protein', 'fat', 'carbs')}
+    plans = []
+    for i, count in enumerate(num_meals):
+        names = MEAL_NAMES.get(count, [f'Meal {j+1}' for j in range(count)])
+        plans.append([
+            {
+                'name': names[j],
+                'calories': meals['calories'][i][j],
+                'protein': meals['protein'][i][j],
+                'fat': meals['fat'][i][j],
+                'carbs': meals['carbs'][i][j]
+            }
+            for j in range(count)
+        ])
+    return plans
+
+
+def _target_updates(ids, result, num_meals):
+    daily = result['daily']
+    now = datetime.utcnow()
+    columns = zip(
+        ids,
+        result['bmr'].tolist(),
+        result['tdee'].tolist(),
+        daily['calories'].tolist(),
+        daily['carbs'].tolist(),
+        daily['protein'].tolist(),
+        daily['fat'].tolist(),
+        meal_plan_rows(result, num_meals)
+    )
+    return [
+        UpdateOne({'_id': _id}, {
+            '$set': {
+                'bmr': bmr,
+                'tdee': tdee,
+                'target_calories': calories,
+                'total_carbs': carbs,
+                'total_protein': protein,
+                'total_fat': fat,
+                'meal_plan': meal_plan,
+                'updated_at': now
+            },
+            # Invalidates ETags handed out for the old targets
+            '$inc': {'version': 1}
+        })
+        for _id, bmr, tdee, calories, carbs, protein, fat, meal_plan in columns
+    ]
+
+
+def recompute_user_targets(users_collection, chunk_size=5000, progress=None):
+    """
+    Streams every user in chunks, recomputes their targets with the current
+    constants and writes them back with one unordered bulk_write per chunk.
+    """
+    stats = {'processed': 0, 'skipped': 0, 'modified': 0}
+    cursor = users_collection.find({}, PROFILE_PROJECTION).batch_size(chunk_size)
+
+    def flush(chunk):
+        if not chunk:
+            return
+        ids, sex, weight, height, age, a_level, goal, meals = zip(*chunk)
+        result = compute_targets_batch(sex, weight, height, age, a_level, goal, meals)
+        write = users_collection.bulk_write(_target_updates(ids, result, meals), ordered=False)
+        stats['processed'] += len(chunk)
+        stats['modified'] += write.modified_count
+        if progress:
+            progress(stats)
+
+    chunk = []
+    for user in cursor:
+        try:
+            chunk.append((
+                user['_id'],
+                user.get('sex') or 'male',
+                float(user['weight']),
+                float(user['height']),
+                float(user['age']),
+                user.get('a_level') or 'sedentary',
+                user.get('goal') or 'maintenance',
+                int(user.get('meals') or 3)
+            ))
+        except (KeyError, TypeError, ValueError):
+            stats['skipped'] += 1
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    return stats
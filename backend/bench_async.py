@@ -0,0 +1,225 @@
+"""
+Load benchmark: sync (Flask, fixed thread pool) vs async (Quart) serving.
+
+Both servers run in child processes against the same MongoDB and a local
+stand-in for the Mistral API that answers after --upstream-delay seconds,
+so the numbers measure how many slow upstream calls one process can hold.
+Auth is bypassed in the children.
+
+    python bench_async.py --requests 400 --concurrency 200 --threads 16
+
+Requires a reachable MongoDB (MONGO_URI); uses the meal_plan_db database
+with a throwaway bench user.
+"""
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+import statistics
+import multiprocessing
+
+import httpx
+from pymongo import MongoClient
+from pymongo.errors import ServerSelectionTimeoutError
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+BENCH_UID = 'bench-async-user'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def serve_fake_mistral(port, delay):
+    from quart import Quart
+    from hypercorn.config import Config
+    from hypercorn.asyncio import serve
+
+    upstream = Quart('fake_mistral')
+    recipe = {'name': 'Bench Bowl', 'description': '', 'ingredients': [], 'instructions': [],
+              'macros': {'protein': 30, 'fat': 10, 'carbs': 40, 'calories': 370}, 'prep_time': '10 mins'}
+
+    @upstream.route('/v1/chat/completions', methods=['POST'])
+    async def complete():
+        await asyncio.sleep(delay)
+        return {
+            'id': 'bench', 'object': 'chat.completion', 'model': 'mistral-small-latest', 'created': 0,
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': json.dumps(recipe)}}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }
+
+    config = Config()
+    config.bind = [f'127.0.0.1:{port}']
+    config.backlog = 2048
+    asyncio.run(serve(upstream, config))
+
+
+def bench_environment(upstream_port):
+    # Must run before the app modules are imported
+    os.environ['MISTRAL_API_KEY'] = 'bench'
+    os.environ['MISTRAL_SERVER_URL'] = f'http://127.0.0.1:{upstream_port}'
+
+
+def bypass_auth(*modules):
+    for module in modules:
+        module.verify_token = lambda token: {'uid': BENCH_UID, 'email': 'bench@example.com'}
+        if hasattr(module, 'cached_token'):
+            # The async app checks the token cache inline first, as for a repeat caller
+            module.cached_token = module.verify_token
+
+
+def serve_sync(port, upstream_port, threads):
+    bench_environment(upstream_port)
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import ThreadedWSGIServer
+    import app as sync_app
+    bypass_auth(sync_app)
+
+    class PooledWSGIServer(ThreadedWSGIServer):
+        # A fixed pool, like a threaded WSGI worker, instead of a thread per request
+        request_queue_size = 2048
+        pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    PooledWSGIServer('127.0.0.1', port, sync_app.app).serve_forever()
+
+
+def serve_async(port, upstream_port):
+    bench_environment(upstream_port)
+    from hypercorn.config import Config
+    from hypercorn.asyncio import serve
+    import async_app
+    bypass_auth(async_app)
+
+    config = Config()
+    config.bind = [f'127.0.0.1:{port}']
+    config.backlog = 2048
+    asyncio.run(serve(async_app.asgi_app, config))
+
+
+async def run_load(port, total, concurrency, recipe_share):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {'Authorization': 'Bearer bench'}
+    latencies = {'profile': [], 'recipe': []}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=120) as http:
+        async def one(i):
+            nonlocal errors
+            # Unique meal names keep the recipe cache from answering
+            kind = 'recipe' if (i % 100) < recipe_share * 100 else 'profile'
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if kind == 'recipe':
+                        response = await http.post('/api/ai/generate-recipes', headers=headers,
+                                                   json={'meal_name': f'Bench {time.time_ns()}-{i}'})
+                    else:
+                        response = await http.get('/api/user/profile', headers=headers)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies[kind].append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    def pct(values, q):
+        return round(statistics.quantiles(values, n=100)[q - 1] * 1000, 1) if len(values) > 1 else None
+
+    return {
+        'requests': total,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'rps': round(total / elapsed, 1),
+        **{f'{kind}_p{q}_ms': pct(values, q) for kind, values in latencies.items() for q in (50, 95)}
+    }
+
+
+def seed_user():
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except ServerSelectionTimeoutError:
+        return False
+    client['meal_plan_db']['users'].replace_one({'_id': BENCH_UID}, {
+        '_id': BENCH_UID, 'email': 'bench@example.com', 'name': 'Bench', 'age': 30, 'height': 180,
+        'weight': 80, 'meals': 3, 'sex': 'male', 'a_level': 'sedentary', 'goal': 'maintenance',
+        'diet_type': 'Standard', 'disliked_ingredients': [], 'bmr': 1800, 'tdee': 2160,
+        'target_calories': 2160, 'total_protein': 162, 'total_fat': 60, 'total_carbs': 243, 'version': 1
+    }, upsert=True)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16, help='Sync server worker threads')
+    parser.add_argument('--upstream-delay', type=float, default=0.5, help='Seconds per fake Mistral call')
+    parser.add_argument('--recipe-share', type=float, default=0.5, help='Fraction of requests that generate recipes')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    if not seed_user():
+        print(f"WARNING: No MongoDB at {MONGO_URI}, skipping.")
+        return 1
+
+    upstream_port = free_port()
+    children = [multiprocessing.Process(target=serve_fake_mistral, args=(upstream_port, args.upstream_delay), daemon=True)]
+    children[0].start()
+    wait_for_port(upstream_port)
+
+    results = {}
+    try:
+        for mode in ('sync', 'async'):
+            port = free_port()
+            if mode == 'sync':
+                server = multiprocessing.Process(target=serve_sync, args=(port, upstream_port, args.threads), daemon=True)
+            else:
+                server = multiprocessing.Process(target=serve_async, args=(port, upstream_port), daemon=True)
+            server.start()
+            children.append(server)
+            wait_for_port(port)
+
+            asyncio.run(run_load(port, min(20, args.requests), args.concurrency, args.recipe_share))  # Warm-up
+            results[mode] = asyncio.run(run_load(port, args.requests, args.concurrency, args.recipe_share))
+            print(f"{mode:>5}: {results[mode]}")
+
+            server.terminate()
+            server.join()
+    finally:
+        for child in children:
+            child.terminate()
+
+    results['config'] = vars(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Offline benchmark suite for the API's hot paths.
+
+Runs in-process against local stand-ins: an in-memory Mongo (mongomock) or
+a local MongoDB, a fake verify_token, and a fake Mistral client with a
+fixed latency. Reports throughput and p50/p99 latency per scenario and
+saves them as JSON; pass --baseline to compare with an earlier run.
+
+    python bench_suite.py                              # in-memory Mongo
+    python bench_suite.py --mongo-uri mongodb://localhost:27017/
+    python bench_suite.py --output new.json --baseline old.json
+
+Exits with status 1 if any scenario's p50 regressed by more than --tolerance.
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import app as app_module
+import recipes
+import reports
+from batch_macros import compute_targets_batch
+from indexes import ensure_indexes
+from update_history import migrate_user_updates, rebuild_update_series
+
+BENCH_DB_NAME = 'meal_plan_db_bench'
+REPORT_ROWS = (10, 1000, 10000)
+BATCH_MACRO_ROWS = 100000
+
+
+def signup_payload(i):
+    return {
+        'name': f'Bench {i}', 'age': 20 + i % 40, 'height': 160 + i % 40, 'weight': 60 + i % 50,
+        'meals': 3 + i % 3, 'sex': 'male' if i % 2 else 'female', 'a_level': 'moderately active',
+        'goal': ('cutting', 'maintenance', 'bulking')[i % 3], 'is_admin': i == 0
+    }
+
+
+class FakeMistral:
+    """
+    Stands in for the Mistral client: answers after a fixed delay.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.chat = self
+
+    def complete(self, **kwargs):
+        time.sleep(self.latency)
+        content = json.dumps({'name': 'Bench Bowl', 'ingredients': [], 'instructions': [],
+                              'macros': {'protein': 30, 'fat': 10, 'carbs': 40, 'calories': 370}})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def open_database(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=2000)
+        client.admin.command('ping')
+        client.drop_database(BENCH_DB_NAME)
+        return client[BENCH_DB_NAME], f'mongodb ({mongo_uri})'
+    try:
+        from testing import mongomock_client
+    except ImportError:
+        raise SystemExit("In-memory mode needs mongomock (pip install mongomock), or pass --mongo-uri.")
+    return mongomock_client()[BENCH_DB_NAME], 'mongomock'
+
+
+def setup(database, mistral_latency, report_dir):
+    app_module.init_clients(database)
+    ensure_indexes(database)
+    # Each token is its own uid, so scenarios can act as many users
+    app_module.verify_token = lambda token: {'uid': token, 'email': f'{token}@bench.local'}
+    recipes.MISTRAL_API_KEY = 'bench'
+    recipes._client = FakeMistral(mistral_latency)
+    app_module.report_cache = reports.ReportCache(report_dir)
+    return app_module.app.test_client()
+
+
+def measure(fn, iterations, warmup=2):
+    """
+    Calls fn(i) `iterations` times; returns throughput and latency percentiles.
+    """
+    for i in range(warmup):
+        fn(-1 - i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': pct(0.50),
+        'p99_ms': pct(0.99)
+    }
+
+
+def request(client, method, path, token, expect=200, **kwargs):
+    response = getattr(client, method)(path, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+    if response.status_code != expect:
+        raise RuntimeError(f"{method.upper()} {path}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+    # Drain streamed bodies so the whole response is timed
+    response.get_data()
+    return response
+
+
+def seed_updates(database, uid, rows):
+    # Old-format rows, moved into buckets and series the way a deployment would be
+    now = datetime.utcnow()
+    database['user_updates'].insert_many([{
+        'user_id': uid, 'weight': 80 - i * 0.01, 'meals': 4, 'activity_level': 'moderately active',
+        'goal': 'cutting', 'diet_type': 'Standard', 'tdee': 2500.0, 'target_calories': 2000.0,
+        'carbs': 200.0, 'protein': 180.0, 'fat': 60.0, 'updated_at': now - timedelta(hours=i)
+    } for i in range(rows)])
+    migrate_user_updates(database['user_updates'], database['user_update_buckets'], uid)
+    rebuild_update_series(database['user_update_buckets'], uid)
+
+
+def run_suite(client, database, iterations, report_dir):
+    results = {}
+
+    def scenario(name, fn, n=iterations):
+        results[name] = measure(fn, n)
+        print(f"{name:>24}: {results[name]}")
+
+    scenario('signup', lambda i: request(client, 'post', '/api/signup', f'user-{i}', json=signup_payload(i)))
+    scenario('update_profile', lambda i: request(
+        client, 'post', '/api/user/update', f'user-{i % iterations}', json={'weight': 70 + i % 20}))
+    scenario('meal_plan', lambda i: request(client, 'get', '/api/user/meal-plan', f'user-{i % iterations}'))
+
+    # user-0 is the admin; page through the users signed up above
+    scenario('admin_users_page', lambda i: request(client, 'get', '/api/admin/users?limit=100', 'user-0'))
+    scenario('admin_users_ndjson', lambda i: request(client, 'get', '/api/admin/users?format=ndjson', 'user-0'))
+
+    scenario('ai_recipe', lambda i: request(
+        client, 'post', '/api/ai/generate-recipes', f'user-{i % iterations}', json={'meal_name': f'Bench {i}'}))
+
+    for rows in REPORT_ROWS:
+        uid = f'report-{rows}'
+        request(client, 'post', '/api/signup', uid, json=signup_payload(rows))
+        seed_updates(database, uid, rows)
+
+        def render_report(i, uid=uid):
+            # Cold render each time: drop the cached PDF first
+            shutil.rmtree(report_dir, ignore_errors=True)
+            request(client, 'get', '/api/report/user-updates', uid)
+        scenario(f'report_{rows}_updates_weekly', render_report, n=max(3, iterations // max(1, rows // 100)))
+
+    rng = np.random.default_rng(0)
+    n = BATCH_MACRO_ROWS
+    columns = (
+        rng.choice(['male', 'female'], n), rng.uniform(50, 120, n), rng.uniform(150, 200, n),
+        rng.integers(18, 70, n), rng.choice(['sedentary', 'moderately active', 'very active'], n),
+        rng.choice(['cutting', 'maintenance', 'bulking'], n), rng.integers(3, 6, n)
+    )
+    scenario(f'batch_macros_{n}_rows', lambda i: compute_targets_batch(*columns), n=max(3, iterations // 20))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'scenario':>24}  {'baseline p50':>12}  {'p50':>10}  change")
+    for name, current in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        change = current['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        flag = '  REGRESSION' if change > tolerance else ''
+        print(f"{name:>24}  {before['p50_ms']:>12}  {current['p50_ms']:>10}  {change:+.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', help='Use this MongoDB instead of the in-memory stand-in')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--mistral-latency', type=float, default=0.0, help='Seconds per fake Mistral call')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown vs baseline')
+    args = parser.parse_args()
+
+    database, backend = open_database(args.mongo_uri)
+    report_dir = tempfile.mkdtemp(prefix='bench-reports-')
+    try:
+        client = setup(database, args.mistral_latency, report_dir)
+        results = run_suite(client, database, args.iterations, report_dir)
+    finally:
+        shutil.rmtree(report_dir, ignore_errors=True)
+        if args.mongo_uri:
+            database.client.drop_database(BENCH_DB_NAME)
+
+    output = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mongo': backend,
+            'iterations': args.iterations,
+            'mistral_latency': args.mistral_latency
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# Pure macro and meal-plan math: no I/O and nothing beyond constants.py,
+# so it imports instantly and can be used without the web app.
+from constants import ACTIVITY_MULTIPLIERS, GOAL_MODIFIERS, MACRO_RATIOS, MEAL_DISTRIBUTION, MEAL_NAMES, MAX_PLAN_MEALS
+
+def get_bmr(sex, weight, height, age):
+    if sex.lower() == 'male':
+        return 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+    else:
+        return 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+
+def get_tdee(bmr, a_level):
+    return bmr * ACTIVITY_MULTIPLIERS.get(a_level.lower(), 1.2)
+
+def calculate_macros(tdee, goal):
+    goal_key = goal.lower()
+    # Apply goal modifier to TDEE
+    adjusted_calories = tdee * GOAL_MODIFIERS.get(goal_key, 1.0)
+    
+    # Get ratios
+    p_ratio, f_ratio, c_ratio = MACRO_RATIOS.get(goal_key, MACRO_RATIOS['maintenance'])
+    
+    # Calculate grams (Protein/Carbs = 4 kcal/g, Fat = 9 kcal/g)
+    protein_g = (adjusted_calories * p_ratio) / 4
+    fat_g = (adjusted_calories * f_ratio) / 9
+    carbs_g = (adjusted_calories * c_ratio) / 4
+    
+    return {
+        'calories': adjusted_calories,
+        'protein': round(protein_g, 1),
+        'fat': round(fat_g, 1),
+        'carbs': round(carbs_g, 1)
+    }
+
+def generate_meal_plan_logic(daily_macros, num_meals):
+    """
+    Distributes daily macros into meals based on weighted preference.
+    """
+    weights = MEAL_DISTRIBUTION.get(num_meals, [1/num_meals] * num_meals) # Fallback to equal split
+    
+    meal_plan = []
+    names = MEAL_NAMES.get(num_meals, [f'Meal {i+1}' for i in range(num_meals)])
+
+    for i, weight in enumerate(weights):
+        meal = {
+            'name': names[i],
+            'calories': round(daily_macros['calories'] * weight, 1),
+            'protein': round(daily_macros['protein'] * weight, 1),
+            'fat': round(daily_macros['fat'] * weight, 1),
+            'carbs': round(daily_macros['carbs'] * weight, 1)
+        }
+        meal_plan.append(meal)
+    
+    return meal_plan
+
+def build_meal_plan(user):
+    """
+    Meal plan for a stored user document. Uses the plan saved with the
+    profile, or rebuilds it from the saved daily targets for older users.
+    """
+    if user.get('meal_plan'):
+        return user['meal_plan']
+
+    daily_macros = {
+        'calories': user.get('target_calories', user['tdee']), # Fallback for old users
+        'protein': user['total_protein'],
+        'fat': user['total_fat'],
+        'carbs': user['total_carbs']
+    }
+    return generate_meal_plan_logic(daily_macros, user['meals'])
+
+def find_meal(meal_plan, meal_name):
+    for meal in meal_plan:
+        if meal['name'].lower() == (meal_name or '').lower():
+            return meal
+    return None
+
+def parse_meal_plan(meal_plan):
+    """
+    Checks a client-supplied meal plan: a list of at most MAX_PLAN_MEALS
+    meals, each with a name and numeric protein/fat/carbs. Returns the
+    meals with their macros as floats; raises ValueError otherwise.
+    """
+    if not isinstance(meal_plan, list) or not meal_plan:
+        raise ValueError("meal_plan must be a non-empty list")
+    if len(meal_plan) > MAX_PLAN_MEALS:
+        raise ValueError(f"meal_plan has more than {MAX_PLAN_MEALS} meals")
+    meals = []
+    for meal in meal_plan:
+        if not isinstance(meal, dict) or not isinstance(meal.get('name'), str) or not meal['name'].strip():
+            raise ValueError("Each meal needs a name")
+        parsed = {'name': meal['name']}
+        for key in ('protein', 'fat', 'carbs'):
+            value = meal.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"Meal '{meal['name']}' needs a numeric {key}")
+            parsed[key] = float(value)
+        if isinstance(meal.get('calories'), (int, float)) and not isinstance(meal['calories'], bool):
+            parsed['calories'] = float(meal['calories'])
+        meals.append(parsed)
+    return meals
+
+def parse_meals(value):
+    """
+    Meals per day from a request body: at least 1, clamped to MAX_PLAN_MEALS
+    so a whole-day recipe request always fits the AI rate limit's burst.
+    Raises ValueError if it isn't a whole number or is below 1.
+    """
+    try:
+        meals = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("meals must be a whole number")
+    if meals < 1:
+        raise ValueError("meals must be at least 1")
+    return min(meals, MAX_PLAN_MEALS)
+
+def profile_update(user, data):
+    """
+    Applies an /api/user/update body to a stored user: fields missing from
+    `data` keep their stored values, and BMR, TDEE, targets and the meal
+    plan are recomputed. Returns (update_doc, log_entry); the caller stamps
+    the entry's `updated_at`. Raises ValueError on a bad weight or meal count.
+    """
+    try:
+        weight = float(data.get('weight', user['weight']))
+    except (TypeError, ValueError):
+        raise ValueError("weight must be a number")
+    if weight <= 0:
+        raise ValueError("weight must be positive")
+    meals = parse_meals(data.get('meals', user['meals']))
+    a_level = data.get('a_level', user['a_level'])
+    goal = data.get('goal', user.get('goal', 'maintenance'))
+    diet_type = data.get('diet_type', user.get('diet_type', 'Standard'))
+
+    bmr = get_bmr(user['sex'], weight, user['height'], user['age'])
+    tdee = get_tdee(bmr, a_level)
+    daily_macros = calculate_macros(tdee, goal)
+    meal_plan = generate_meal_plan_logic(daily_macros, meals)
+
+    update_doc = {
+        'weight': weight,
+        'meals': meals,
+        'a_level': a_level,
+        'goal': goal,
+        'diet_type': diet_type,
+        'bmr': bmr,
+        'tdee': tdee,
+        'target_calories': daily_macros['calories'],
+        'total_carbs': daily_macros['carbs'],
+        'total_protein': daily_macros['protein'],
+        'total_fat': daily_macros['fat'],
+        'meal_plan': meal_plan
+    }
+    log_entry = {
+        'weight': weight,
+        'meals': meals,
+        'activity_level': a_level,
+        'goal': goal,
+        'diet_type': diet_type,
+        'tdee': tdee,
+        'target_calories': daily_macros['calories'],
+        'carbs': daily_macros['carbs'],
+        'protein': daily_macros['protein'],
+        'fat': daily_macros['fat']
+    }
+    return update_doc, log_entry
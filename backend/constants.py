@@ -33,3 +33,82 @@ MEAL_DISTRIBUTION = {
     4: [0.25, 0.35, 0.15, 0.25],       # Breakfast, Lunch, Snack, Dinner
     5: [0.20, 0.30, 0.10, 0.10, 0.30]  # Breakfast, Lunch, Snack 1, Snack 2, Dinner
 }
+
+# Meal Names
+# Labels for each meal slot, keyed by number of meals per day
+MEAL_NAMES = {
+    3: ['Breakfast', 'Lunch', 'Dinner'],
+    4: ['Breakfast', 'Lunch', 'Snack', 'Dinner'],
+    5: ['Breakfast', 'Lunch', 'Snack 1', 'Snack 2', 'Dinner']
+}
+
+# Most meals a day plan may have (one recipe call each); profiles are clamped to it
+MAX_PLAN_MEALS = 6
+
+# Workout Calorie Estimates
+# Active kcal burned per minute by workout type, used when a session has no calorie figure
+WORKOUT_KCAL_PER_MIN = {
+    'strength': 6,
+    'cardio': 10,
+    'hiit': 12,
+    'yoga': 4
+}
+DEFAULT_WORKOUT_KCAL_PER_MIN = 7
+
+# Food Composition
+# Per 100 g: (name, role, protein g, fat g, carbs g, tags). Role is the slot a
+# food fills in a meal (one of each is picked); tags drive the diet filters.
+FOOD_COMPOSITION = [
+    ('Chicken breast', 'protein', 31.0, 3.6, 0.0, {'meat'}),
+    ('Turkey breast', 'protein', 29.0, 1.0, 0.0, {'meat'}),
+    ('Lean beef', 'protein', 26.0, 10.0, 0.0, {'meat'}),
+    ('Salmon', 'protein', 20.0, 13.0, 0.0, {'fish'}),
+    ('Tuna', 'protein', 29.0, 1.0, 0.0, {'fish'}),
+    ('Cod', 'protein', 18.0, 0.7, 0.0, {'fish'}),
+    ('Shrimp', 'protein', 24.0, 0.3, 0.2, {'fish'}),
+    ('Eggs', 'protein', 13.0, 11.0, 1.1, {'egg'}),
+    ('Egg whites', 'protein', 11.0, 0.2, 0.7, {'egg'}),
+    ('Greek yogurt', 'protein', 10.0, 0.4, 3.6, {'dairy'}),
+    ('Cottage cheese', 'protein', 11.0, 4.3, 3.4, {'dairy'}),
+    ('Firm tofu', 'protein', 17.0, 9.0, 3.0, {'soy', 'legume'}),
+    ('Tempeh', 'protein', 19.0, 11.0, 9.0, {'soy', 'legume'}),
+    ('Seitan', 'protein', 75.0, 1.9, 14.0, {'grain'}),
+    ('Lentils', 'protein', 9.0, 0.4, 20.0, {'legume'}),
+    ('Cooked rice', 'carb', 2.7, 0.3, 28.0, {'grain'}),
+    ('Brown rice', 'carb', 2.6, 0.9, 23.0, {'grain'}),
+    ('Rolled oats', 'carb', 13.0, 7.0, 66.0, {'grain'}),
+    ('Wholewheat pasta', 'carb', 5.5, 1.1, 26.0, {'grain'}),
+    ('Quinoa', 'carb', 4.4, 1.9, 21.0, {'grain'}),
+    ('Wholewheat bread', 'carb', 13.0, 3.4, 41.0, {'grain'}),
+    ('Potato', 'carb', 2.0, 0.1, 17.0, {'starch'}),
+    ('Sweet potato', 'carb', 1.6, 0.1, 20.0, {'starch'}),
+    ('Banana', 'carb', 1.1, 0.3, 23.0, {'fruit'}),
+    ('Apple', 'carb', 0.3, 0.2, 14.0, {'fruit'}),
+    ('Chickpeas', 'carb', 8.9, 2.6, 27.0, {'legume'}),
+    ('Black beans', 'carb', 8.9, 0.5, 24.0, {'legume'}),
+    ('Olive oil', 'fat', 0.0, 100.0, 0.0, set()),
+    ('Avocado', 'fat', 2.0, 15.0, 9.0, set()),
+    ('Almonds', 'fat', 21.0, 50.0, 22.0, {'nut'}),
+    ('Walnuts', 'fat', 15.0, 65.0, 14.0, {'nut'}),
+    ('Peanut butter', 'fat', 25.0, 50.0, 20.0, {'legume'}),
+    ('Cheddar cheese', 'fat', 25.0, 33.0, 1.3, {'dairy'}),
+    ('Butter', 'fat', 0.9, 81.0, 0.1, {'dairy'}),
+    ('Chia seeds', 'fat', 17.0, 31.0, 42.0, set()),
+    ('Broccoli', 'vegetable', 2.8, 0.4, 7.0, set()),
+    ('Spinach', 'vegetable', 2.9, 0.4, 3.6, set()),
+    ('Bell pepper', 'vegetable', 1.0, 0.3, 6.0, set()),
+    ('Zucchini', 'vegetable', 1.2, 0.3, 3.1, set()),
+    ('Green beans', 'vegetable', 1.8, 0.2, 7.0, set()),
+    ('Mixed salad greens', 'vegetable', 1.4, 0.2, 3.0, set()),
+]
+FOOD_ROLES = ('protein', 'carb', 'fat', 'vegetable')
+
+# Diet Filters
+# Food tags each diet type leaves out; unknown diet types are treated as standard
+DIET_EXCLUDED_TAGS = {
+    'standard': set(),
+    'vegetarian': {'meat', 'fish'},
+    'vegan': {'meat', 'fish', 'egg', 'dairy'},
+    'keto': {'grain', 'starch', 'fruit', 'legume'},
+    'paleo': {'grain', 'legume', 'dairy'}
+}
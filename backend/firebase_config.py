@@ -1,8 +1,13 @@
 
-import firebase_admin
-from firebase_admin import credentials, auth
 import os
+import json
+import time
+import hashlib
+import threading
+import urllib.request
+from collections import OrderedDict
 from dotenv import load_dotenv
+from metrics import VERIFY_TOKEN_SECONDS
 
 load_dotenv()
 
@@ -13,28 +18,277 @@ load_dotenv()
 
 cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH', 'balance-bite-cb8e9-firebase-adminsdk-fbsvc-62d7ff2d2a.json')
 
-if not firebase_admin._apps:
+_initialized_pid = os.getpid()  # Process that owns the current SDK app
+
+
+def init_firebase_app():
+    """
+    Initializes the default Firebase Admin app for this process. A worker
+    forked from a process that already had one gets a fresh app, so no
+    HTTP sessions are shared across processes.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if firebase_admin._apps and os.getpid() != _initialized_pid:
+        firebase_admin.delete_app(firebase_admin.get_app())
+
+    if not firebase_admin._apps:
+        try:
+            # Construct absolute path to ensure file is found relative to this script
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            abs_cred_path = os.path.join(base_dir, cred_path)
+            
+            if os.path.exists(abs_cred_path):
+                cred = credentials.Certificate(abs_cred_path)
+                firebase_admin.initialize_app(cred)
+                print(f"Firebase Admin SDK initialized with certificate: {abs_cred_path}")
+            else:
+                print(f"Warning: Credential file not found at {abs_cred_path}. Falling back to default.")
+                # Fallback or default initialization (e.g., for Google Cloud Run)
+                firebase_admin.initialize_app()
+                print("Firebase Admin SDK initialized with default credentials.")
+        except Exception as e:
+            print(f"Error initializing Firebase Admin SDK: {e}")
+
+
+# --- Local ID token verification ---
+# Firebase ID tokens are RS256 JWTs signed by Google's securetoken service.
+# We keep the public keys in memory (refreshed in the background) and cache
+# verified tokens until they expire, so the request path is a dict lookup.
+
+GOOGLE_JWKS_URL = 'https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com'
+ID_TOKEN_ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+FIREBASE_JWKS_PATH = os.getenv('FIREBASE_JWKS_PATH')  # Local JWKS file, used instead of the URL (offline/testing)
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+KEY_REFRESH_SECONDS = 3600  # Used when the key response has no max-age
+
+
+def _get_project_id():
+    project_id = os.getenv('FIREBASE_PROJECT_ID')
+    if project_id:
+        return project_id
     try:
-        # Construct absolute path to ensure file is found relative to this script
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        abs_cred_path = os.path.join(base_dir, cred_path)
-        
-        if os.path.exists(abs_cred_path):
-            cred = credentials.Certificate(abs_cred_path)
-            firebase_admin.initialize_app(cred)
-            print(f"Firebase Admin SDK initialized with certificate: {abs_cred_path}")
-        else:
-            print(f"Warning: Credential file not found at {abs_cred_path}. Falling back to default.")
-            # Fallback or default initialization (e.g., for Google Cloud Run)
-            firebase_admin.initialize_app()
-            print("Firebase Admin SDK initialized with default credentials.")
-    except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
+        import firebase_admin
+        return firebase_admin.get_app().project_id
+    except Exception:
+        return None
+
+
+class SigningKeys:
+    """
+    Public keys by `kid`, loaded from a JWKS URL or file and rotated by a daemon thread.
+    """
+
+    def __init__(self, url=GOOGLE_JWKS_URL, path=None):
+        self.url = url
+        self.path = path
+        self.keys = {}
+        self.max_age = KEY_REFRESH_SECONDS
+        self.loaded_at = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _fetch(self):
+        if self.path:
+            with open(self.path) as f:
+                return json.load(f), KEY_REFRESH_SECONDS
+        with urllib.request.urlopen(self.url, timeout=10) as response:
+            max_age = KEY_REFRESH_SECONDS
+            for directive in (response.headers.get('Cache-Control') or '').split(','):
+                name, _, value = directive.strip().partition('=')
+                if name == 'max-age' and value.isdigit():
+                    max_age = int(value)
+            return json.load(response), max_age
+
+    def refresh(self):
+        import jwt  # Pulls in cryptography; loaded with the first keys, not at startup
+        data, max_age = self._fetch()
+        keys = {k.key_id: k.key for k in jwt.PyJWKSet.from_dict(data).keys}
+        with self._lock:
+            self.keys = keys
+            self.max_age = max_age
+            self.loaded_at = time.time()
+
+    def get(self, kid):
+        key = self.keys.get(kid)
+        if key is None:
+            # Unknown kid: keys may have rotated since the last refresh.
+            # Refresh inline, but not more than once a minute.
+            with self._lock:
+                stale = time.time() - self.loaded_at > 60
+            if stale:
+                self.refresh()
+                key = self.keys.get(kid)
+        return key
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                # Refresh well before Google's advertised expiry
+                delay = max(60, self.max_age // 2)
+            except Exception as e:
+                print(f"Error refreshing signing keys: {e}")
+                delay = 60
+            time.sleep(delay)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='signing-keys', daemon=True)
+            self._thread.start()
+
+
+class TokenCache:
+    """
+    LRU cache of verified token claims keyed by SHA-256 of the token.
+    An entry is only served until the token's own `exp`.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token, count_miss=True):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, exp = entry
+                if exp > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._entries[key]
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        exp = claims.get('exp')
+        if not exp:
+            return
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (claims, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'max_size': self.max_size}
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens against locally held signing keys,
+    with the same checks as firebase_admin.auth.verify_id_token.
+    """
+
+    def __init__(self, project_id, keys, cache=None):
+        self.project_id = project_id
+        self.keys = keys
+        self.cache = cache or TokenCache()
+
+    def verify(self, token):
+        claims = self.cache.get(token)
+        if claims is not None:
+            return claims
+
+        import jwt
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self.keys.get(kid)
+        if key is None:
+            raise ValueError(f"No signing key for kid {kid!r}")
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=['RS256'],
+            audience=self.project_id,
+            issuer=ID_TOKEN_ISSUER_PREFIX + self.project_id,
+            options={'require': ['exp', 'iat', 'sub']}
+        )
+        if not claims['sub'] or len(claims['sub']) > 128:
+            raise ValueError("Invalid subject claim")
+        if claims.get('auth_time', 0) > time.time():
+            raise ValueError("Token auth_time is in the future")
+
+        claims['uid'] = claims['sub']
+        self.cache.put(token, claims)
+        return claims
+
+
+signing_keys = None
+token_cache = TokenCache()
+token_verifier = None
+
+
+def init_firebase():
+    """
+    Sets up the SDK app, signing keys and token cache for this process.
+    Nothing runs at import; app.create_app() calls this, once per worker
+    under a pre-fork server (threads and locks don't survive fork).
+    """
+    global _initialized_pid, signing_keys, token_cache, token_verifier
+    init_firebase_app()
+    _initialized_pid = os.getpid()
+
+    signing_keys = SigningKeys(path=FIREBASE_JWKS_PATH)
+    token_cache = TokenCache()
+    project_id = _get_project_id()
+    token_verifier = TokenVerifier(project_id, signing_keys, token_cache) if project_id else None
+
+    if token_verifier:
+        signing_keys.start()
+
+
+def token_cache_stats():
+    return token_cache.stats()
+
+
+def _verify_token(token):
+    if token_verifier:
+        return token_verifier.verify(token)
+
+    # No project id known: fall back to the SDK, still caching the result
+    decoded_token = token_cache.get(token)
+    if decoded_token is None:
+        from firebase_admin import auth
+        decoded_token = auth.verify_id_token(token)
+        token_cache.put(token, decoded_token)
+    return decoded_token
+
+
+def cached_token(token):
+    """
+    Claims of a token verified earlier and not yet expired, else None. A
+    dict lookup, so safe on an event loop; the verify_token call that
+    follows a miss counts it.
+    """
+    started = time.perf_counter()
+    claims = token_cache.get(token, count_miss=False)
+    if claims is not None:
+        VERIFY_TOKEN_SECONDS.observe(time.perf_counter() - started, 'valid')
+    return claims
+
 
 def verify_token(token):
+    started = time.perf_counter()
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = _verify_token(token)
+        VERIFY_TOKEN_SECONDS.observe(time.perf_counter() - started, 'valid')
         return decoded_token
     except Exception as e:
+        VERIFY_TOKEN_SECONDS.observe(time.perf_counter() - started, 'invalid')
         print(f"Error verifying token: {e}")
         return None
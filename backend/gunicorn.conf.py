@@ -0,0 +1,70 @@
+import os
+import tempfile
+import multiprocessing
+
+# Production entry point:
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master (preload_app) so workers share its
+# code pages. Importing it creates no clients: each worker builds its own
+# Mongo client, Firebase app and Mistral client in post_fork.
+
+bind = os.getenv('BIND', '0.0.0.0:5001')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))
+preload_app = True
+
+# Recipe generation waits on Mistral, so allow slow requests
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+# SIGTERM: stop accepting, finish in-flight requests, flush buffers
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('WEB_KEEPALIVE', 5))
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 0))
+
+accesslog = '-'
+errorlog = '-'
+
+# Workers share their metrics through this directory so any worker can
+# answer a /metrics scrape with totals for the whole server
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'balance-bite-metrics'))
+
+
+def on_starting(server):
+    from metrics import reset_workers_dir
+    reset_workers_dir()
+
+
+def when_ready(server):
+    # Index setup once per deployment, on a short-lived client that is
+    # closed before any worker forks
+    from pymongo import MongoClient
+    import app
+    from indexes import ensure_indexes, assert_query_plans, strict_query_checks, SlowQueryError
+
+    client = MongoClient(app.MONGO_URI, **app.mongo_client_options())
+    try:
+        db = client[app.DB_NAME]
+        ensure_indexes(db)
+        if strict_query_checks():
+            assert_query_plans(db)
+    except SlowQueryError:
+        raise
+    except Exception as e:
+        server.log.error(f"Index setup failed: {e}")
+    finally:
+        client.close()
+
+
+def post_fork(server, worker):
+    import app
+    app.create_app()
+    server.log.info(f"Worker {worker.pid} initialized clients")
+
+
+def worker_exit(server, worker):
+    import app
+    from metrics import mark_process_dead
+    app.close_clients()
+    mark_process_dead()
@@ -0,0 +1,153 @@
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Indexes each collection needs, declared next to the queries that use them.
+# create_indexes is idempotent, so these are safe to apply on every startup.
+INDEXES = {
+    'users': [
+        # Admin listing: keyset pagination on (created_at, _id)
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+        # Analytics snapshot refresh: users changed since the watermark
+        IndexModel([('updated_at', ASCENDING)]),
+    ],
+    'user_updates': [
+        # Pre-bucketing log: migrate-user-updates reads it per user, newest first
+        IndexModel([('user_id', ASCENDING), ('updated_at', DESCENDING)]),
+    ],
+    'user_update_buckets': [
+        # Live appends find the user's open bucket for the month; rebuilds scan a user in month order
+        IndexModel([('user_id', ASCENDING), ('month', ASCENDING)]),
+        # Analytics snapshot refresh: buckets appended to since the watermark
+        IndexModel([('last_at', ASCENDING)]),
+        # Series documents, for reports and trends: a user's weeks or months, newest first
+        IndexModel([('user_id', ASCENDING), ('period', ASCENDING), ('start', DESCENDING)]),
+    ],
+    'suggestions': [
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ],
+    'weekly_workout': [
+        IndexModel([('user_id', ASCENDING), ('week_start', ASCENDING)]),
+    ],
+    'workout_rollups': [
+        # Summary: a user's most recent weeks
+        IndexModel([('user_id', ASCENDING), ('week_start', DESCENDING)]),
+    ],
+    'recipe_cache': [
+        # Mongo drops entries once expires_at passes
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'recipe_jobs': [
+        # Only in-flight jobs carry inflight_key; uniqueness is what deduplicates them
+        IndexModel([('inflight_key', ASCENDING)], unique=True, sparse=True),
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'recipe_corpus': [
+        # Workers load recipes stored since their last refresh
+        IndexModel([('created_at', ASCENDING)]),
+    ],
+    'rate_limits': [
+        # Buckets of users idle for an hour are dropped (a full bucket again)
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+# Every query shape the app runs, as (collection, filter, sort).
+# check_query_plans explains each one; add new routes' queries here.
+_UID = 'query-shape-uid'
+_NOW = datetime(2024, 1, 1)
+QUERY_SHAPES = [
+    ('users', {'_id': _UID}, None),
+    ('users', {}, [('created_at', -1), ('_id', -1)]),
+    ('users', {}, [('_id', 1)]),
+    ('users', {'$or': [{'updated_at': {'$gt': _NOW, '$lte': _NOW}}, {'created_at': {'$gt': _NOW, '$lte': _NOW}}]}, None),
+    ('user_update_buckets', {'last_at': {'$gt': _NOW}, 'month': {'$exists': True}}, None),
+    ('users', {'$or': [
+        {'created_at': {'$lt': _NOW}},
+        {'created_at': _NOW, '_id': {'$lt': _UID}},
+        {'created_at': None}
+    ]}, [('created_at', -1), ('_id', -1)]),
+    ('user_updates', {'user_id': _UID}, [('user_id', 1), ('updated_at', -1)]),
+    ('user_update_buckets', {'user_id': _UID, 'month': '2024-01', 'count': {'$lt': 200}}, None),
+    ('user_update_buckets', {'user_id': _UID, 'month': {'$exists': True}}, [('user_id', 1), ('month', 1)]),
+    ('user_update_buckets', {'user_id': _UID, 'period': 'week'}, [('start', -1)]),
+    ('user_update_buckets', {'user_id': {'$in': [_UID, 'other']}, 'period': 'week'},
+     [('user_id', 1), ('period', 1), ('start', -1)]),
+    ('suggestions', {}, [('created_at', -1), ('_id', -1)]),
+    ('suggestions', {'$or': [
+        {'created_at': {'$lt': _NOW}},
+        {'created_at': _NOW, '_id': {'$lt': ObjectId()}},
+        {'created_at': None}
+    ]}, [('created_at', -1), ('_id', -1)]),
+    ('weekly_workout', {'user_id': _UID, 'week_start': '2024-01-01'}, None),
+    ('workout_rollups', {'user_id': _UID}, [('week_start', -1)]),
+    ('recipe_cache', {'_id': 'key', 'expires_at': {'$gt': _NOW}}, None),
+    ('recipe_jobs', {'_id': 'job'}, None),
+    ('recipe_jobs', {'inflight_key': 'key'}, None),
+    ('recipe_corpus', {'created_at': {'$gte': _NOW}}, None),
+    ('rate_limits', {'_id': _UID}, None),
+    ('meal_portions', {'_id': _UID}, None),
+    ('llm_slots', {'_id': {'$in': ['mistral:0', 'mistral:1']}, '$or': [{'holder': None}, {'expires_at': {'$lt': _NOW}}]}, None),
+]
+
+# Plan stages that mean a full scan or an in-memory sort
+SLOW_STAGES = {'COLLSCAN', 'SORT'}
+
+
+class SlowQueryError(Exception):
+    pass
+
+
+def ensure_indexes(db):
+    """
+    Creates every declared index. Returns {collection: [index names]}.
+    """
+    created = {}
+    for name, models in INDEXES.items():
+        created[name] = db[name].create_indexes(models)
+    return created
+
+
+def _plan_stages(plan):
+    # Walks a winning plan (classic or SBE) and yields every stage name
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def check_query_plans(db, shapes=QUERY_SHAPES):
+    """
+    Explains each query shape and returns a list of problems
+    (collection, filter, slow stages) for shapes that scan or sort in memory.
+    """
+    problems = []
+    for name, query, sort in shapes:
+        cursor = db[name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        planner = cursor.explain().get('queryPlanner', {})
+        stages = set(_plan_stages(planner.get('winningPlan', {})))
+        slow = sorted(stages & SLOW_STAGES)
+        if slow:
+            problems.append({'collection': name, 'filter': str(query), 'sort': str(sort), 'stages': slow})
+    return problems
+
+
+def assert_query_plans(db, shapes=QUERY_SHAPES):
+    problems = check_query_plans(db, shapes)
+    if problems:
+        details = '\n'.join(f"  {p['collection']} {p['filter']} sort={p['sort']}: {', '.join(p['stages'])}" for p in problems)
+        raise SlowQueryError(f"Slow query plans found:\n{details}")
+
+
+def strict_query_checks():
+    """
+    Dev/test mode: fail startup when a query shape scans or sorts in memory.
+    """
+    return os.getenv('APP_ENV', 'production') in ('development', 'test')
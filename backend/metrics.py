@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from pymongo import monitoring
+
+# Minimal Prometheus text-format metrics. Each observation is a bisect and a
+# few adds under a per-metric lock, cheap enough to leave on in production.
+# Values live in each process. With METRICS_DIR set (gunicorn.conf.py sets
+# it), every worker writes a snapshot there each METRICS_FLUSH_INTERVAL and
+# /metrics, whichever worker serves it, reports counters and histograms
+# summed over all workers, and gauges per live worker with a `pid` label.
+
+METRICS_DIR = os.getenv('METRICS_DIR')  # Directory shared by the workers; unset = this process only
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))  # Seconds between snapshots
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, values):
+        for labels, value in values.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in (self.snapshot() if values is None else values).items():
+            lines.append(f'{self.name}{_label_text(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for labels, (counts, value_sum) in values.items():
+            entry = total.get(labels)
+            if entry is None:
+                total[labels] = [list(counts), value_sum]
+            else:
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += value_sum
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in (self.snapshot() if values is None else values).items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _label_text(self.labelnames, labels, [f'le="{_number(bound)}"'])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_number(total)}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """
+    Gauge read at scrape time: `collect` returns {label values tuple: value}.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        _registry.append(self)
+
+    def snapshot(self):
+        try:
+            return self.collect() if self.collect else {}
+        except Exception:
+            return {}
+
+    def render(self, values=None):
+        # Aggregated values carry a trailing pid label; gauges of different
+        # workers (cache sizes, hit rates) don't add up
+        labelnames = self.labelnames if values is None else self.labelnames + ('pid',)
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        for labels, value in (self.snapshot() if values is None else values).items():
+            lines.append(f'{self.name}{_label_text(labelnames, labels)} {_number(value)}')
+        return lines
+
+
+def render():
+    """
+    All registered metrics in Prometheus text exposition format: this
+    process's values, or every worker's when METRICS_DIR is set.
+    """
+    merged = collect_workers() if METRICS_DIR else {}
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(merged.get(metric.name) if METRICS_DIR else None))
+    return '\n'.join(lines) + '\n'
+
+
+# --- Aggregation across worker processes ---
+
+_flusher_pid = None
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f'{pid}.json')
+
+
+def _retire(pid):
+    # Renamed, not deleted: the totals keep what this pid counted
+    path = _snapshot_path(pid)
+    if os.path.exists(path):
+        os.replace(path, os.path.join(METRICS_DIR, f'dead-{pid}-{time.time_ns()}.json'))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def flush():
+    """
+    Writes this process's values to METRICS_DIR, replacing its last snapshot.
+    """
+    snapshot = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                for metric in _registry}
+    fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, _snapshot_path(os.getpid()))
+
+
+def mark_process_dead():
+    """
+    Final snapshot of an exiting worker: its counters and histograms stay
+    in the totals (they must never go down), its gauges are dropped.
+    """
+    if not METRICS_DIR:
+        return
+    flush()
+    _retire(os.getpid())
+
+
+def collect_workers():
+    """
+    {metric name: values} over every snapshot in METRICS_DIR, this
+    process's refreshed first so the serving worker is never stale.
+    """
+    flush()
+    merged = {metric.name: {} for metric in _registry}
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue  # Retired between listdir and open
+        pid = name[:-len('.json')]
+        live = not name.startswith('dead-') and _alive(int(pid))
+        for metric in _registry:
+            values = {tuple(labels): value for labels, value in snapshot.get(metric.name, [])}
+            if isinstance(metric, Gauge):
+                if live:
+                    merged[metric.name].update({labels + (pid,): value for labels, value in values.items()})
+            else:
+                metric.merge(merged[metric.name], values)
+    return merged
+
+
+def reset_workers_dir():
+    """
+    Clears snapshots of an earlier run. Call once, before workers start.
+    """
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for name in os.listdir(METRICS_DIR):
+        os.remove(os.path.join(METRICS_DIR, name))
+
+
+def start_flusher():
+    """
+    Starts this process's snapshot thread when METRICS_DIR is set. Call
+    after fork; a snapshot left under a reused pid is retired first.
+    """
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    _flusher_pid = os.getpid()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _retire(_flusher_pid)
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                flush()
+            except OSError:
+                pass  # Directory gone or full; the next scrape still flushes
+
+    threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# --- Hot-path metrics ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ('method', 'route', 'status')
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency.', ('collection', 'command')
+)
+MONGO_COMMAND_FAILURES = Counter(
+    'mongo_command_failures_total', 'Failed MongoDB commands.', ('collection', 'command')
+)
+VERIFY_TOKEN_SECONDS = Histogram(
+    'verify_token_duration_seconds', 'ID token verification time.', ('result',)
+)
+RECIPE_GENERATION_SECONDS = Histogram(
+    'recipe_generation_duration_seconds', 'Recipe generation time: cached, from the corpus, or via Mistral.', ('outcome',)
+)
+REPORT_RENDER_SECONDS = Histogram(
+    'report_render_duration_seconds', 'PDF report render time.'
+)
+MONGO_POOL_CHECKOUT_SECONDS = Histogram(
+    'mongo_pool_checkout_duration_seconds', 'Time to check a connection out of the pool.'
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    'mongo_pool_checkout_failures_total', 'Failed connection checkouts.', ('reason',)
+)
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total', 'Requests refused with 429 by a rate limit or the LLM concurrency cap.', ('reason',)
+)
+
+
+def observe_request(request, started, status):
+    # Labelled by route rule, not raw path, to keep the series count bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, str(status))
+
+
+def instrument_app(app):
+    """
+    Records HTTP_REQUEST_SECONDS for every request to a Flask app.
+    """
+    from flask import request, g
+
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    def record(status):
+        started = g.pop('request_started', None)
+        if started is not None:
+            observe_request(request, started, status)
+
+    def after(response):
+        record(response.status_code)
+        return response
+
+    def teardown(exc):
+        # Only still pending when the view raised past the error handlers
+        if exc is not None:
+            record(500)
+
+    app.before_request(start_timer)
+    app.after_request(after)
+    app.teardown_request(teardown)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every command by collection and command name.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            target = event.command.get('collection')
+        collection = target if isinstance(target, str) else ''
+        self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        return self._pending.pop((event.connection_id, event.request_id), '')
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, collection, event.command_name)
+        MONGO_COMMAND_FAILURES.inc(collection, event.command_name)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Open and checked-out connections per server, plus checkout wait time.
+    """
+
+    def __init__(self):
+        self.open = {}
+        self.checked_out = {}
+        self._lock = threading.Lock()
+
+    def _add(self, counts, address, delta):
+        key = f'{address[0]}:{address[1]}'
+        with self._lock:
+            counts[key] = counts.get(key, 0) + delta
+
+    def connection_created(self, event):
+        self._add(self.open, event.address, 1)
+
+    def connection_closed(self, event):
+        self._add(self.open, event.address, -1)
+
+    def connection_checked_out(self, event):
+        self._add(self.checked_out, event.address, 1)
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            MONGO_POOL_CHECKOUT_SECONDS.observe(duration)
+
+    def connection_checked_in(self, event):
+        self._add(self.checked_out, event.address, -1)
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.inc(str(event.reason))
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def gauges(self):
+        with self._lock:
+            values = {(address, 'open'): n for address, n in self.open.items()}
+            values.update({(address, 'in_use'): n for address, n in self.checked_out.items()})
+        return values
+
+
+mongo_command_metrics = MongoCommandMetrics()
+pool_metrics = PoolMetrics()
+
+Gauge('mongo_pool_connections', 'Connections per server by state.', ('address', 'state'), pool_metrics.gauges)
@@ -0,0 +1,83 @@
+import json
+import base64
+from datetime import datetime
+from bson import ObjectId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+# Newest first; _id breaks ties between equal timestamps
+KEYSET_SORT = [('created_at', -1), ('_id', -1)]
+
+
+def encode_cursor(doc):
+    created_at = doc.get('created_at')
+    payload = {
+        'c': created_at.isoformat() if isinstance(created_at, datetime) else None,
+        'i': str(doc['_id']),
+        'o': isinstance(doc['_id'], ObjectId)
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(token):
+    """
+    Returns (created_at, _id) from a `next` token. Raises ValueError if it is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        created_at = datetime.fromisoformat(payload['c']) if payload['c'] else None
+        _id = ObjectId(payload['i']) if payload['o'] else payload['i']
+        return created_at, _id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(token):
+    """
+    Filter matching everything after the cursor in KEYSET_SORT order.
+    Documents without `created_at` sort last, so they follow any dated cursor.
+    """
+    if not token:
+        return {}
+    created_at, _id = decode_cursor(token)
+    if created_at is None:
+        return {'created_at': None, '_id': {'$lt': _id}}
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, '_id': {'$lt': _id}},
+        {'created_at': None}
+    ]}
+
+
+def page_size(value):
+    try:
+        size = int(value) if value is not None else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def fetch_page(collection, projection, limit, token=None):
+    """
+    Returns (docs, next_token). next_token is None on the last page.
+    Fetches one extra row to know whether another page exists.
+    """
+    cursor = collection.find(keyset_filter(token), projection).sort(KEYSET_SORT).limit(limit + 1)
+    docs = list(cursor)
+    next_token = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_token
+
+
+def iter_all(collection, projection, token=None):
+    """
+    Cursor over every document after `token`, in KEYSET_SORT order.
+    """
+    return collection.find(keyset_filter(token), projection).sort(KEYSET_SORT).batch_size(STREAM_BATCH_SIZE)
+
+
+def wants_ndjson(request):
+    return request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best == 'application/x-ndjson'
+
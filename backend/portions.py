@@ -0,0 +1,310 @@
+import zlib
+import itertools
+import numpy as np
+from datetime import datetime
+from pymongo import ReplaceOne
+
+from constants import FOOD_COMPOSITION, FOOD_ROLES, DIET_EXCLUDED_TAGS
+from calculations import build_meal_plan
+from recipe_corpus import ingredient_terms
+
+# Deterministic portion planning: turns per-meal protein/fat/carbs targets
+# into gram amounts of real foods, with no LLM call. Each meal gets one
+# candidate food per role (protein, carb, fat, vegetable), rotated by day
+# and meal so a week has variety (a few rotations are fitted and the
+# closest kept). The vegetable is a fixed side; the other
+# grams come from a non-negative least-squares fit, with per-food caps,
+# to the meal's remaining macros. Many meals of many users are solved in
+# one call on (meals, macros, roles) arrays.
+
+MACROS = ('protein', 'fat', 'carbs')
+# Below these, errors are measured against the floor, as in recipe_corpus
+MACRO_FLOORS = np.array([10.0, 5.0, 10.0])
+PORTION_STEP = 5  # Grams are rounded to this
+PLAN_DAYS = 7
+RIDGE = 1e-9  # Keeps the normal equations solvable for missing candidates
+ROLE_MAX_GRAMS = {'protein': 300, 'carb': 400, 'fat': 60}  # Largest portion of one food per meal
+VEGETABLE_GRAMS = 150  # Side of vegetables for a VEGETABLE_MEAL_KCAL meal
+VEGETABLE_MEAL_KCAL = 700
+VEGETABLE_RANGE = (50, 250)
+CANDIDATE_SETS = 3  # Food combinations fitted per meal; the closest is kept
+CANDIDATE_SET_STRIDE = 1009  # Rotation offset between them
+
+# Fields needed from a user document to plan its portions
+PORTION_PROJECTION = {'meals': 1, 'meal_plan': 1, 'tdee': 1, 'target_calories': 1, 'total_protein': 1,
+                      'total_fat': 1, 'total_carbs': 1, 'diet_type': 1, 'disliked_ingredients': 1, 'version': 1}
+
+
+class FoodTable:
+    """
+    The food composition table as arrays: macros per 100 g in an
+    (n_foods, 3) matrix, roles as codes, and per diet type a mask of the
+    foods it allows.
+    """
+
+    def __init__(self, foods=FOOD_COMPOSITION):
+        self.names = [food[0] for food in foods]
+        self.roles = np.array([FOOD_ROLES.index(food[1]) for food in foods])
+        self.macros = np.array([food[2:5] for food in foods], dtype=float)
+        self.terms = [set(ingredient_terms(name)) for name in self.names]
+        self.diet_masks = {
+            diet: np.array([not (food[5] & excluded) for food in foods])
+            for diet, excluded in DIET_EXCLUDED_TAGS.items()
+        }
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def mask(self, diet_type, disliked_ingredients=None):
+        """
+        Foods allowed for a diet type, minus any matching a disliked
+        ingredient (all of its words, as recipe_corpus matches them).
+        """
+        diet = (diet_type or 'standard').lower()
+        disliked = tuple(sorted({d.lower() for d in disliked_ingredients or [] if isinstance(d, str)}))
+        key = (diet, disliked)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self.diet_masks.get(diet, self.diet_masks['standard']).copy()
+            for dislike in disliked:
+                words = set(ingredient_terms(dislike))
+                if words:
+                    mask &= np.array([not words <= terms for terms in self.terms])
+            self._masks[key] = mask
+        return mask
+
+
+def pick_candidates(table, masks, rotation):
+    """
+    One allowed food per role for each row of `masks` (rows x foods),
+    the rotation[row]-th allowed one cyclically. Returns (rows, roles)
+    food indices, -1 where a role has no allowed food.
+    """
+    rows = len(masks)
+    candidates = np.full((rows, len(FOOD_ROLES)), -1)
+    for role in range(len(FOOD_ROLES)):
+        foods = np.flatnonzero(table.roles == role)
+        allowed = masks[:, foods]
+        counts = allowed.sum(axis=1)
+        position = np.where(counts > 0, rotation % np.maximum(counts, 1), -1)
+        # The (position + 1)-th True in each row
+        hit = allowed & (np.cumsum(allowed, axis=1) == (position + 1)[:, None])
+        has = hit.any(axis=1)
+        candidates[has, role] = foods[hit[has].argmax(axis=1)]
+    return candidates
+
+
+def nnls_batch(A, b, upper=None):
+    """
+    Non-negative least squares for a batch of small systems: minimizes
+    ||A[i] x - b[i]|| with 0 <= x <= upper[i] for A (n, m, k), b (n, m),
+    upper (n, k) or None for no cap. Exact for small k: each variable is
+    tried at zero, free and (with caps) at its cap, every combination is
+    solved for all rows at once, and each row keeps the best feasible one.
+    """
+    n, _, k = A.shape
+    states = (0, 1, 2) if upper is not None else (0, 1)
+    best_x = np.zeros((n, k))
+    best_residual = np.full(n, np.inf)
+    for assignment in itertools.product(states, repeat=k):
+        free = [i for i, state in enumerate(assignment) if state == 1]
+        capped = [i for i, state in enumerate(assignment) if state == 2]
+        x = np.zeros((n, k))
+        if capped:
+            x[:, capped] = upper[:, capped]
+        rest = b - np.einsum('nmi,ni->nm', A, x)
+        feasible = np.ones(n, dtype=bool)
+        if free:
+            Af = A[:, :, free]
+            gram = np.einsum('nmi,nmj->nij', Af, Af) + RIDGE * np.eye(len(free))
+            solved = np.linalg.solve(gram, np.einsum('nmi,nm->ni', Af, rest)[..., None])[..., 0]
+            feasible &= (solved >= 0).all(axis=1)
+            if upper is not None:
+                feasible &= (solved <= upper[:, free]).all(axis=1)
+            x[:, free] = solved
+            rest = rest - np.einsum('nmi,ni->nm', Af, solved)
+        residual = np.einsum('nm,nm->n', rest, rest)
+        # Strictly better only: simpler assignments, tried first, win ties
+        better = feasible & (residual < best_residual - 1e-12)
+        best_residual[better] = residual[better]
+        best_x[better] = x[better]
+    return best_x
+
+
+def vegetable_grams(targets):
+    """
+    The fixed vegetable side of each meal: VEGETABLE_GRAMS for a
+    VEGETABLE_MEAL_KCAL meal, scaled with the meal's calories.
+    """
+    calories = targets @ np.array([4.0, 9.0, 4.0])
+    grams = VEGETABLE_GRAMS * calories / VEGETABLE_MEAL_KCAL
+    return np.clip(np.round(grams / PORTION_STEP) * PORTION_STEP, *VEGETABLE_RANGE)
+
+
+def _fit(table, targets, candidates):
+    # Grams, achieved macros and relative error for one candidate set per row
+    # (rows, macros, roles): macros per 100 g of each candidate, zero for none
+    per_100g = np.where(candidates[..., None] >= 0, table.macros[np.maximum(candidates, 0)], 0.0).transpose(0, 2, 1)
+
+    grams = np.zeros(candidates.shape)
+    veg = FOOD_ROLES.index('vegetable')
+    grams[:, veg] = np.where(candidates[:, veg] >= 0, vegetable_grams(targets), 0)
+    rest = targets - per_100g[:, :, veg] * grams[:, [veg]] / 100
+
+    fitted = [i for i in range(len(FOOD_ROLES)) if i != veg]
+    upper = np.tile(np.array([ROLE_MAX_GRAMS[FOOD_ROLES[i]] for i in fitted]) / 100, (len(targets), 1))
+    # Relative error per macro, so 5 g of fat weighs as much as 10 g of carbs
+    scale = 1.0 / np.maximum(targets, MACRO_FLOORS)
+    hundreds = nnls_batch(per_100g[:, :, fitted] * scale[:, :, None], rest * scale, upper)
+    grams[:, fitted] = np.round(hundreds * 100 / PORTION_STEP) * PORTION_STEP
+    grams[candidates < 0] = 0
+    achieved = np.einsum('nmi,ni->nm', per_100g, grams / 100)
+    error = np.sqrt(np.mean(((achieved - targets) * scale) ** 2, axis=1))
+    return grams, achieved, error
+
+
+def solve_portions(table, targets, masks, rotation, candidate_sets=CANDIDATE_SETS):
+    """
+    Grams per candidate food for many meals at once. `targets` is
+    (rows, 3) protein/fat/carbs grams, `masks` (rows, foods) the allowed
+    foods, `rotation` (rows,) which allowed food each role starts from.
+    The vegetable gets a fixed side portion; protein, carb and fat foods
+    are fitted to what is left of the targets, each within its role's cap.
+    `candidate_sets` rotations are fitted per row and the closest kept.
+    Returns (candidates, grams, achieved): (rows, roles) food indices
+    (-1 for none), grams rounded to PORTION_STEP, and the macros those
+    grams give.
+    """
+    targets = np.asarray(targets, dtype=float)
+    rotation = np.asarray(rotation)
+    best = None
+    for n in range(candidate_sets):
+        candidates = pick_candidates(table, masks, rotation + n * CANDIDATE_SET_STRIDE)
+        grams, achieved, error = _fit(table, targets, candidates)
+        if best is None:
+            best = [candidates, grams, achieved, error]
+            continue
+        closer = error < best[3] - 1e-9
+        for kept, new in zip(best, (candidates, grams, achieved, error)):
+            kept[closer] = new[closer]
+    return best[0], best[1], best[2]
+
+
+def user_rotation(user_id):
+    # Stable across runs and processes, unlike hash()
+    return zlib.crc32(str(user_id).encode())
+
+
+def plan_rows(user, days=PLAN_DAYS):
+    """
+    (meal plan, targets, rotations) of one user's week, rotations unique
+    per day and meal. Raises KeyError/TypeError for incomplete profiles.
+    """
+    plan = build_meal_plan(user)
+    targets = [[float(meal[m]) for m in MACROS] for meal in plan]
+    base = user_rotation(user['_id'])
+    rotations = [base + day * len(plan) + i for day in range(days) for i in range(len(plan))]
+    return plan, targets * days, rotations
+
+
+def portion_days(table, plan, candidates, grams, achieved, days=PLAN_DAYS):
+    """
+    API/storage shape of one user's solved rows (as lists): a list of
+    days, each a list of meals with their targets, foods and achieved macros.
+    """
+    names = table.names
+    out = []
+    row = 0
+    for day in range(days):
+        meals = []
+        for meal in plan:
+            protein, fat, carbs = achieved[row]
+            meals.append({
+                'name': meal['name'],
+                'target': {m: meal[m] for m in MACROS},
+                'foods': [
+                    {'food': names[food], 'grams': int(g)}
+                    for food, g in zip(candidates[row], grams[row]) if food >= 0 and g > 0
+                ],
+                'macros': {'protein': protein, 'fat': fat, 'carbs': carbs}
+            })
+            row += 1
+        out.append({'day': day + 1, 'meals': meals})
+    return out
+
+
+def plan_portions(users, table=None, days=PLAN_DAYS):
+    """
+    Weekly portion plans for a list of user documents, solved in one
+    batch. Returns {user id: days}; users with incomplete profiles are
+    left out.
+    """
+    table = table or FoodTable()
+    plans, targets, masks, rotations = [], [], [], []
+    for user in users:
+        try:
+            plan, rows, rotation = plan_rows(user, days)
+        except (KeyError, TypeError, ValueError):
+            continue
+        plans.append((user['_id'], plan, len(rows)))
+        targets.extend(rows)
+        rotations.extend(rotation)
+        masks.append(np.broadcast_to(table.mask(user.get('diet_type'), user.get('disliked_ingredients')),
+                                     (len(rows), len(table))))
+    if not plans:
+        return {}
+
+    candidates, grams, achieved = solve_portions(
+        table, np.array(targets), np.concatenate(masks), np.array(rotations, dtype=np.int64)
+    )
+    # One conversion for the batch; per-element numpy access is slow
+    candidates, grams, achieved = candidates.tolist(), grams.tolist(), np.round(achieved, 1).tolist()
+    result = {}
+    start = 0
+    for uid, plan, count in plans:
+        end = start + count
+        result[uid] = portion_days(table, plan, candidates[start:end], grams[start:end], achieved[start:end], days)
+        start = end
+    return result
+
+
+def compute_weekly_portions(users_collection, portions_collection, chunk_size=2000, progress=None):
+    """
+    Streams every user in chunks, plans their week's portions in one solve
+    per chunk and stores them in `portions_collection`, keyed by user id
+    and tagged with the profile version they were computed from.
+    """
+    stats = {'processed': 0, 'skipped': 0}
+    table = FoodTable()
+    cursor = users_collection.find({}, PORTION_PROJECTION).batch_size(chunk_size)
+
+    def flush(chunk):
+        if not chunk:
+            return
+        planned = plan_portions(chunk, table)
+        now = datetime.utcnow()
+        ops = [
+            ReplaceOne({'_id': user['_id']}, {
+                'version': user.get('version'),
+                'diet_type': user.get('diet_type'),
+                'days': planned[user['_id']],
+                'computed_at': now
+            }, upsert=True)
+            for user in chunk if user['_id'] in planned
+        ]
+        if ops:
+            portions_collection.bulk_write(ops, ordered=False)
+        stats['processed'] += len(ops)
+        stats['skipped'] += len(chunk) - len(ops)
+        if progress:
+            progress(stats)
+
+    chunk = []
+    for user in cursor:
+        chunk.append(user)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    return stats
@@ -0,0 +1,314 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'mongo')  # 'mongo' (shared by all workers) or 'memory'
+AI_RATE_PER_MIN = float(os.getenv('AI_RATE_PER_MIN', 10))  # Sustained AI requests per user
+AI_RATE_BURST = int(os.getenv('AI_RATE_BURST', 6))  # Enough for a full day plan (constants.MAX_PLAN_MEALS)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))  # Upstream calls in flight, all workers
+LLM_MAX_WAITING = int(os.getenv('LLM_MAX_WAITING', 16))  # Callers queued for a slot, per process
+LLM_WAIT_TIMEOUT = float(os.getenv('LLM_WAIT_TIMEOUT', 5))  # Seconds a caller may queue
+LLM_SLOT_LEASE = 180  # Seconds before a slot held by a dead worker is reclaimed
+BUCKET_TTL = 3600  # Seconds an idle user's bucket is kept
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(AdmissionRejected):
+    pass
+
+
+class Overloaded(AdmissionRejected):
+    pass
+
+
+# --- Per-user token buckets ---
+
+class MongoBucketStore:
+    """
+    Token buckets in Mongo, refilled and debited in one atomic pipeline
+    update using the server clock, so every worker sees the same balance.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def take(self, key, rate, burst, cost):
+        """
+        Returns the bucket's tokens after the attempt and whether `cost` was taken.
+        """
+        elapsed = {'$divide': [{'$subtract': ['$$NOW', {'$ifNull': ['$updated_at', '$$NOW']}]}, 1000]}
+        pipeline = [
+            {'$set': {
+                'tokens': {'$min': [burst, {'$add': [{'$ifNull': ['$tokens', burst]}, {'$multiply': [elapsed, rate]}]}]},
+                'updated_at': '$$NOW'
+            }},
+            {'$set': {
+                'allowed': {'$gte': ['$tokens', cost]},
+                'tokens': {'$cond': [{'$gte': ['$tokens', cost]}, {'$subtract': ['$tokens', cost]}, '$tokens']},
+                'expires_at': {'$add': ['$$NOW', BUCKET_TTL * 1000]}
+            }}
+        ]
+        try:
+            doc = self.collection.find_one_and_update(
+                {'_id': key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Two first requests raced on the upsert; the bucket exists now
+            doc = self.collection.find_one_and_update(
+                {'_id': key}, pipeline, return_document=ReturnDocument.AFTER
+            )
+        return doc['tokens'], doc['allowed']
+
+
+class MemoryBucketStore:
+    """
+    In-process buckets with the same interface, for tests and single-process runs.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost):
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+        return tokens, allowed
+
+
+class RateLimiter:
+    """
+    Token bucket per key: `burst` requests at once, refilled at
+    `per_minute`. check() raises RateLimited with the wait until enough
+    tokens are back, or ValueError for a cost no bucket can ever cover.
+    """
+
+    def __init__(self, store, per_minute=AI_RATE_PER_MIN, burst=AI_RATE_BURST):
+        self.store = store
+        self.rate = per_minute / 60.0
+        self.burst = burst
+
+    def check(self, key, cost=1):
+        if cost > self.burst:
+            raise ValueError(f"Request needs {cost} AI calls; at most {self.burst} are allowed at once")
+        tokens, allowed = self.store.take(key, self.rate, self.burst, cost)
+        if not allowed:
+            raise RateLimited("Rate limit exceeded", retry_after=(cost - tokens) / self.rate)
+
+
+# --- Global concurrency cap ---
+
+async def poll_async(try_acquire, timeout):
+    """
+    Awaits `try_acquire()` (a coroutine function returning the held slot
+    or None) with backoff until it succeeds or `timeout` passes. Waiting
+    sleeps on the event loop; no thread is held.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        held = await try_acquire()
+        if held or time.monotonic() >= deadline:
+            return held
+        await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 0.2)
+
+
+class MongoSlots:
+    """
+    `limit` slot documents shared by all workers. A slot is held by a
+    random token with a lease, so slots of a crashed worker come back.
+    bind_async() adds an AsyncMongoClient collection for the async
+    methods; the sync and async paths claim the same slot documents.
+    """
+
+    def __init__(self, collection, name, limit, lease=LLM_SLOT_LEASE):
+        self.collection = collection
+        self.async_collection = None
+        self.limit = limit
+        self.lease = lease
+        self.slot_ids = [f'{name}:{i}' for i in range(limit)]
+        self._created = False
+
+    def bind_async(self, collection):
+        self.async_collection = collection
+
+    def _ensure_slots(self):
+        if not self._created:
+            for slot_id in self.slot_ids:
+                self.collection.update_one({'_id': slot_id}, {'$setOnInsert': {'holder': None}}, upsert=True)
+            self._created = True
+
+    def _claim(self):
+        # (filter, update, token) taking any free or expired slot
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        return (
+            {'_id': {'$in': self.slot_ids}, '$or': [{'holder': None}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'holder': token, 'expires_at': now + timedelta(seconds=self.lease)}},
+            token
+        )
+
+    def try_acquire(self):
+        self._ensure_slots()
+        query, update, token = self._claim()
+        slot = self.collection.find_one_and_update(query, update, projection={'_id': 1})
+        return (slot['_id'], token) if slot else None
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True:
+            held = self.try_acquire()
+            if held or time.monotonic() >= deadline:
+                return held
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.2)
+
+    def release(self, held):
+        slot_id, token = held
+        self.collection.update_one({'_id': slot_id, 'holder': token}, {'$set': {'holder': None, 'expires_at': None}})
+
+    async def try_acquire_async(self):
+        if self.async_collection is None:
+            return await asyncio.to_thread(self.try_acquire)
+        if not self._created:
+            for slot_id in self.slot_ids:
+                await self.async_collection.update_one({'_id': slot_id}, {'$setOnInsert': {'holder': None}}, upsert=True)
+            self._created = True
+        query, update, token = self._claim()
+        slot = await self.async_collection.find_one_and_update(query, update, projection={'_id': 1})
+        return (slot['_id'], token) if slot else None
+
+    async def acquire_async(self, timeout):
+        return await poll_async(self.try_acquire_async, timeout)
+
+    async def release_async(self, held):
+        if self.async_collection is None:
+            return await asyncio.to_thread(self.release, held)
+        slot_id, token = held
+        await self.async_collection.update_one(
+            {'_id': slot_id, 'holder': token}, {'$set': {'holder': None, 'expires_at': None}}
+        )
+
+
+class MemorySlots:
+    """
+    In-process slots with the same interface.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self, timeout):
+        return True if self._semaphore.acquire(timeout=timeout) else None
+
+    def release(self, held):
+        self._semaphore.release()
+
+    async def try_acquire_async(self):
+        return True if self._semaphore.acquire(blocking=False) else None
+
+    async def acquire_async(self, timeout):
+        return await poll_async(self.try_acquire_async, timeout)
+
+    async def release_async(self, held):
+        self._semaphore.release()
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent upstream calls. Callers wait for a slot in a bounded
+    queue: when it is full, or a caller's wait passes `timeout`, they get
+    Overloaded right away instead of piling up behind the upstream.
+    """
+
+    def __init__(self, slots, max_waiting=LLM_MAX_WAITING, timeout=LLM_WAIT_TIMEOUT):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    def _enter_queue(self):
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                raise Overloaded("Recipe generation is at capacity", retry_after=self.timeout)
+            self.waiting += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _admitted(self, held):
+        if held is None:
+            raise Overloaded("Recipe generation is at capacity", retry_after=self.timeout)
+        return held
+
+    def acquire(self):
+        self._enter_queue()
+        try:
+            held = self.slots.acquire(self.timeout)
+        finally:
+            self._leave_queue()
+        return self._admitted(held)
+
+    def release(self, held):
+        self.slots.release(held)
+
+    async def acquire_async(self):
+        """
+        acquire() for the event loop: the wait is asyncio.sleep between
+        attempts, so queued callers hold no executor threads.
+        """
+        self._enter_queue()
+        try:
+            held = await self.slots.acquire_async(self.timeout)
+        finally:
+            self._leave_queue()
+        return self._admitted(held)
+
+    async def release_async(self, held):
+        await self.slots.release_async(held)
+
+    @contextmanager
+    def slot(self):
+        held = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(held)
+
+    def stats(self):
+        return {'limit': self.slots.limit, 'waiting': self.waiting}
+
+
+def build_limiters(db, backend=RATE_LIMIT_BACKEND):
+    """
+    Returns (per-user RateLimiter, upstream ConcurrencyLimiter). The Mongo
+    backend shares state across workers; 'memory' keeps it per process.
+    """
+    if backend == 'memory':
+        return RateLimiter(MemoryBucketStore()), ConcurrencyLimiter(MemorySlots(LLM_MAX_CONCURRENCY))
+    return (
+        RateLimiter(MongoBucketStore(db['rate_limits'])),
+        ConcurrencyLimiter(MongoSlots(db['llm_slots'], 'mistral', LLM_MAX_CONCURRENCY))
+    )
@@ -0,0 +1,113 @@
+import os
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+RECIPE_CACHE_SIZE = int(os.getenv('RECIPE_CACHE_SIZE', 2048))
+RECIPE_CACHE_TTL = int(os.getenv('RECIPE_CACHE_TTL', 7 * 24 * 3600))  # Seconds
+MACRO_BUCKET_GRAMS = 5  # Macros within the same 5g bucket share a cached recipe
+
+
+def recipe_cache_key(diet_type, meal_name, meal_macros, excluded_ingredients):
+    """
+    Builds a stable key from the inputs that shape the prompt.
+    Macros are bucketed so near-identical targets share an entry.
+    """
+    buckets = [
+        int(round((meal_macros.get(m) or 0) / MACRO_BUCKET_GRAMS)) * MACRO_BUCKET_GRAMS
+        for m in ('protein', 'fat', 'carbs')
+    ]
+    excluded = sorted({i.strip().lower() for i in (excluded_ingredients or []) if i and i.strip()})
+    raw = json.dumps([(diet_type or '').lower(), (meal_name or '').lower(), buckets, excluded])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class RecipeCache:
+    """
+    Two-tier recipe cache: an in-process LRU with TTL in front of an
+    optional Mongo collection shared by every worker.
+    """
+
+    def __init__(self, max_size=RECIPE_CACHE_SIZE, ttl=RECIPE_CACHE_TTL, collection=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.collection = collection
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            recipe, expires = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return recipe
+
+    def _put_memory(self, key, recipe, expires):
+        with self._lock:
+            self._entries[key] = (recipe, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        recipe = self._get_memory(key)
+        if recipe is not None:
+            return recipe
+
+        if self.collection is not None:
+            try:
+                doc = self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+            except Exception as e:
+                logger.error(f"Recipe cache read failed: {e}")
+                doc = None
+            if doc:
+                remaining = (doc['expires_at'] - datetime.utcnow()).total_seconds()
+                self._put_memory(key, doc['recipe'], time.time() + remaining)
+                with self._lock:
+                    self.mongo_hits += 1
+                return doc['recipe']
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, recipe):
+        self._put_memory(key, recipe, time.time() + self.ttl)
+        if self.collection is not None:
+            try:
+                self.collection.replace_one(
+                    {'_id': key},
+                    {'recipe': recipe, 'created_at': datetime.utcnow(),
+                     'expires_at': datetime.utcnow() + timedelta(seconds=self.ttl)},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"Recipe cache write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.mongo_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'mongo_hits': self.mongo_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'llm_calls_saved': hits,
+                'size': len(self._entries)
+            }
@@ -0,0 +1,243 @@
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# numpy is imported on first use; importing this module stays cheap
+
+RECIPE_CORPUS = os.getenv('RECIPE_CORPUS', '1') == '1'
+CORPUS_MAX_DISTANCE = float(os.getenv('CORPUS_MAX_DISTANCE', 0.1))  # RMS relative macro error to accept a match
+CORPUS_REFRESH_SECONDS = 30  # How often a worker picks up recipes stored by other workers
+CORPUS_REFRESH_OVERLAP = 5  # Seconds re-read on refresh, for writes that land slightly out of order
+
+MACRO_FIELDS = ('protein', 'fat', 'carbs', 'calories')
+# Below these, relative error is measured against the floor, so a 2g vs 4g fat miss isn't 100% off
+MACRO_FLOORS = (10.0, 5.0, 10.0, 100.0)
+
+_WORD = re.compile(r'[a-z]+')
+# Quantities and units carry no meaning for exclusions ("100g Chicken Breast")
+_STOPWORDS = {'g', 'kg', 'mg', 'ml', 'l', 'oz', 'lb', 'lbs', 'cup', 'cups', 'tbsp', 'tsp', 'of', 'and', 'a', 'or',
+              'to', 'taste', 'large', 'small', 'medium', 'fresh', 'chopped', 'sliced', 'diced', 'optional'}
+
+
+def ingredient_terms(text):
+    """
+    Normalized words of an ingredient line or a disliked ingredient:
+    lowercase, no units, trailing plural 's' dropped.
+    """
+    terms = []
+    for word in _WORD.findall((text or '').lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def recipe_vector(macros):
+    """
+    (protein, fat, carbs, calories) of a macros dict; calories are derived
+    when missing. Returns None if the macros aren't usable numbers.
+    """
+    try:
+        protein, fat, carbs = (float(macros[m]) for m in ('protein', 'fat', 'carbs'))
+    except (KeyError, TypeError, ValueError):
+        return None
+    calories = macros.get('calories')
+    try:
+        calories = float(calories) if calories is not None else 4 * protein + 4 * carbs + 9 * fat
+    except (TypeError, ValueError):
+        calories = 4 * protein + 4 * carbs + 9 * fat
+    return protein, fat, carbs, calories
+
+
+class RecipeCorpus:
+    """
+    Every generated recipe, searchable by its macros. Vectors sit in one
+    numpy array, diet types as integer codes and ingredient words in an
+    inverted index (word -> recipe positions), so a lookup is a few array
+    operations. With a collection attached, recipes are persisted and
+    each worker loads and periodically refreshes the shared set.
+    """
+
+    def __init__(self, collection=None, max_distance=CORPUS_MAX_DISTANCE):
+        self.collection = collection
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._ids = []
+        self._recipes = []
+        self._diets = {}  # diet type -> code
+        self._postings = {}  # ingredient word -> positions
+        self._vectors = None
+        self._diet_codes = None
+        self._size = 0
+        self._known = set()
+        self._loaded = False
+        self._loaded_until = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed):
+        import numpy as np
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 256)
+        vectors = np.zeros((capacity, len(MACRO_FIELDS)), dtype=np.float32)
+        codes = np.full(capacity, -1, dtype=np.int32)
+        if self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+            codes[:self._size] = self._diet_codes[:self._size]
+        self._vectors, self._diet_codes = vectors, codes
+
+    def _index(self, recipe_id, recipe, diet_type, vector):
+        # Caller holds the lock
+        if recipe_id in self._known:
+            return
+        position = self._size
+        self._grow(position + 1)
+        self._vectors[position] = vector
+        diet = (diet_type or 'standard').lower()
+        self._diet_codes[position] = self._diets.setdefault(diet, len(self._diets))
+        words = set()
+        for line in recipe.get('ingredients') or []:
+            words.update(ingredient_terms(line if isinstance(line, str) else str(line)))
+        for word in words:
+            self._postings.setdefault(word, []).append(position)
+        self._ids.append(recipe_id)
+        self._recipes.append(recipe)
+        self._known.add(recipe_id)
+        self._size += 1
+
+    def _load(self, since=None):
+        query = {'created_at': {'$gte': since}} if since else {}
+        newest = since
+        for doc in self.collection.find(query, {'recipe': 1, 'diet_type': 1, 'vector': 1, 'created_at': 1}):
+            with self._lock:
+                self._index(doc['_id'], doc['recipe'], doc.get('diet_type'), doc['vector'])
+            if newest is None or doc['created_at'] > newest:
+                newest = doc['created_at']
+        return newest
+
+    def _sync(self):
+        """
+        Loads the shared corpus on first use, then picks up other workers'
+        additions every CORPUS_REFRESH_SECONDS.
+        """
+        if self.collection is None:
+            return
+        if self._loaded and time.monotonic() - self._refreshed_at < CORPUS_REFRESH_SECONDS:
+            return
+        # One thread loads; the others search what is already indexed
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            since = self._loaded_until - timedelta(seconds=CORPUS_REFRESH_OVERLAP) if self._loaded_until else None
+            self._loaded_until = self._load(since) or self._loaded_until
+            self._loaded = True
+        except Exception as e:
+            logger.error(f"Recipe corpus load failed: {e}")
+        finally:
+            self._refreshed_at = time.monotonic()
+            self._sync_lock.release()
+
+    def add(self, recipe_id, recipe, diet_type):
+        """
+        Stores a generated recipe. Recipes without usable macros are skipped.
+        """
+        macros = recipe.get('macros') if isinstance(recipe, dict) else None
+        vector = recipe_vector(macros) if isinstance(macros, dict) else None
+        if vector is None:
+            return False
+        with self._lock:
+            self._index(recipe_id, recipe, diet_type, vector)
+        if self.collection is not None:
+            try:
+                self.collection.update_one(
+                    {'_id': recipe_id},
+                    {'$setOnInsert': {
+                        'recipe': recipe,
+                        'diet_type': (diet_type or 'standard').lower(),
+                        'vector': list(vector),
+                        'created_at': datetime.utcnow()
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"Recipe corpus write failed: {e}")
+        return True
+
+    def nearest(self, meal_macros, diet_type="Standard", excluded_ingredients=None, k=3):
+        """
+        Up to `k` stored recipes of `diet_type` containing no excluded
+        ingredient, closest to `meal_macros` first, as (distance, recipe).
+        Distance is the RMS of per-macro relative errors.
+        """
+        import numpy as np
+        self._sync()
+        target = recipe_vector(meal_macros)
+        if target is None:
+            return []
+
+        with self._lock:
+            n = self._size
+            code = self._diets.get((diet_type or 'standard').lower())
+            if not n or code is None:
+                return []
+            vectors = self._vectors[:n]
+            mask = self._diet_codes[:n] == code
+            for excluded in excluded_ingredients or []:
+                # A multi-word dislike ("chicken breast") matches recipes with all its words
+                postings = [self._postings.get(word, ()) for word in ingredient_terms(excluded)]
+                if not postings or not all(postings):
+                    continue
+                hit = np.zeros(n, dtype=bool)
+                hit[postings[0]] = True
+                for positions in postings[1:]:
+                    also = np.zeros(n, dtype=bool)
+                    also[positions] = True
+                    hit &= also
+                mask &= ~hit
+            candidates = np.flatnonzero(mask)
+            recipes = self._recipes
+
+        if not len(candidates):
+            return []
+        target = np.asarray(target, dtype=np.float32)
+        scale = np.maximum(target, np.asarray(MACRO_FLOORS, dtype=np.float32))
+        errors = (vectors[candidates] - target) / scale
+        distances = np.sqrt(np.mean(errors * errors, axis=1))
+        k = min(k, len(candidates))
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best])]
+        return [(float(distances[i]), recipes[candidates[i]]) for i in best]
+
+    def match(self, meal_macros, diet_type="Standard", excluded_ingredients=None):
+        """
+        The closest stored recipe if it is within max_distance, else None.
+        """
+        found = self.nearest(meal_macros, diet_type, excluded_ingredients, k=1)
+        if found and found[0][0] <= self.max_distance:
+            self.hits += 1
+            return found[0][1]
+        self.misses += 1
+        return None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
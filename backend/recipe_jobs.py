@@ -0,0 +1,165 @@
+import os
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RECIPE_JOB_WORKERS = int(os.getenv('RECIPE_JOB_WORKERS', 4))
+RECIPE_JOB_MAX_PENDING = int(os.getenv('RECIPE_JOB_MAX_PENDING', 64))
+RECIPE_JOB_TIMEOUT = 300  # Seconds before an in-flight job is considered abandoned
+RECIPE_JOB_RETENTION = 24 * 3600  # Seconds finished jobs are kept for polling
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MongoJobStore:
+    """
+    Job state in Mongo so any worker can answer a poll. While a job is queued
+    or running it holds a unique `inflight_key`, which is how identical
+    requests from any process find and share it (see indexes.INDEXES).
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def create(self, key):
+        """
+        Returns (job_id, created). If an identical job is in flight its id is returned instead.
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        try:
+            self.collection.insert_one({
+                '_id': job_id,
+                'inflight_key': key,
+                'key': key,
+                'status': 'queued',
+                'created_at': now
+            })
+            return job_id, True
+        except DuplicateKeyError:
+            existing = self.collection.find_one({'inflight_key': key}, {'_id': 1, 'created_at': 1})
+            if existing and existing['created_at'] > now - timedelta(seconds=RECIPE_JOB_TIMEOUT):
+                return existing['_id'], False
+            # The worker that owned it died; release the key and try again
+            if existing:
+                self.finish(existing['_id'], error='Job abandoned')
+            return self.create(key)
+
+    def mark_running(self, job_id):
+        self.collection.update_one({'_id': job_id}, {'$set': {'status': 'running', 'started_at': datetime.utcnow()}})
+
+    def finish(self, job_id, result=None, error=None):
+        now = datetime.utcnow()
+        update = {
+            'status': 'error' if error else 'done',
+            'finished_at': now,
+            'expires_at': now + timedelta(seconds=RECIPE_JOB_RETENTION)
+        }
+        if error:
+            update['error'] = error
+        else:
+            update['result'] = result
+        self.collection.update_one({'_id': job_id}, {'$set': update, '$unset': {'inflight_key': ''}})
+
+    def get(self, job_id):
+        return self.collection.find_one({'_id': job_id}, {'inflight_key': 0, 'expires_at': 0})
+
+
+class MemoryJobStore:
+    """
+    In-process job store with the same interface, for tests and single-process runs.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.inflight = {}
+        self._lock = threading.Lock()
+
+    def create(self, key):
+        with self._lock:
+            if key in self.inflight:
+                return self.inflight[key], False
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'_id': job_id, 'key': key, 'status': 'queued', 'created_at': datetime.utcnow()}
+            self.inflight[key] = job_id
+            return job_id, True
+
+    def mark_running(self, job_id):
+        with self._lock:
+            self.jobs[job_id].update(status='running', started_at=datetime.utcnow())
+
+    def finish(self, job_id, result=None, error=None):
+        with self._lock:
+            job = self.jobs[job_id]
+            job.update(status='error' if error else 'done', finished_at=datetime.utcnow())
+            if error:
+                job['error'] = error
+            else:
+                job['result'] = result
+            if self.inflight.get(job['key']) == job_id:
+                del self.inflight[job['key']]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class RecipeJobQueue:
+    """
+    Runs recipe generation on a bounded thread pool. Submitting returns a job
+    id immediately; identical in-flight requests share one upstream call.
+    """
+
+    def __init__(self, store, generate, max_workers=RECIPE_JOB_WORKERS, max_pending=RECIPE_JOB_MAX_PENDING):
+        self.store = store
+        self.generate = generate
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recipe-job')
+
+    def submit(self, key, **kwargs):
+        """
+        Returns (job_id, created). Raises QueueFull when too many jobs are waiting.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise QueueFull()
+        job_id, created = self.store.create(key)
+        if created:
+            with self._lock:
+                self.pending += 1
+            self._executor.submit(self._run, job_id, kwargs)
+        return job_id, created
+
+    def _run(self, job_id, kwargs):
+        try:
+            self.store.mark_running(job_id)
+            result = self.generate(**kwargs)
+            if 'error' in result:
+                self.store.finish(job_id, error=result['error'])
+            else:
+                self.store.finish(job_id, result=result)
+        except Exception as e:
+            logger.error(f"Recipe job {job_id} failed: {e}")
+            try:
+                self.store.finish(job_id, error=str(e))
+            except Exception as e:
+                logger.error(f"Could not record failure of job {job_id}: {e}")
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
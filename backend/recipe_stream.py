@@ -0,0 +1,86 @@
+import json
+from recipe_corpus import recipe_vector
+
+# Helpers for streaming a recipe while the model is still writing it: the
+# completion is one JSON object, and each of its top-level fields can be
+# sent on as soon as its value is closed, long before the whole object is.
+
+REQUIRED_FIELDS = ('name', 'ingredients', 'instructions', 'macros')
+
+
+class RecipeFieldParser:
+    """
+    Incremental scanner over a streamed JSON object. feed() takes the next
+    text delta and returns the (field, value) pairs completed by it, in
+    order. Only string/bracket state is tracked while scanning; each
+    finished member is decoded once with json.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self.closed = False
+
+    def _member(self, end):
+        segment = self.text[self._member_start:end].strip()
+        self._member_start = end + 1
+        if not segment:
+            return []
+        try:
+            return list(json.loads('{' + segment + '}').items())
+        except ValueError:
+            # Left to the final parse of the whole text to report
+            return []
+
+    def feed(self, delta):
+        self.text += delta
+        fields = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '{[':
+                self._depth += 1
+                if self._depth == 1 and c == '{':
+                    self._member_start = i + 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 0 and self._member_start is not None and not self.closed:
+                    fields.extend(self._member(i))
+                    self.closed = True
+            elif c == ',' and self._depth == 1 and self._member_start is not None:
+                fields.extend(self._member(i))
+        self._pos = len(text)
+        return fields
+
+
+def validate_recipe(recipe):
+    """
+    Checks a finished recipe has the fields clients render. Returns it, or
+    raises ValueError naming what is wrong.
+    """
+    if not isinstance(recipe, dict):
+        raise ValueError("Recipe is not a JSON object")
+    missing = [field for field in REQUIRED_FIELDS if field not in recipe]
+    if missing:
+        raise ValueError(f"Recipe is missing {', '.join(missing)}")
+    if not isinstance(recipe['name'], str) or not recipe['name'].strip():
+        raise ValueError("Recipe name is empty")
+    for field in ('ingredients', 'instructions'):
+        if not isinstance(recipe[field], list):
+            raise ValueError(f"Recipe {field} is not a list")
+    if not isinstance(recipe['macros'], dict) or recipe_vector(recipe['macros']) is None:
+        raise ValueError("Recipe macros are not numbers")
+    return recipe
@@ -1,39 +1,103 @@
 
 import os
 import json
+import time
+import asyncio
 import logging
-from mistralai import Mistral
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from recipe_cache import RecipeCache, recipe_cache_key
+from recipe_corpus import RecipeCorpus, RECIPE_CORPUS
+from recipe_stream import RecipeFieldParser, validate_recipe
+from metrics import RECIPE_GENERATION_SECONDS
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL")  # Optional override, e.g. a local stand-in for benchmarks
+MISTRAL_MODEL = "mistral-small-latest"
+DAY_RECIPE_CONCURRENCY = int(os.getenv("DAY_RECIPE_CONCURRENCY", 5))
 
+_client = None
+recipe_cache = RecipeCache()
+recipe_corpus = RecipeCorpus() if RECIPE_CORPUS else None
+upstream_limiter = None  # rate_limit.ConcurrencyLimiter shared by every Mistral call
 
-def generate_recipes_with_mistral(user_profile, daily_macros, meal_name="Meal", diet_type="Standard", excluded_ingredients=None):
+
+def get_client():
     """
-    Generates recipes using Mistral AI based on user macros and preferences.
-    Returns a list of structured recipe objects.
+    Returns the shared Mistral client, created on first use.
     """
-    if not MISTRAL_API_KEY:
-        logger.error("MISTRAL_API_KEY not found.")
-        return {"error": "AI service not configured"}
+    global _client
+    if _client is None:
+        # Imported here: the SDK is slow to import and most requests never call it
+        from mistralai import Mistral
+        _client = Mistral(api_key=MISTRAL_API_KEY, server_url=MISTRAL_SERVER_URL)
+    return _client
 
-    if excluded_ingredients is None:
-        excluded_ingredients = []
 
-    client = Mistral(api_key=MISTRAL_API_KEY)
-    
+def reset_client():
+    """
+    Drops the shared client so the next call creates a fresh one, e.g. in a
+    worker forked from a process that had already used it.
+    """
+    global _client
+    _client = None
+
+
+def configure_recipe_cache(collection):
+    """
+    Attaches the shared Mongo tier to the recipe cache.
+    """
+    recipe_cache.collection = collection
+
+
+def configure_recipe_corpus(collection):
+    """
+    Persists the recipe corpus in `collection`, shared by every worker.
+    """
+    if recipe_corpus is not None:
+        recipe_corpus.collection = collection
+
+
+def configure_upstream_limiter(limiter):
+    """
+    Caps concurrent Mistral calls with `limiter`; None removes the cap.
+    A call that can't get a slot in time raises rate_limit.Overloaded.
+    """
+    global upstream_limiter
+    upstream_limiter = limiter
+
+
+def _meal_macros(daily_macros, meal_macros=None):
+    # Callers that know the meal's share of the day pass it in; otherwise
+    # fall back to an even three-way split of the daily targets.
+    if meal_macros is not None:
+        return {m: meal_macros.get(m) or 0 for m in ('protein', 'fat', 'carbs')}
+    return {m: (daily_macros.get(m) or 0) / 3 for m in ('protein', 'fat', 'carbs')}
+
+
+def recipe_request_key(daily_macros, meal_name="Meal", diet_type="Standard", excluded_ingredients=None, meal_macros=None):
+    """
+    Cache/deduplication key for a generate_recipes_with_mistral call.
+    """
+    return recipe_cache_key(diet_type, meal_name, _meal_macros(daily_macros, meal_macros), excluded_ingredients)
+
+
+def recipe_prompt(meal_name, diet_type, meal_macros, excluded_ingredients):
+    """
+    Builds the recipe prompt for one meal's macro targets.
+    """
     # Construct the prompt
     prompt = f"""
     You are an expert fitness chef. Create a delicious **{diet_type}** recipe for **{meal_name}** that fits these specific requirements:
     
     **Target Macros for this Meal:**
-    - Protein: {daily_macros.get('protein', 0) / 3:.1f}g (Approx)
-    - Fat: {daily_macros.get('fat', 0) / 3:.1f}g (Approx)
-    - Carbs: {daily_macros.get('carbs', 0) / 3:.1f}g (Approx)
+    - Protein: {meal_macros['protein']:.1f}g (Approx)
+    - Fat: {meal_macros['fat']:.1f}g (Approx)
+    - Carbs: {meal_macros['carbs']:.1f}g (Approx)
     
     **Dietary Preferences:**
     - Diet Type: {diet_type}
@@ -59,21 +123,370 @@ def generate_recipes_with_mistral(user_profile, daily_macros, meal_name="Meal",
         "prep_time": "15 mins"
     }}
     """
-    
+    return prompt
+
+
+def generate_recipes_with_mistral(user_profile, daily_macros, meal_name="Meal", diet_type="Standard", excluded_ingredients=None, meal_macros=None):
+    """
+    Generates recipes using Mistral AI based on user macros and preferences.
+    `meal_macros` are this meal's targets (from generate_meal_plan_logic);
+    without them the daily macros are split evenly across three meals.
+    Returns a list of structured recipe objects.
+    """
+    if not MISTRAL_API_KEY:
+        logger.error("MISTRAL_API_KEY not found.")
+        return {"error": "AI service not configured"}
+
+    if excluded_ingredients is None:
+        excluded_ingredients = []
+
+    meal_macros = _meal_macros(daily_macros, meal_macros)
+
+    started = time.perf_counter()
+    cache_key = recipe_cache_key(diet_type, meal_name, meal_macros, excluded_ingredients)
+    cached = recipe_cache.get(cache_key)
+    if cached is not None:
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'cached')
+        return cached
+
+    # A stored recipe with close enough macros saves the upstream call
+    if recipe_corpus is not None:
+        match = recipe_corpus.match(meal_macros, diet_type, excluded_ingredients)
+        if match is not None:
+            RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'corpus')
+            return match
+
+    client = get_client()
+    prompt = recipe_prompt(meal_name, diet_type, meal_macros, excluded_ingredients)
+
+    # Outside the try: Overloaded goes to the caller, which answers 429
+    held = upstream_limiter.acquire() if upstream_limiter else None
     try:
-        response = client.chat.complete(
-            model="mistral-small-latest",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
+        try:
+            response = client.chat.complete(
+                model=MISTRAL_MODEL,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"}
+            )
+        finally:
+            if held is not None:
+                upstream_limiter.release(held)
         
-        content = response.choices[0].message.content
-        recipe_data = json.loads(content)
+        # Checked before caching: the Mongo tier serves it to every worker
+        recipe_data = validate_recipe(json.loads(response.choices[0].message.content))
+        recipe_cache.put(cache_key, recipe_data)
+        if recipe_corpus is not None:
+            recipe_corpus.add(cache_key, recipe_data, diet_type)
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'generated')
+        return recipe_data
+
+    except Exception as e:
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'error')
+        logger.error(f"Mistral AI Error: {e}")
+        return {"error": f"Failed to generate recipe: {str(e)}"}
+
+
+def generate_day_recipes(user_profile, meal_plan, diet_type="Standard", excluded_ingredients=None, max_concurrency=DAY_RECIPE_CONCURRENCY):
+    """
+    Generates one recipe per meal of a day's plan (the output of
+    generate_meal_plan_logic), running the upstream calls concurrently.
+    Returns a list of {'meal', 'recipe'} in plan order; failed meals carry
+    the error dict from generate_recipes_with_mistral as their recipe.
+    """
+    if not meal_plan:
+        return []
+
+    def generate(meal):
+        return generate_recipes_with_mistral(
+            user_profile=user_profile,
+            daily_macros={},
+            meal_name=meal['name'],
+            diet_type=diet_type,
+            excluded_ingredients=excluded_ingredients,
+            meal_macros=meal
+        )
+
+    workers = max(1, min(max_concurrency, len(meal_plan)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='day-recipes') as executor:
+        recipes = list(executor.map(generate, meal_plan))
+
+    return [{'meal': meal, 'recipe': recipe} for meal, recipe in zip(meal_plan, recipes)]
+
+
+def _delta_text(event):
+    # Text added by one streamed completion chunk
+    choices = event.data.choices
+    content = choices[0].delta.content if choices else None
+    if isinstance(content, list):
+        return ''.join(getattr(part, 'text', '') or '' for part in content)
+    return content or ''
+
+
+def _replay(recipe):
+    # A cached or stored recipe goes out as the same events, all at once
+    for field, value in recipe.items():
+        yield 'field', {'field': field, 'value': value}
+    yield 'done', {'recipe': recipe}
+
+
+def _finish(parser, cache_key, diet_type, started):
+    recipe = validate_recipe(json.loads(parser.text))
+    recipe_cache.put(cache_key, recipe)
+    if recipe_corpus is not None:
+        recipe_corpus.add(cache_key, recipe, diet_type)
+    RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'generated')
+    return recipe
+
+
+def _stream_error(e, started):
+    RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'error')
+    logger.error(f"Mistral AI Error: {e}")
+    return {"error": f"Failed to generate recipe: {str(e)}"}
+
+
+def _primed(events):
+    # Runs an upstream event generator to its 'open' event, which is not
+    # sent on. From then on the slot and the stream belong to the suspended
+    # generator: closing it, or dropping it unread, releases both.
+    # Overloaded propagates; a stream that couldn't open returns its error.
+    event, payload = next(events)
+    if event == 'error':
+        events.close()
+        return payload
+    return events
+
+
+async def _primed_async(events):
+    # _primed for async generators; one dropped unread is closed by the
+    # event loop's async generator finalizer
+    event, payload = await events.__anext__()
+    if event == 'error':
+        await events.aclose()
+        return payload
+    return events
+
+
+def stream_recipe_with_mistral(user_profile, daily_macros, meal_name="Meal", diet_type="Standard", excluded_ingredients=None, meal_macros=None):
+    """
+    Streaming counterpart of generate_recipes_with_mistral, same arguments.
+    Returns an iterator of (event, data): a 'field' event {'field', 'value'}
+    for each top-level recipe field as soon as the model has closed it,
+    then 'done' {'recipe'} once the whole recipe parsed and validated, or
+    'error' {'error'}. Cache and corpus hits are replayed the same way.
+    Returns the error dict when the AI service isn't configured or the
+    upstream stream can't be opened; raises Overloaded when no upstream
+    slot is free. Both happen before anything is sent to the client. The
+    slot and the upstream stream are released when the iterator finishes
+    or is closed, read or not.
+    """
+    if not MISTRAL_API_KEY:
+        logger.error("MISTRAL_API_KEY not found.")
+        return {"error": "AI service not configured"}
+
+    if excluded_ingredients is None:
+        excluded_ingredients = []
+
+    meal_macros = _meal_macros(daily_macros, meal_macros)
+
+    started = time.perf_counter()
+    cache_key = recipe_cache_key(diet_type, meal_name, meal_macros, excluded_ingredients)
+    cached = recipe_cache.get(cache_key)
+    if cached is not None:
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'cached')
+        return _replay(cached)
+
+    if recipe_corpus is not None:
+        match = recipe_corpus.match(meal_macros, diet_type, excluded_ingredients)
+        if match is not None:
+            RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'corpus')
+            return _replay(match)
+
+    client = get_client()
+    prompt = recipe_prompt(meal_name, diet_type, meal_macros, excluded_ingredients)
+
+    def events():
+        # Slot and stream are taken inside the generator, so its finally
+        # covers them however early the response is abandoned
+        held = upstream_limiter.acquire() if upstream_limiter else None
+        try:
+            try:
+                stream = client.chat.stream(
+                    model=MISTRAL_MODEL,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    response_format={"type": "json_object"}
+                )
+            except Exception as e:
+                yield 'error', _stream_error(e, started)
+                return
+            with stream:
+                yield 'open', None
+                parser = RecipeFieldParser()
+                try:
+                    for event in stream:
+                        for field, value in parser.feed(_delta_text(event)):
+                            yield 'field', {'field': field, 'value': value}
+                    recipe = _finish(parser, cache_key, diet_type, started)
+                except Exception as e:
+                    yield 'error', _stream_error(e, started)
+                    return
+        finally:
+            if held is not None:
+                upstream_limiter.release(held)
+        yield 'done', {'recipe': recipe}
+
+    return _primed(events())
+
+
+async def generate_recipes_with_mistral_async(user_profile, daily_macros, meal_name="Meal", diet_type="Standard", excluded_ingredients=None, meal_macros=None):
+    """
+    Async counterpart of generate_recipes_with_mistral for the async app:
+    the Mistral call awaits on the event loop instead of holding a thread.
+    Same arguments, cache and return values.
+    """
+    if not MISTRAL_API_KEY:
+        logger.error("MISTRAL_API_KEY not found.")
+        return {"error": "AI service not configured"}
+
+    if excluded_ingredients is None:
+        excluded_ingredients = []
+
+    meal_macros = _meal_macros(daily_macros, meal_macros)
+
+    # The cache's Mongo tier is synchronous; keep it off the event loop
+    started = time.perf_counter()
+    cache_key = recipe_cache_key(diet_type, meal_name, meal_macros, excluded_ingredients)
+    cached = await asyncio.to_thread(recipe_cache.get, cache_key)
+    if cached is not None:
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'cached')
+        return cached
+
+    if recipe_corpus is not None:
+        match = await asyncio.to_thread(recipe_corpus.match, meal_macros, diet_type, excluded_ingredients)
+        if match is not None:
+            RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'corpus')
+            return match
+
+    client = get_client()
+    prompt = recipe_prompt(meal_name, diet_type, meal_macros, excluded_ingredients)
+
+    # Waits on the event loop; no thread is parked while queued for a slot
+    held = await upstream_limiter.acquire_async() if upstream_limiter else None
+    try:
+        try:
+            response = await client.chat.complete_async(
+                model=MISTRAL_MODEL,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"}
+            )
+        finally:
+            if held is not None:
+                await upstream_limiter.release_async(held)
+
+        recipe_data = validate_recipe(json.loads(response.choices[0].message.content))
+        await asyncio.to_thread(recipe_cache.put, cache_key, recipe_data)
+        if recipe_corpus is not None:
+            await asyncio.to_thread(recipe_corpus.add, cache_key, recipe_data, diet_type)
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'generated')
         return recipe_data
 
     except Exception as e:
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, 'error')
         logger.error(f"Mistral AI Error: {e}")
         return {"error": f"Failed to generate recipe: {str(e)}"}
 
+
+async def generate_day_recipes_async(user_profile, meal_plan, diet_type="Standard", excluded_ingredients=None, max_concurrency=DAY_RECIPE_CONCURRENCY):
+    """
+    Async counterpart of generate_day_recipes; at most `max_concurrency`
+    upstream calls are in flight for one day.
+    """
+    if not meal_plan:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def generate(meal):
+        async with semaphore:
+            return await generate_recipes_with_mistral_async(
+                user_profile=user_profile,
+                daily_macros={},
+                meal_name=meal['name'],
+                diet_type=diet_type,
+                excluded_ingredients=excluded_ingredients,
+                meal_macros=meal
+            )
+
+    recipes = await asyncio.gather(*(generate(meal) for meal in meal_plan))
+    return [{'meal': meal, 'recipe': recipe} for meal, recipe in zip(meal_plan, recipes)]
+
+
+async def stream_recipe_with_mistral_async(user_profile, daily_macros, meal_name="Meal", diet_type="Standard", excluded_ingredients=None, meal_macros=None):
+    """
+    Async counterpart of stream_recipe_with_mistral: returns an async
+    iterator of the same (event, data) pairs, or the error dict.
+    """
+    if not MISTRAL_API_KEY:
+        logger.error("MISTRAL_API_KEY not found.")
+        return {"error": "AI service not configured"}
+
+    if excluded_ingredients is None:
+        excluded_ingredients = []
+
+    meal_macros = _meal_macros(daily_macros, meal_macros)
+
+    started = time.perf_counter()
+    cache_key = recipe_cache_key(diet_type, meal_name, meal_macros, excluded_ingredients)
+    found = await asyncio.to_thread(recipe_cache.get, cache_key)
+    outcome = 'cached'
+    if found is None and recipe_corpus is not None:
+        found = await asyncio.to_thread(recipe_corpus.match, meal_macros, diet_type, excluded_ingredients)
+        outcome = 'corpus'
+    if found is not None:
+        RECIPE_GENERATION_SECONDS.observe(time.perf_counter() - started, outcome)
+
+        async def replay():
+            for event in _replay(found):
+                yield event
+        return replay()
+
+    client = get_client()
+    prompt = recipe_prompt(meal_name, diet_type, meal_macros, excluded_ingredients)
+
+    async def events():
+        held = await upstream_limiter.acquire_async() if upstream_limiter else None
+        try:
+            try:
+                stream = await client.chat.stream_async(
+                    model=MISTRAL_MODEL,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    response_format={"type": "json_object"}
+                )
+            except Exception as e:
+                yield 'error', _stream_error(e, started)
+                return
+            async with stream:
+                yield 'open', None
+                parser = RecipeFieldParser()
+                try:
+                    async for event in stream:
+                        for field, value in parser.feed(_delta_text(event)):
+                            yield 'field', {'field': field, 'value': value}
+                    # The cache's Mongo tier and the corpus write are synchronous
+                    recipe = await asyncio.to_thread(_finish, parser, cache_key, diet_type, started)
+                except Exception as e:
+                    yield 'error', _stream_error(e, started)
+                    return
+        finally:
+            if held is not None:
+                await upstream_limiter.release_async(held)
+        yield 'done', {'recipe': recipe}
+
+    return await _primed_async(events())
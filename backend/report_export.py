@@ -0,0 +1,168 @@
+import io
+import os
+import re
+import time
+import logging
+import zipfile
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from pymongo.errors import DuplicateKeyError
+
+from reports import render_updates_report, SERIES_REPORT_PROJECTION
+from update_history import series_report_rows
+
+logger = logging.getLogger(__name__)
+
+# Bulk export of every user's update report as one zip. The parent reads
+# users and their series a shard at a time; rendering (CPU-bound, GIL-bound
+# in one process) runs in a process pool, one shard per task, and the PDFs
+# come back as bytes to be appended to the archive.
+
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'balance-bite-exports'))
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', os.cpu_count() or 1))
+EXPORT_SHARD_SIZE = int(os.getenv('EXPORT_SHARD_SIZE', 25))  # Users per pool task
+EXPORT_STALE_AFTER = int(os.getenv('EXPORT_STALE_AFTER', 600))  # Seconds without progress before a running export counts as dead
+
+# The job's state is one document in admin_jobs, so whichever worker an
+# admin reaches can report progress and serve the zip from EXPORT_DIR.
+EXPORT_JOB_ID = 'report_export'
+
+
+def export_path(job_id, directory=EXPORT_DIR):
+    return os.path.join(directory, f"reports-{job_id}.zip")
+
+
+def claim_export(jobs, period, directory=EXPORT_DIR):
+    """
+    Atomically marks the export as running and returns the new job document,
+    or None while another worker's export is running. A running export that
+    has made no progress for EXPORT_STALE_AFTER seconds is taken over.
+    The previous export's zip is removed.
+    """
+    now = datetime.utcnow()
+    job = {'status': 'running', 'period': period, 'exported': 0, 'failed': 0, 'started_at': now,
+           'updated_at': now, 'path': export_path(now.strftime('%Y%m%d%H%M%S'), directory)}
+    claimable = {'_id': EXPORT_JOB_ID, '$or': [
+        {'status': {'$ne': 'running'}},
+        {'updated_at': {'$lt': now - timedelta(seconds=EXPORT_STALE_AFTER)}}
+    ]}
+    try:
+        # No match with the document present means it is running: the upsert collides on _id
+        previous = jobs.find_one_and_replace(claimable, job, upsert=True)
+    except DuplicateKeyError:
+        return None
+    stale = previous and previous.get('path')
+    if stale and stale != job['path'] and os.path.exists(stale):
+        os.remove(stale)
+    return {'_id': EXPORT_JOB_ID, **job}
+
+
+def update_export(jobs, path, **fields):
+    """
+    Records progress or the outcome of the export writing `path`; a no-op
+    once another worker has taken the job over.
+    """
+    jobs.update_one({'_id': EXPORT_JOB_ID, 'path': path}, {'$set': {**fields, 'updated_at': datetime.utcnow()}})
+
+
+def export_status(jobs):
+    return jobs.find_one({'_id': EXPORT_JOB_ID}) or {'status': 'idle'}
+
+
+def _archive_name(uid):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(uid)) + '.pdf'
+
+
+def render_shard(shard, period):
+    """
+    Pool task: renders [(uid, series docs)] and returns [(uid, pdf bytes)].
+    Module-level so it pickles; touches no Mongo or app state.
+    """
+    rendered = []
+    for uid, docs in shard:
+        buffer = io.BytesIO()
+        render_updates_report(uid, series_report_rows(docs), buffer, period)
+        rendered.append((uid, buffer.getvalue()))
+    return rendered
+
+
+def iter_shards(users_collection, series_collection, period, shard_size):
+    """
+    Yields lists of (uid, series docs newest first): one users query page
+    and one series query per shard.
+    """
+    uids = []
+    for user in users_collection.find({}, {'_id': 1}).sort('_id', 1):
+        uids.append(user['_id'])
+        if len(uids) == shard_size:
+            yield _shard(series_collection, uids, period)
+            uids = []
+    if uids:
+        yield _shard(series_collection, uids, period)
+
+
+def _shard(series_collection, uids, period):
+    docs = {uid: [] for uid in uids}
+    cursor = series_collection.find(
+        {'user_id': {'$in': uids}, 'period': period}, {**SERIES_REPORT_PROJECTION, 'user_id': 1}
+    ).sort([('user_id', 1), ('period', 1), ('start', -1)])
+    for doc in cursor:
+        docs[doc.pop('user_id')].append(doc)
+    return list(docs.items())
+
+
+def run_export(users_collection, series_collection, path, period='week', workers=EXPORT_WORKERS,
+               shard_size=EXPORT_SHARD_SIZE, progress=None):
+    """
+    Renders every user's report into a zip at `path`. At most two shards
+    per worker are in flight, so memory stays bounded. Calls
+    progress(stats) after each shard; returns the final stats.
+    """
+    stats = {'total': users_collection.count_documents({}), 'exported': 0, 'failed': 0, 'bytes': 0}
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+
+    # spawn, not fork: the parent holds Mongo sockets and threads
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as archive:  # PDFs are already compressed
+            pending = {}
+            shards = iter_shards(users_collection, series_collection, period, shard_size)
+
+            def collect(done):
+                for future in done:
+                    size = pending.pop(future)
+                    try:
+                        for uid, pdf in future.result():
+                            archive.writestr(_archive_name(uid), pdf)
+                            stats['exported'] += 1
+                            stats['bytes'] += len(pdf)
+                    except Exception as e:
+                        logger.error(f"Report export shard failed: {e}")
+                        stats['failed'] += size
+                stats['elapsed'] = round(time.perf_counter() - started, 2)
+                if progress:
+                    progress(dict(stats))
+
+            for shard in shards:
+                pending[pool.submit(render_shard, shard, period)] = len(shard)
+                if len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    stats['elapsed'] = round(time.perf_counter() - started, 2)
+    stats['users_per_sec'] = round(stats['exported'] / stats['elapsed'], 1) if stats['elapsed'] else None
+    return stats
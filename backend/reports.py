@@ -0,0 +1,209 @@
+import os
+import glob
+import hashlib
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from metrics import REPORT_RENDER_SECONDS
+
+# reportlab is imported on first render; most processes never draw a PDF
+
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'balance-bite-reports'))
+REPORT_FETCH_ROWS = 500  # Cursor batch size
+REPORT_ROWS_PER_TABLE = 36  # About one A4 page at font size 8, so tables never need splitting
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Only the fields the report prints (from the downsampled series, see update_history)
+SERIES_REPORT_PROJECTION = {'_id': 0, 'start': 1, 'count': 1, 'weight_sum': 1, 'last': 1}
+
+UPDATE_REPORT_HEADERS = ["Date", "Weight", "Goal", "Activity", "Cal", "P", "F", "C"]
+UPDATE_REPORT_COL_WIDTHS = [62, 45, 70, 90, 45, 38, 38, 38]
+
+
+@lru_cache(maxsize=None)
+def update_report_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 8), # Smaller font to fit more columns
+    ])
+
+
+def update_report_row(u):
+    # Format date safely
+    date_str = u['updated_at'].strftime('%Y-%m-%d') if isinstance(u['updated_at'], datetime) else str(u['updated_at'])
+
+    # Handle missing keys for backward compatibility
+    goal_val = u.get('goal', 'N/A')
+    cal_val = u.get('target_calories', u.get('tdee', 0))
+
+    return [
+        date_str,
+        str(u['weight']),
+        goal_val,
+        u['activity_level'],
+        f"{int(cal_val)}",
+        f"{int(u['protein'])}",
+        f"{int(u['fat'])}",
+        f"{int(u['carbs'])}"
+    ]
+
+
+@lru_cache(maxsize=None)
+def _streaming_doc_template():
+    from reportlab.platypus import BaseDocTemplate, PageTemplate, Frame
+
+    class StreamingDocTemplate(BaseDocTemplate):
+        """
+        A one-frame A4 document built from an iterable of flowable lists.
+        Each list is laid out before the next one is pulled, so only a
+        page or two of tables exist at any time. The build loop is
+        BaseDocTemplate.build's, minus its progress callbacks and
+        page-break bookkeeping, over the same build hooks
+        (multiBuild drives them the same way).
+        """
+
+        def __init__(self, out, **kwargs):
+            super().__init__(out, **kwargs)
+            frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+            self.addPageTemplates([PageTemplate(id='Page', frames=frame, pagesize=self.pagesize)])
+
+        def build(self, chunks):
+            self._startBuild()
+            canv = self.canv
+            canv._doctemplate = self
+            try:
+                for chunk in chunks:
+                    flowables = list(chunk)
+                    while flowables:
+                        self.clean_hanging()
+                        self.handle_flowable(flowables)
+            finally:
+                del canv._doctemplate
+            self._endBuild()
+
+    return StreamingDocTemplate
+
+
+def _update_tables(updates):
+    rows = []
+    for u in updates:
+        rows.append(update_report_row(u))
+        if len(rows) == REPORT_ROWS_PER_TABLE:
+            yield [_update_table(rows)]
+            rows = []
+    if rows:
+        yield [_update_table(rows)]
+
+
+def _update_table(rows):
+    from reportlab.platypus import Table
+    table = Table([UPDATE_REPORT_HEADERS] + rows, colWidths=UPDATE_REPORT_COL_WIDTHS, repeatRows=1)
+    table.setStyle(update_report_style())
+    return table
+
+
+def render_updates_report(uid, updates, out, period=None):
+    """
+    Renders the user updates report into `out` (a path or binary file),
+    one row per update, or per week/month when `period` is given.
+    `updates` can be any iterable, e.g. a cursor; rows are turned into
+    page-sized tables as the document is laid out. Returns the page count.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph
+
+    styles = getSampleStyleSheet()
+    header = [
+        Paragraph("User Updates Report", styles['Title']),
+        Paragraph(f"User ID: {uid}", styles['Normal']),
+    ]
+    if period:
+        header.append(Paragraph(f"One row per {period}: average weight, targets as of the {period}'s last update", styles['Normal']))
+
+    def chunks():
+        yield header
+        yield from _update_tables(updates)
+
+    doc = _streaming_doc_template()(out, pagesize=A4)
+    doc.build(chunks())
+    return doc.page
+
+
+class ReportCache:
+    """
+    Rendered PDFs on disk, one file per user keyed by their report version
+    (the latest `updated_at`). Writing a new version removes older ones.
+    """
+
+    def __init__(self, directory=REPORT_CACHE_DIR):
+        self.directory = directory
+
+    def _prefix(self, uid):
+        return os.path.join(self.directory, hashlib.sha1(uid.encode()).hexdigest())
+
+    def path(self, uid, version):
+        return f"{self._prefix(uid)}-{version}.pdf"
+
+    def get(self, uid, version):
+        path = self.path(uid, version)
+        return path if os.path.exists(path) else None
+
+    def open(self, uid, version):
+        """
+        The cached PDF opened for reading, or None. The open file stays
+        readable even if a newer version's render removes the path.
+        """
+        try:
+            return open(self.path(uid, version), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def render(self, uid, version, updates, period=None):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(uid, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            # Includes reading the rows, which the render consumes lazily
+            with os.fdopen(fd, 'wb') as f, REPORT_RENDER_SECONDS.time():
+                render_updates_report(uid, updates, f, period)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        for old in glob.glob(f"{self._prefix(uid)}-*.pdf"):
+            if old != path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        return path
+
+
+def report_version(latest_update):
+    if not latest_update:
+        return 'empty'
+    updated_at = latest_update.get('updated_at')
+    if isinstance(updated_at, datetime):
+        return updated_at.strftime('%Y%m%d%H%M%S%f')
+    return hashlib.sha1(str(updated_at).encode()).hexdigest()[:16]
+
+
+def stream_file(f, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Yields an open binary file in chunks and closes it. Taking the file
+    rather than a path means the response streams the same file its
+    Content-Length (os.fstat) was taken from.
+    """
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
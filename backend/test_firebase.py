@@ -1,5 +1,6 @@
 
-from firebase_config import verify_token
+from firebase_config import init_firebase, verify_token
 import firebase_admin
+init_firebase()
 print("Firebase App Name:", firebase_admin.get_app().name)
 print("Backend verification successful.")
@@ -0,0 +1,78 @@
+"""
+Shared helpers for the tests_*.py scripts and the offline benchmarks.
+"""
+import os
+import mongomock
+from pymongo import MongoClient
+from pymongo.errors import ServerSelectionTimeoutError
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+TEST_DB_NAME = 'meal_plan_db_test'
+
+
+def _accept_bulk_sort():
+    # pymongo >= 4.11 passes `sort` to bulk update/replace builders, which
+    # mongomock 4.3 doesn't accept; it only matters for updateOne on many matches
+    builder = mongomock.collection.BulkOperationBuilder
+    for name in ('add_update', 'add_replace'):
+        method = getattr(builder, name)
+        if getattr(method, 'accepts_sort', False):
+            continue
+        def accepting(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        accepting.accepts_sort = True
+        setattr(builder, name, accepting)
+
+
+def mongomock_client():
+    """
+    An in-memory MongoClient that accepts the bulk writes the app sends.
+    """
+    _accept_bulk_sort()
+    return mongomock.MongoClient()
+
+
+def memory_collection(name='test', docs=()):
+    """
+    A fresh in-memory collection holding `docs`, standing in for a driver
+    collection with real query, sort and bulk write semantics.
+    """
+    collection = mongomock_client()[TEST_DB_NAME][name]
+    if docs:
+        collection.insert_many([dict(doc) for doc in docs])
+    return collection
+
+
+class CountingCollection:
+    """
+    Records the server command behind each collection call; every method
+    counted here is one round trip. Works over pymongo and mongomock alike.
+    """
+
+    COMMANDS = {'find_one': 'find', 'find_one_and_update': 'findAndModify', 'update_one': 'update',
+                'bulk_write': 'update', 'insert_one': 'insert', 'insert_many': 'insert'}
+
+    def __init__(self, collection, commands):
+        self.collection = collection
+        self.commands = commands
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if name not in self.COMMANDS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self.commands.append(self.COMMANDS[name])
+            return attr(*args, **kwargs)
+        return counted
+
+
+def get_test_db(name=TEST_DB_NAME):
+    # A local mongod when there is one, else an in-memory mongomock
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except ServerSelectionTimeoutError:
+        print(f"No MongoDB at {MONGO_URI}, using mongomock.")
+        return mongomock_client()[name]
+    return client[name]
@@ -1,6 +1,16 @@
 
-from recipes import generate_recipes_with_mistral
+import recipes
+from recipes import generate_recipes_with_mistral, generate_day_recipes
+from recipe_cache import RecipeCache, recipe_cache_key
+from recipe_corpus import RecipeCorpus, ingredient_terms
+from recipe_stream import RecipeFieldParser, validate_recipe
+from calculations import generate_meal_plan_logic
+from types import SimpleNamespace
+import json
 import os
+import time
+import asyncio
+import threading
 
 def test_ai_generation():
     print("--- Testing AI Recipe Generation ---")
@@ -21,5 +31,433 @@ def test_ai_generation():
     else:
         print("WARNING: Unexpected response.")
 
+def test_recipe_cache():
+    print("\n--- Testing Recipe Cache ---")
+
+    # Macros in the same bucket and reordered exclusions share a key
+    key = recipe_cache_key('Vegan', 'Lunch', {'protein': 40.2, 'fat': 20.9, 'carbs': 60}, ['Tofu', 'nuts'])
+    same = recipe_cache_key('vegan', 'lunch', {'protein': 39.1, 'fat': 21.4, 'carbs': 61}, ['nuts', 'tofu'])
+    other = recipe_cache_key('Vegan', 'Lunch', {'protein': 55, 'fat': 20, 'carbs': 60}, ['nuts', 'tofu'])
+    assert key == same and key != other
+
+    cache = RecipeCache(max_size=2, ttl=60)
+    assert cache.get(key) is None
+    cache.put(key, {'name': 'Tofu Bowl'})
+
+    start = time.perf_counter()
+    recipe = cache.get(key)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Hit in {elapsed_ms:.3f}ms: {recipe}")
+    print(f"Stats: {cache.stats()}")
+    assert recipe['name'] == 'Tofu Bowl'
+    assert cache.stats()['llm_calls_saved'] == 1
+
+class FakeMistralClient:
+    """
+    Minimal stand-in for the Mistral client with a fixed per-call latency.
+    """
+
+    def __init__(self, latency=0.3):
+        self.latency = latency
+        self.prompts = []
+        self.chat = self
+
+    def complete(self, model, messages, response_format):
+        self.prompts.append(messages[0]['content'])
+        time.sleep(self.latency)
+        content = json.dumps({'name': 'Test Recipe', 'ingredients': [], 'instructions': [],
+                              'macros': {'protein': 30, 'fat': 10, 'carbs': 40}})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def test_day_recipes_concurrent():
+    print("\n--- Testing Whole-Day Recipe Generation ---")
+
+    fake = FakeMistralClient(latency=0.3)
+    saved = recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus
+    recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache = fake, 'test-key', RecipeCache()
+    recipes.recipe_corpus = RecipeCorpus()
+    try:
+        daily = {'calories': 2500, 'protein': 200, 'fat': 70, 'carbs': 260}
+        meal_plan = generate_meal_plan_logic(daily, 5)
+
+        start = time.perf_counter()
+        results = generate_day_recipes({'name': 'Test User'}, meal_plan, max_concurrency=5)
+        elapsed = time.perf_counter() - start
+        print(f"5 meals in {elapsed:.2f}s (one call takes {fake.latency}s)")
+
+        assert [r['meal']['name'] for r in results] == [m['name'] for m in meal_plan]
+        assert all(r['recipe']['name'] == 'Test Recipe' for r in results)
+        assert elapsed < fake.latency * 2
+
+        # Each prompt carries that meal's share, not a third of the day
+        snack_prompt = next(p for p in fake.prompts if '**Snack 1**' in p)
+        assert f"Protein: {meal_plan[2]['protein']:.1f}g" in snack_prompt
+        print("SUCCESS: Meals generated concurrently with per-meal targets.")
+    finally:
+        recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus = saved
+
+def corpus_recipe(name, protein, fat, carbs, ingredients):
+    return {'name': name, 'ingredients': ingredients, 'instructions': [],
+            'macros': {'protein': protein, 'fat': fat, 'carbs': carbs, 'calories': 4 * protein + 4 * carbs + 9 * fat}}
+
+def test_recipe_corpus():
+    print("\n--- Testing Recipe Corpus Search ---")
+    assert ingredient_terms("200g Chicken Breasts, chopped") == ['chicken', 'breast']
+
+    corpus = RecipeCorpus(max_distance=0.1)
+    corpus.add('a', corpus_recipe('Chicken Rice', 40, 10, 60, ['150g Chicken Breast', '1 cup Rice']), 'Standard')
+    corpus.add('b', corpus_recipe('Salmon Rice', 36, 11, 56, ['150g Salmon', '1 cup Rice']), 'Standard')
+    corpus.add('c', corpus_recipe('Tofu Bowl', 40, 10, 60, ['200g Tofu', 'Peanuts']), 'Vegan')
+    corpus.add('d', corpus_recipe('Steak', 60, 30, 5, ['Beef Steak']), 'Standard')
+    assert not corpus.add('e', {'name': 'No macros', 'macros': {}}, 'Standard')
+    assert len(corpus) == 4
+
+    target = {'protein': 40, 'fat': 11, 'carbs': 60}
+    found = corpus.nearest(target, 'standard', k=3)
+    print([(round(d, 3), r['name']) for d, r in found])
+    assert [r['name'] for _, r in found] == ['Chicken Rice', 'Salmon Rice', 'Steak']
+    assert [r['name'] for _, r in corpus.nearest(target, 'Vegan')] == ['Tofu Bowl']
+    assert corpus.nearest(target, 'Keto') == []
+
+    # Dislikes filter by ingredient words; a multi-word dislike needs all its words
+    assert corpus.match(target, 'Standard', ['chicken'])['name'] == 'Salmon Rice'
+    assert corpus.match(target, 'Standard', ['chicken breast'])['name'] == 'Salmon Rice'
+    assert corpus.match(target, 'Standard', ['chicken thigh'])['name'] == 'Chicken Rice'
+    assert corpus.match(target, 'Vegan', ['peanut']) is None
+    # Too far from anything stored
+    assert corpus.match({'protein': 10, 'fat': 40, 'carbs': 10}, 'Standard') is None
+
+    # Vectorized search stays in the millisecond range on a large corpus
+    for i in range(50000):
+        corpus.add(f'bulk-{i}', corpus_recipe(f'Bulk {i}', 20 + i % 50, 5 + i % 30, 20 + i % 90, [f'Item {i % 500}']), 'Standard')
+    start = time.perf_counter()
+    for _ in range(20):
+        corpus.nearest(target, 'Standard', ['item'], k=5)
+    per_search = (time.perf_counter() - start) / 20
+    print(f"Search over {len(corpus)} recipes: {per_search * 1000:.2f}ms")
+    assert per_search < 0.05
+    print("SUCCESS: Nearest recipes found with diet and ingredient filters.")
+
+def test_corpus_saves_upstream_calls():
+    print("\n--- Testing Corpus Before LLM ---")
+    class CorpusMistral(FakeMistralClient):
+        def complete(self, model, messages, response_format):
+            self.prompts.append(messages[0]['content'])
+            content = json.dumps(corpus_recipe('Generated', 40, 12, 60, ['Chicken Breast', 'Rice']))
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    fake = CorpusMistral(latency=0)
+    saved = recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus
+    recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache = fake, 'test-key', RecipeCache()
+    recipes.recipe_corpus = RecipeCorpus()
+    try:
+        meal = {'protein': 40, 'fat': 12, 'carbs': 60}
+        first = generate_recipes_with_mistral({}, {}, 'Lunch', meal_macros=meal)
+        # Different bucket, so a cache miss, but within the corpus distance
+        second = generate_recipes_with_mistral({}, {}, 'Dinner', meal_macros={'protein': 42, 'fat': 12, 'carbs': 63})
+        assert first['name'] == second['name'] == 'Generated'
+        assert len(fake.prompts) == 1
+
+        # Excluding one of its ingredients sends the request upstream
+        generate_recipes_with_mistral({}, {}, 'Dinner', excluded_ingredients=['rice'], meal_macros=meal)
+        assert len(fake.prompts) == 2
+        print(f"Corpus stats: {recipes.recipe_corpus.stats()}")
+        print("SUCCESS: Close targets served from the corpus.")
+    finally:
+        recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus = saved
+
+def serve_fake_stream(content, chunk_size=8, delay=0.02):
+    """
+    Local stand-in for Mistral's streaming chat endpoint: sends `content`
+    as SSE completion chunks of `chunk_size` characters, `delay` apart.
+    Returns (server_url, server).
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for i in range(0, len(content), chunk_size):
+                chunk = {'id': 'fake', 'object': 'chat.completion.chunk', 'model': 'mistral-small-latest', 'created': 0,
+                         'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': content[i:i + chunk_size]},
+                                      'finish_reason': None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server
+
+def read_events(body):
+    events = []
+    for block in body.decode().strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+def test_recipe_field_parser():
+    print("\n--- Testing Streamed Recipe Field Parser ---")
+    recipe = {'name': 'Tofu, "Crispy" {Bowl}', 'description': 'Back\\slash', 'ingredients': ['200g Tofu', '1 cup Rice'],
+              'instructions': ['Press, then fry.'], 'macros': {'protein': 30, 'fat': 10, 'carbs': 40, 'calories': 370},
+              'prep_time': '15 mins'}
+    text = json.dumps(recipe, indent=2)
+    for size in (1, 3, 7, len(text)):
+        parser = RecipeFieldParser()
+        fields = []
+        for i in range(0, len(text), size):
+            fields.extend(parser.feed(text[i:i + size]))
+        assert fields == list(recipe.items()), fields
+    # Each field is out as soon as the next one starts, not at the end
+    parser = RecipeFieldParser()
+    assert parser.feed(text[:text.index('"description"')]) == [('name', recipe['name'])]
+    assert validate_recipe(recipe) is recipe
+    for broken in ({'name': 'x'}, {**recipe, 'macros': {'protein': 'lots'}}, {**recipe, 'ingredients': 'tofu'}):
+        try:
+            validate_recipe(broken)
+            assert False, broken
+        except ValueError as e:
+            print(f"Rejected: {e}")
+    print("SUCCESS: Fields parsed incrementally and finished recipes validated.")
+
+def test_streaming_route():
+    print("\n--- Testing SSE Recipe Streaming ---")
+    from mistralai import Mistral
+    import app as app_module
+    from rate_limit import RateLimiter, MemoryBucketStore
+
+    recipe = corpus_recipe('Streamed Salmon', 35, 15, 50, ['150g Salmon', '1 cup Quinoa'])
+    recipe['instructions'] = ['Bake the salmon.', 'Cook the quinoa.']
+    content = json.dumps(recipe)
+    url, server = serve_fake_stream(content, chunk_size=8, delay=0.02)
+    full_time = len(content) / 8 * 0.02
+
+    user = {'_id': 'sam', 'diet_type': 'Standard', 'total_protein': 150, 'total_fat': 60, 'total_carbs': 200}
+    saved_recipes = recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus
+    saved_app = app_module.verify_token, app_module.user_store, app_module.ai_rate_limiter
+    recipes._client, recipes.MISTRAL_API_KEY = Mistral(api_key='test-key', server_url=url), 'test-key'
+    recipes.recipe_cache, recipes.recipe_corpus = RecipeCache(), RecipeCorpus()
+    app_module.verify_token = lambda token: {'uid': token}
+    app_module.user_store = type('OneUser', (), {'get': lambda self, uid: user})()
+    app_module.ai_rate_limiter = RateLimiter(MemoryBucketStore(), per_minute=60, burst=10)
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer sam', 'Accept': 'text/event-stream'}
+        start = time.perf_counter()
+        response = client.post('/api/ai/generate-recipes', json={'meal_name': 'Dinner'}, headers=headers, buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        chunks, arrivals = [], []
+        for chunk in response.response:
+            chunks.append(chunk)
+            arrivals.append(time.perf_counter() - start)
+        print(f"First event after {arrivals[0] * 1000:.0f}ms, last after {arrivals[-1] * 1000:.0f}ms "
+              f"(full completion takes ~{full_time * 1000:.0f}ms)")
+        events = read_events(b''.join(chunks))
+        assert [e for e, _ in events] == ['field'] * len(recipe) + ['done']
+        assert [d['field'] for _, d in events[:-1]] == list(recipe)
+        assert events[-1][1]['recipe'] == recipe
+        assert events[0][1] == {'field': 'name', 'value': 'Streamed Salmon'}
+        assert arrivals[0] < full_time / 3
+
+        # Finished recipes are cached: the second request replays them at once
+        again = read_events(client.post('/api/ai/generate-recipes?stream=1', json={'meal_name': 'Dinner'},
+                                        headers={'Authorization': 'Bearer sam'}).get_data())
+        assert again == events
+
+        # The async path streams the same events
+        async def consume():
+            recipes.recipe_cache, recipes.recipe_corpus = RecipeCache(), RecipeCorpus()
+            stream = await recipes.stream_recipe_with_mistral_async({}, {}, 'Dinner', meal_macros=recipe['macros'])
+            return [event async for event in stream]
+        assert asyncio.run(consume()) == events
+    finally:
+        server.shutdown()
+        recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus = saved_recipes
+        app_module.verify_token, app_module.user_store, app_module.ai_rate_limiter = saved_app
+    print("SUCCESS: Fields streamed as they complete; validated recipe at the end.")
+
+def test_streaming_invalid_recipe():
+    print("\n--- Testing SSE Stream With an Invalid Recipe ---")
+    from mistralai import Mistral
+    url, server = serve_fake_stream(json.dumps({'name': 'Half a recipe', 'ingredients': []}), delay=0)
+    saved = recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus
+    recipes._client, recipes.MISTRAL_API_KEY = Mistral(api_key='test-key', server_url=url), 'test-key'
+    recipes.recipe_cache, recipes.recipe_corpus = RecipeCache(), RecipeCorpus()
+    try:
+        events = list(recipes.stream_recipe_with_mistral({}, {}, 'Lunch', meal_macros={'protein': 30, 'fat': 10, 'carbs': 40}))
+        print(events[-1])
+        assert [e for e, _ in events] == ['field', 'field', 'error']
+        assert 'missing instructions, macros' in events[-1][1]['error']
+        assert recipes.recipe_cache.stats()['size'] == 0  # Not cached
+    finally:
+        server.shutdown()
+        recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus = saved
+    print("SUCCESS: Invalid recipe ends the stream with an error event.")
+
+class FakeChatStream:
+    """
+    Upstream completion stream for one recipe; records whether it was closed.
+    """
+
+    def __init__(self, recipe):
+        self.text = json.dumps(recipe)
+        self.closed = False
+
+    def _events(self):
+        for i in range(0, len(self.text), 16):
+            delta = SimpleNamespace(content=self.text[i:i + 16])
+            yield SimpleNamespace(data=SimpleNamespace(choices=[SimpleNamespace(delta=delta)]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+    def __iter__(self):
+        return self._events()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def __aiter__(self):
+        for event in self._events():
+            yield event
+
+
+class FakeStreamingChat:
+    def __init__(self, recipe, fail=False):
+        self.recipe = recipe
+        self.fail = fail
+        self.streams = []
+
+    def stream(self, **kwargs):
+        if self.fail:
+            raise ConnectionError("upstream unreachable")
+        self.streams.append(FakeChatStream(self.recipe))
+        return self.streams[-1]
+
+    async def stream_async(self, **kwargs):
+        return self.stream(**kwargs)
+
+def test_unread_stream_releases_slot():
+    print("\n--- Testing Unread Streams Release Their Slot ---")
+    import gc
+    import app as app_module
+    from rate_limit import ConcurrencyLimiter, MemorySlots, RateLimiter, MemoryBucketStore, Overloaded
+
+    recipe = corpus_recipe('Unread Bowl', 30, 10, 40, ['Rice'])
+    macros = recipe['macros']
+    chat = FakeStreamingChat(recipe)
+    limiter = ConcurrencyLimiter(MemorySlots(1), max_waiting=4, timeout=0.05)
+    user = {'_id': 'ursula', 'diet_type': 'Standard', 'total_protein': 150, 'total_fat': 60, 'total_carbs': 200}
+    saved_recipes = (recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus,
+                     recipes.upstream_limiter)
+    saved_app = app_module.verify_token, app_module.user_store, app_module.ai_rate_limiter
+    recipes._client, recipes.MISTRAL_API_KEY = SimpleNamespace(chat=chat), 'test-key'
+    recipes.recipe_cache, recipes.recipe_corpus, recipes.upstream_limiter = RecipeCache(), None, limiter
+    app_module.verify_token = lambda token: {'uid': token}
+    app_module.user_store = type('OneUser', (), {'get': lambda self, uid: user})()
+    app_module.ai_rate_limiter = RateLimiter(MemoryBucketStore(), per_minute=60, burst=10)
+
+    def slot_free():
+        held = limiter.slots.acquire(0)
+        if held is None:
+            return False
+        limiter.slots.release(held)
+        return True
+
+    try:
+        # The slot is held while the stream is open; a second caller is refused
+        events = recipes.stream_recipe_with_mistral({}, {}, 'Lunch', meal_macros=macros)
+        assert not slot_free()
+        try:
+            recipes.stream_recipe_with_mistral({}, {}, 'Dinner', meal_macros=macros)
+            assert False, "Expected Overloaded"
+        except Overloaded:
+            pass
+        # Dropped without reading a single event
+        del events
+        gc.collect()
+        assert slot_free() and all(stream.closed for stream in chat.streams)
+
+        # A response closed before its body is read, as on a client disconnect
+        client = app_module.app.test_client()
+        response = client.post('/api/ai/generate-recipes?stream=1', json={'meal_name': 'Supper'},
+                               headers={'Authorization': 'Bearer ursula'}, buffered=False)
+        assert response.status_code == 200 and not slot_free()
+        response.close()
+        assert slot_free() and chat.streams[-1].closed
+
+        # A stream that fails to open answers with the error and keeps no slot
+        chat.fail = True
+        result = recipes.stream_recipe_with_mistral({}, {}, 'Brunch', meal_macros=macros)
+        assert 'upstream unreachable' in result['error'] and slot_free()
+        chat.fail = False
+
+        async def drop_async():
+            events = await recipes.stream_recipe_with_mistral_async({}, {}, 'Tea', meal_macros=macros)
+            assert not slot_free()
+            del events
+            gc.collect()
+            for _ in range(3):
+                await asyncio.sleep(0)  # The loop's finalizer runs aclose()
+            return slot_free()
+        assert asyncio.run(drop_async()) and chat.streams[-1].closed
+    finally:
+        (recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus,
+         recipes.upstream_limiter) = saved_recipes
+        app_module.verify_token, app_module.user_store, app_module.ai_rate_limiter = saved_app
+    print("SUCCESS: Slots and upstream streams are freed even when nothing is read.")
+
+def test_invalid_recipe_not_cached():
+    print("\n--- Testing Invalid Completions Are Not Cached ---")
+
+    class MalformedClient(FakeMistralClient):
+        def complete(self, model, messages, response_format):
+            self.prompts.append(messages[0]['content'])
+            content = json.dumps({'name': 'Loose Bowl', 'ingredients': 'rice, beans', 'instructions': []})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    fake = MalformedClient(latency=0)
+    saved = recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus
+    recipes._client, recipes.MISTRAL_API_KEY = fake, 'test-key'
+    recipes.recipe_cache, recipes.recipe_corpus = RecipeCache(), RecipeCorpus()
+    try:
+        macros = {'protein': 30, 'fat': 10, 'carbs': 40}
+        for _ in range(2):
+            result = generate_recipes_with_mistral({}, {}, 'Lunch', meal_macros=macros)
+            print(result)
+            assert 'missing macros' in result['error']
+        # Nothing stored, so the second request went upstream again
+        assert len(fake.prompts) == 2
+        assert recipes.recipe_cache.stats()['size'] == 0 and len(recipes.recipe_corpus) == 0
+    finally:
+        recipes._client, recipes.MISTRAL_API_KEY, recipes.recipe_cache, recipes.recipe_corpus = saved
+    print("SUCCESS: Malformed completions return an error and are never cached.")
+
 if __name__ == "__main__":
     test_ai_generation()
+    test_recipe_cache()
+    test_day_recipes_concurrent()
+    test_recipe_corpus()
+    test_corpus_saves_upstream_calls()
+    test_recipe_field_parser()
+    test_streaming_route()
+    test_streaming_invalid_recipe()
+    test_invalid_recipe_not_cached()
+    test_unread_stream_releases_slot()
@@ -0,0 +1,186 @@
+import json
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+import async_app
+import recipes
+import firebase_config
+from firebase_config import TokenCache
+from rate_limit import RateLimiter, MemoryBucketStore
+from user_store import AsyncUserStore
+from recipe_cache import RecipeCache
+from recipe_corpus import RecipeCorpus
+
+
+class FakeAsyncCollection:
+    """
+    Minimal async stand-in for an AsyncMongoClient collection.
+    """
+
+    def __init__(self, docs=()):
+        self.docs = {d['_id']: dict(d) for d in docs}
+        self.inserted = []
+
+    async def find_one(self, query):
+        await asyncio.sleep(0)
+        doc = self.docs.get(query['_id'])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id']})
+        doc.update(update['$set'])
+        doc['version'] = doc.get('version', 0) + 1
+        return dict(doc)
+
+    async def insert_one(self, doc):
+        self.inserted.append(doc)
+
+    async def update_one(self, query, update, upsert=False):
+        self.inserted.append(update)
+
+    async def bulk_write(self, ops, ordered=True):
+        self.inserted.extend(ops)
+
+
+class SlowAsyncChat:
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+
+    async def complete_async(self, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        content = json.dumps({'name': 'Async Bowl', 'ingredients': [], 'instructions': [],
+                              'macros': {'protein': 30, 'fat': 10, 'carbs': 40}})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+USER = {
+    '_id': 'async-user', 'name': 'Async', 'age': 30, 'height': 180, 'weight': 80, 'meals': 3,
+    'sex': 'male', 'a_level': 'sedentary', 'goal': 'maintenance', 'diet_type': 'Standard',
+    'disliked_ingredients': [], 'tdee': 2000, 'target_calories': 2000,
+    'total_protein': 150, 'total_fat': 60, 'total_carbs': 200, 'version': 1
+}
+
+
+async def run_async_routes():
+    chat = SlowAsyncChat(delay=0.2)
+    users = FakeAsyncCollection([USER])
+    saved = (async_app.verify_token, async_app.user_store, async_app.update_buckets_collection,
+             recipes.MISTRAL_API_KEY, recipes._client, recipes.recipe_cache, recipes.recipe_corpus, async_app.sync_app.ai_rate_limiter)
+    async_app.verify_token = lambda token: {'uid': 'async-user', 'email': 'async@example.com'}
+    async_app.user_store = AsyncUserStore(users)
+    async_app.update_buckets_collection = FakeAsyncCollection()
+    recipes.MISTRAL_API_KEY = 'test'
+    recipes._client = SimpleNamespace(chat=chat)
+    recipes.recipe_cache = RecipeCache()
+    recipes.recipe_corpus = RecipeCorpus()
+    async_app.sync_app.ai_rate_limiter = RateLimiter(MemoryBucketStore(), per_minute=60, burst=100)
+    try:
+        client = async_app.app.test_client()
+        headers = {'Authorization': 'Bearer test'}
+
+        response = await client.get('/api/user/profile')
+        assert response.status_code == 401
+
+        response = await client.get('/api/user/meal-plan', headers=headers)
+        etag = response.headers['ETag']
+        repeat = await client.get('/api/user/meal-plan', headers={**headers, 'If-None-Match': etag})
+        print(f"Meal plan: {response.status_code}, repeat: {repeat.status_code}")
+        assert response.status_code == 200 and repeat.status_code == 304
+
+        response = await client.post('/api/user/update', headers=headers, json={'weight': 78})
+        assert (await response.get_json())['user']['weight'] == 78
+        assert len(async_app.update_buckets_collection.inserted) == 3  # Bucket append, week and month
+        response = await client.post('/api/user/update', headers=headers, json={'weight': 'heavy'})
+        assert response.status_code == 400
+
+        # Twenty slow upstream calls overlap instead of queueing behind each other
+        start = asyncio.get_running_loop().time()
+        responses = await asyncio.gather(*(
+            client.post('/api/ai/generate-recipes', headers=headers, json={'meal_name': f'Meal {i}'})
+            for i in range(20)
+        ))
+        elapsed = asyncio.get_running_loop().time() - start
+        print(f"20 recipe requests in {elapsed:.2f}s, peak in flight: {chat.peak}")
+        assert all(r.status_code == 200 for r in responses)
+        assert chat.peak == 20 and elapsed < 2
+
+        response = await client.post('/api/ai/generate-day-recipes', headers=headers)
+        meals = (await response.get_json())['meals']
+        assert [m['name'] for m in meals] == ['Breakfast', 'Lunch', 'Dinner']
+
+        # A malformed client plan is a 400, not a failure inside the fan-out
+        response = await client.post('/api/ai/generate-day-recipes', headers=headers, json={'meal_plan': [{'protein': 30}]})
+        assert response.status_code == 400
+
+        # Streaming mode: a cached recipe is replayed as server-sent events
+        response = await client.post('/api/ai/generate-recipes?stream=1', headers=headers, json={'meal_name': 'Meal 0'})
+        body = (await response.get_data()).decode()
+        assert response.mimetype == 'text/event-stream'
+        assert body.count('event: field') >= 1 and body.rstrip().split('\n\n')[-1].startswith('event: done')
+    finally:
+        (async_app.verify_token, async_app.user_store, async_app.update_buckets_collection,
+         recipes.MISTRAL_API_KEY, recipes._client, recipes.recipe_cache, recipes.recipe_corpus, async_app.sync_app.ai_rate_limiter) = saved
+
+
+def test_async_routes():
+    print("--- Testing Async Serving Mode ---")
+    asyncio.run(run_async_routes())
+
+
+async def run_token_checks():
+    threads = []
+
+    def verify(token):
+        threads.append(threading.current_thread())
+        return {'uid': 'async-user', 'email': 'async@example.com', 'exp': time.time() + 3600}
+
+    saved = async_app.verify_token, async_app.user_store, firebase_config.token_cache
+    async_app.verify_token = verify
+    async_app.user_store = AsyncUserStore(FakeAsyncCollection([USER]))
+    firebase_config.token_cache = TokenCache()
+    try:
+        client = async_app.app.test_client()
+        response = await client.get('/api/user/profile', headers={'Authorization': 'Bearer fresh'})
+        assert response.status_code == 200
+        # A cache miss is verified off the event loop thread
+        assert len(threads) == 1 and threads[0] is not threading.current_thread()
+
+        firebase_config.token_cache.put('known', verify('known'))
+        threads.clear()
+        response = await client.get('/api/user/profile', headers={'Authorization': 'Bearer known'})
+        assert response.status_code == 200 and threads == []  # Served from the cache inline
+        assert firebase_config.token_cache.stats()['hits'] == 1
+    finally:
+        async_app.verify_token, async_app.user_store, firebase_config.token_cache = saved
+
+
+def test_async_token_checks():
+    print("\n--- Testing Async Token Checks ---")
+    asyncio.run(run_token_checks())
+    print("SUCCESS: Token cache misses are verified on a thread.")
+
+
+def test_async_dispatch():
+    print("\n--- Testing Async/Sync Dispatch ---")
+    def scope(method, path):
+        return {'type': 'http', 'method': method, 'path': path, 'scheme': 'http'}
+
+    assert async_app.is_async_route(scope('GET', '/api/user/profile'))
+    assert async_app.is_async_route(scope('POST', '/api/ai/generate-recipes'))
+    # Not ported: served by the sync app
+    assert not async_app.is_async_route(scope('POST', '/api/signup'))
+    assert not async_app.is_async_route(scope('GET', '/api/admin/users'))
+    assert not async_app.is_async_route(scope('POST', '/api/user/profile'))
+    print("SUCCESS: Unported routes fall through to the sync app.")
+
+
+if __name__ == "__main__":
+    test_async_routes()
+    test_async_token_checks()
+    test_async_dispatch()
@@ -0,0 +1,103 @@
+import os
+import time
+import zipfile
+import tempfile
+from datetime import datetime, timedelta
+import report_export
+from report_export import run_export, iter_shards, claim_export, update_export, export_status
+from testing import memory_collection
+
+
+def users(uids):
+    return memory_collection('users', [{'_id': uid} for uid in uids])
+
+
+def series(uids, weeks):
+    """
+    `weeks` weekly series documents per user, plus a monthly one the
+    weekly export must skip. Users ending in -new never updated.
+    """
+    start = datetime(2023, 1, 2)
+    last = {'goal': 'cutting', 'activity_level': 'sedentary', 'target_calories': 2000,
+            'protein': 150, 'fat': 60, 'carbs': 200}
+    docs = []
+    for uid in uids:
+        if uid.endswith('-new'):
+            continue
+        docs.append({'_id': f'{uid}:month:2023-01-01', 'user_id': uid, 'period': 'month', 'start': start,
+                     'count': 3, 'weight_sum': 240.0, 'last': last})
+        docs.extend({'_id': f'{uid}:week:{w}', 'user_id': uid, 'period': 'week', 'start': start + timedelta(weeks=w),
+                     'count': 3, 'weight_sum': 240.0 - w, 'last': last} for w in range(weeks))
+    return memory_collection('user_update_buckets', docs)
+
+
+def test_shards():
+    print("--- Testing Export Shards ---")
+    uids = [f'user-{i:03d}' for i in range(7)] + ['user-007-new']
+    shards = list(iter_shards(users(uids), series(uids, 4), 'week', 3))
+    assert [len(s) for s in shards] == [3, 3, 2]
+    assert dict(shards[-1])['user-007-new'] == []
+    assert len(dict(shards[0])['user-000']) == 4  # Weekly documents only
+    assert [d['start'] for d in dict(shards[0])['user-000']] == sorted((d['start'] for d in dict(shards[0])['user-000']), reverse=True)
+    print("SUCCESS: Users split into shards with their series.")
+
+
+def test_export_zip():
+    print("\n--- Testing Process-Pool Report Export ---")
+    uids = [f'user/{i:03d}' for i in range(39)] + ['user-039-new']
+    progress = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'reports.zip')
+        start = time.perf_counter()
+        stats = run_export(users(uids), series(uids, 104), path, workers=2, shard_size=5, progress=progress.append)
+        print(f"Exported {stats['exported']} reports in {time.perf_counter() - start:.2f}s: {stats}")
+
+        assert stats['exported'] == 40 and stats['failed'] == 0
+        assert [p['exported'] for p in progress] == sorted(p['exported'] for p in progress)
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            assert len(names) == 40 and 'user_000.pdf' in names
+            assert archive.read('user_000.pdf').startswith(b'%PDF')
+        assert not os.path.exists(path + '.tmp')
+    print("SUCCESS: All reports rendered into the archive.")
+
+
+def test_shared_job_state():
+    print("\n--- Testing Export Job Claim ---")
+    jobs = memory_collection('admin_jobs')
+    with tempfile.TemporaryDirectory() as directory:
+        assert export_status(jobs) == {'status': 'idle'}
+        job = claim_export(jobs, 'week', directory)
+        assert job['status'] == 'running' and export_status(jobs)['path'] == job['path']
+        # Another worker sees it running and can't claim it
+        assert claim_export(jobs, 'month', directory) is None
+
+        update_export(jobs, job['path'], exported=3)
+        with open(job['path'], 'wb') as f:
+            f.write(b'zip')
+        update_export(jobs, job['path'], status='done')
+        assert export_status(jobs)['exported'] == 3
+
+        # The next export replaces the state and removes the old zip (renamed,
+        # as paths are stamped to the second)
+        jobs.update_one({'_id': report_export.EXPORT_JOB_ID}, {'$set': {'path': job['path'] + '.old'}})
+        os.rename(job['path'], job['path'] + '.old')
+        second = claim_export(jobs, 'month', directory)
+        assert second and not os.path.exists(job['path'] + '.old')
+        assert 'exported' in export_status(jobs) and export_status(jobs)['exported'] == 0
+
+        # A running job that stopped reporting progress is taken over;
+        # late updates from its worker are ignored
+        jobs.update_one({'_id': report_export.EXPORT_JOB_ID},
+                        {'$set': {'path': 'dead.zip', 'updated_at': datetime.utcnow() - timedelta(hours=1)}})
+        third = claim_export(jobs, 'week', directory)
+        assert third is not None
+        update_export(jobs, 'dead.zip', status='error')
+        assert export_status(jobs)['status'] == 'running'
+    print("SUCCESS: One running export across workers, state shared through Mongo.")
+
+
+if __name__ == "__main__":
+    test_shards()
+    test_export_zip()
+    test_shared_job_state()
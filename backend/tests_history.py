@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from testing import get_test_db, memory_collection
+import update_history
+from update_history import (
+    period_start, series_updates, series_report_rows, record_update, migrate_user_updates, rebuild_update_series,
+    BUCKET_FILTER
+)
+from reports import update_report_row
+
+
+def entry(ts, weight, calories=2000.0):
+    return {'weight': weight, 'meals': 3, 'activity_level': 'sedentary', 'goal': 'cutting', 'diet_type': 'Standard',
+            'tdee': 2400.0, 'target_calories': calories, 'carbs': 200.0, 'protein': 150.0, 'fat': 60.0, 'updated_at': ts}
+
+
+def test_series_folding():
+    print("--- Testing Weekly/Monthly Downsampling ---")
+    # Wednesday 2024-01-31 is in the week of Monday 2024-01-29 but in January
+    assert period_start(datetime(2024, 1, 31, 18), 'week') == datetime(2024, 1, 29)
+    assert period_start(datetime(2024, 1, 31, 18), 'month') == datetime(2024, 1, 1)
+
+    entries = [entry(datetime(2024, 1, 29, 8), 80), entry(datetime(2024, 1, 31, 8), 79, 1900),
+               entry(datetime(2024, 2, 1, 8), 78, 1800)]
+    ops = series_updates('u1', entries)
+    collection = memory_collection('user_update_buckets')
+    collection.bulk_write(ops)
+    series = {d['_id']: d for d in collection.find()}
+    print(sorted(series))
+    assert len(ops) == 3
+    assert sorted(series) == ['u1:month:2024-01-01', 'u1:month:2024-02-01', 'u1:week:2024-01-29']
+
+    week = series['u1:week:2024-01-29']
+    assert (week['count'], week['weight_sum'], week['target_calories_sum']) == (3, 237.0, 5700.0)
+    assert week['weight_min'] == 78.0 and week['weight_max'] == 80.0
+    assert week['last']['weight'] == 78 and week['period'] == 'week' and week['start'] == datetime(2024, 1, 29)
+    assert series['u1:month:2024-01-01']['count'] == 2
+
+    doc = {'start': datetime(2024, 1, 29), 'count': 3, 'weight_sum': 237.0, 'last': entries[-1]}
+    row = update_report_row(next(series_report_rows([doc])))
+    print(f"Report row: {row}")
+    assert row == ['2024-01-29', '79.0', 'cutting', 'sedentary', '1800', '150', '60', '200']
+    print("SUCCESS: Updates folded into week and month series.")
+
+
+def test_migration_matches_live_writes():
+    print("\n--- Testing Migration and Series Rebuild ---")
+    db = get_test_db()
+    saved_max = update_history.BUCKET_MAX_ENTRIES
+    update_history.BUCKET_MAX_ENTRIES = 10
+    try:
+        start = datetime(2024, 1, 1)
+        rows = [dict(entry(start + timedelta(hours=12 * i), 90 - i * 0.1), user_id=f'u{i % 2}') for i in range(100)]
+        db['user_updates'].insert_many([dict(r) for r in rows])
+
+        # Live path for comparison
+        for r in rows:
+            record_update(db['live_history'], r['user_id'], {k: v for k, v in r.items() if k != 'user_id'})
+        live = {d['_id']: d for d in db['live_history'].find({'period': {'$exists': True}})}
+        # A busy month spills into more buckets
+        assert db['live_history'].count_documents({'user_id': 'u0', 'month': '2024-01'}) == 4
+
+        assert migrate_user_updates(db['user_updates'], db['user_update_buckets']) == 100
+        # Re-running replaces the migrated buckets rather than duplicating them
+        migrate_user_updates(db['user_updates'], db['user_update_buckets'])
+        assert sum(len(b['entries']) for b in db['user_update_buckets'].find(BUCKET_FILTER)) == 100
+
+        # Series share the buckets' collection; a rebuild replaces only series
+        rebuild_update_series(db['user_update_buckets'])
+        written = rebuild_update_series(db['user_update_buckets'])
+        rebuilt = {d['_id']: d for d in db['user_update_buckets'].find({'period': {'$exists': True}})}
+        assert sum(len(b['entries']) for b in db['user_update_buckets'].find(BUCKET_FILTER)) == 100
+        print(f"Series documents: {written} for {len(rows)} updates")
+        assert written == len(live) == len(rebuilt) < len(rows)
+        for key, doc in live.items():
+            other = rebuilt[key]
+            assert doc['count'] == other['count'] and doc['last'] == other['last']
+            assert abs(doc['weight_sum'] - other['weight_sum']) < 1e-6
+        print("SUCCESS: Migrated history matches live writes.")
+    finally:
+        update_history.BUCKET_MAX_ENTRIES = saved_max
+        db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    test_series_folding()
+    test_migration_matches_live_writes()
@@ -0,0 +1,64 @@
+import os
+import sys
+import subprocess
+import mongomock
+from testing import get_test_db
+from indexes import ensure_indexes, check_query_plans, _plan_stages
+
+
+def test_plan_stage_walk():
+    print("--- Testing Plan Stage Detection ---")
+    plan = {'stage': 'FETCH', 'inputStage': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}}
+    stages = set(_plan_stages(plan))
+    print(f"Stages: {sorted(stages)}")
+    assert stages == {'FETCH', 'SORT', 'COLLSCAN'}
+
+
+def test_query_plans_use_indexes():
+    print("\n--- Testing Index Setup and Query Plans ---")
+    db = get_test_db()
+    try:
+        created = ensure_indexes(db)
+        assert ensure_indexes(db) == created  # Idempotent
+        jobs = db['recipe_jobs'].index_information().values()
+        assert any(i.get('unique') and i.get('sparse') for i in jobs)
+        if isinstance(db.client, mongomock.MongoClient):
+            # Query plans need a server's explain
+            print("WARNING: mongomock, skipping the query plan checks.")
+            return
+        # A few rows so the planner has something to choose between
+        db['user_updates'].insert_many([{'user_id': f'u{i % 5}', 'updated_at': i} for i in range(50)])
+        problems = check_query_plans(db)
+        for p in problems:
+            print(f"Slow: {p}")
+        assert not problems
+        print("SUCCESS: Every query shape uses an index.")
+    finally:
+        db.client.drop_database(db.name)
+
+
+def test_clients_create_indexes():
+    print("\n--- Testing Index Setup on Client Start ---")
+    # In a child process: init_clients() sets module globals for the whole process
+    script = (
+        "import mongomock, app\n"
+        "app.MongoClient = mongomock.MongoClient\n"
+        "app.init_clients()\n"
+        "jobs = app.db['recipe_jobs'].index_information().values()\n"
+        "assert any(i.get('unique') and i.get('sparse') for i in jobs)\n"
+        "for name in ('recipe_cache', 'recipe_jobs', 'rate_limits'):\n"
+        "    assert any('expireAfterSeconds' in i for i in app.db[name].index_information().values()), name\n"
+        "app.close_clients()\n"
+        "print('ok')\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, timeout=60)
+    print(result.stdout.strip(), result.stderr[-2000:])
+    assert result.returncode == 0 and result.stdout.strip().endswith('ok')
+    print("SUCCESS: Every process that builds clients also ensures the indexes.")
+
+
+if __name__ == "__main__":
+    test_plan_stage_walk()
+    test_query_plans_use_indexes()
+    test_clients_create_indexes()
@@ -0,0 +1,173 @@
+import json
+import time
+from types import SimpleNamespace
+import app as app_module
+from write_buffer import WriteBehindBuffer, BufferFull
+
+
+class RecordingCollection:
+    """
+    Records insert_many batches in place of a Mongo collection.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.bulk_ops = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulk_ops.append(list(ops))
+
+    def insert_many(self, docs, ordered=True):
+        self.batches.append(list(docs))
+        return SimpleNamespace(inserted_ids=list(range(len(docs))))
+
+    def insert_one(self, doc):
+        self.batches.append([doc])
+        return SimpleNamespace(inserted_id=0)
+
+
+class DownCollection(RecordingCollection):
+    def insert_many(self, docs, ordered=True):
+        raise ConnectionError("mongo unavailable")
+
+
+class FailingRollups:
+    def bulk_write(self, ops, ordered=True):
+        raise RuntimeError("rollups unavailable")
+
+
+def test_write_behind_buffer():
+    print("--- Testing Write-Behind Buffer ---")
+    collection = RecordingCollection()
+    buffer = WriteBehindBuffer(collection, max_batch=10, max_delay=0.2)
+
+    # Size-triggered flush
+    for i in range(10):
+        buffer.add({'i': i})
+    time.sleep(0.05)
+    assert [len(b) for b in collection.batches] == [10]
+
+    # Time-triggered flush
+    buffer.add({'i': 10})
+    time.sleep(0.4)
+    assert [len(b) for b in collection.batches] == [10, 1]
+
+    # Close flushes whatever is left
+    buffer.add({'i': 11})
+    buffer.close()
+    print(f"Batches: {[len(b) for b in collection.batches]}, stats: {buffer.stats()}")
+    assert sum(len(b) for b in collection.batches) == 12
+
+
+def test_write_behind_bound():
+    print("\n--- Testing Write-Behind Bound ---")
+    collection = DownCollection()
+    buffer = WriteBehindBuffer(collection, max_batch=100, max_delay=60, max_pending=5)
+    try:
+        for i in range(5):
+            buffer.add({'i': i})
+        try:
+            buffer.add({'i': 5})
+            assert False, "Expected BufferFull"
+        except BufferFull:
+            pass
+
+        # Requests keep arriving while the failing insert is in flight
+        def arrivals(docs, ordered=True):
+            for i in range(5, 8):
+                buffer.add({'i': i})
+            raise ConnectionError("mongo unavailable")
+        collection.insert_many = arrivals
+
+        assert buffer.flush() == 0
+        stats = buffer.stats()
+        print(stats)
+        # The failed batch is re-queued ahead of the new documents; the oldest over the limit are dropped
+        assert stats['pending'] == 5 and stats['dropped'] == 3 and stats['errors'] == 1
+        assert [doc['i'] for doc in buffer._pending] == [3, 4, 5, 6, 7]
+    finally:
+        buffer.close()
+    print("SUCCESS: The buffer never holds more than max_pending documents.")
+
+
+def test_workout_batch_endpoint():
+    print("\n--- Testing Workout Batch Endpoint ---")
+    collection = RecordingCollection()
+    rollups = RecordingCollection()
+    saved = app_module.verify_token, app_module.weekly_workout_collection, app_module.workout_rollups_collection
+    app_module.verify_token = lambda token: {'uid': 'batch-user', 'email': 'batch@example.com'}
+    app_module.weekly_workout_collection = collection
+    app_module.workout_rollups_collection = rollups
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer test'}
+        workouts = [{'workoutType': 'strength', 'weekStart': '2024-01-01', 'weekData': {'mon': {}}}] * 3
+
+        response = client.post('/api/workout/batch', headers=headers, json=workouts + [{'workoutType': 'run'}])
+        print(f"JSON array: {response.status_code} {response.get_json()}")
+        assert response.status_code == 207
+        assert response.get_json() == {'inserted': 3, 'errors': [{'index': 3, 'error': 'Missing required fields'}]}
+
+        ndjson = '\n'.join(json.dumps(w) for w in workouts) + '\nnot json\n'
+        response = client.post('/api/workout/batch', headers={**headers, 'Content-Type': 'application/x-ndjson'}, data=ndjson)
+        print(f"NDJSON: {response.status_code} {response.get_json()}")
+        assert response.get_json()['inserted'] == 3 and response.get_json()['errors'][0]['index'] == 3
+
+        # One insert_many per request, whatever the batch size
+        assert [len(b) for b in collection.batches] == [3, 3]
+        # ...and one rollup upsert for the (user, week) they fall in
+        assert [len(ops) for ops in rollups.bulk_ops] == [1, 1]
+    finally:
+        app_module.verify_token, app_module.weekly_workout_collection, app_module.workout_rollups_collection = saved
+
+
+def test_workout_stored_when_rollup_fails():
+    print("\n--- Testing Single Workout With Failing Rollups ---")
+    collection = RecordingCollection()
+    saved = (app_module.verify_token, app_module.weekly_workout_collection, app_module.workout_rollups_collection,
+             app_module.workout_buffer)
+    app_module.verify_token = lambda token: {'uid': 'solo-user', 'email': 'solo@example.com'}
+    app_module.weekly_workout_collection = collection
+    app_module.workout_rollups_collection = FailingRollups()
+    app_module.workout_buffer = None
+    try:
+        client = app_module.app.test_client()
+        workout = {'workoutType': 'strength', 'weekStart': '2024-01-01', 'weekData': {'mon': {}}}
+        response = client.post('/api/workout', headers={'Authorization': 'Bearer test'}, json=workout)
+        print(f"{response.status_code} {response.get_json()}")
+        # The insert went through, so the client must not retry it
+        assert response.status_code == 201
+        assert len(collection.batches) == 1
+    finally:
+        (app_module.verify_token, app_module.weekly_workout_collection, app_module.workout_rollups_collection,
+         app_module.workout_buffer) = saved
+    print("SUCCESS: A rollup failure is logged, not reported as a failed insert.")
+
+
+def test_buffered_routes():
+    print("\n--- Testing Buffered Route Responses ---")
+    buffer = WriteBehindBuffer(DownCollection(), max_batch=100, max_delay=60, max_pending=1)
+    saved = app_module.verify_token, app_module.suggestion_buffer
+    app_module.verify_token = lambda token: {'uid': 'idea-user', 'email': 'idea@example.com'}
+    app_module.suggestion_buffer = buffer
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer test'}
+        accepted = client.post('/api/suggestion', headers=headers, json={'suggestion': 'More recipes'})
+        # Buffered, not yet written
+        assert accepted.status_code == 202
+        full = client.post('/api/suggestion', headers=headers, json={'suggestion': 'Dark mode'})
+        print(f"{full.status_code} {full.headers.get('Retry-After')} {full.get_json()}")
+        assert full.status_code == 503 and int(full.headers['Retry-After']) >= 1
+    finally:
+        app_module.verify_token, app_module.suggestion_buffer = saved
+        buffer.close()
+    print("SUCCESS: Buffered writes get 202, and 503 once the buffer is full.")
+
+
+if __name__ == "__main__":
+    test_write_behind_buffer()
+    test_write_behind_bound()
+    test_workout_batch_endpoint()
+    test_workout_stored_when_rollup_fails()
+    test_buffered_routes()
@@ -0,0 +1,74 @@
+import threading
+import time
+from recipe_jobs import RecipeJobQueue, MemoryJobStore, QueueFull
+
+
+class FakeMistral:
+    """
+    Stands in for generate_recipes_with_mistral with artificial latency.
+    """
+
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, meal_name="Meal", **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return {'name': f'{meal_name} Bowl', 'macros': {'protein': 30, 'fat': 10, 'carbs': 40}}
+
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'error'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_single_flight():
+    print("--- Testing Recipe Job Single-Flight ---")
+    fake = FakeMistral(latency=0.2)
+    queue = RecipeJobQueue(MemoryJobStore(), fake, max_workers=2)
+
+    start = time.perf_counter()
+    job_ids = {queue.submit('lunch-key', meal_name='Lunch')[0] for _ in range(10)}
+    submit_ms = (time.perf_counter() - start) * 1000
+    print(f"10 submits in {submit_ms:.1f}ms -> {len(job_ids)} job(s)")
+
+    job = wait_for(queue, job_ids.pop())
+    print(f"Result: {job['result']}, upstream calls: {fake.calls}")
+    assert job['status'] == 'done' and fake.calls == 1
+    assert submit_ms < 100
+    queue.shutdown()
+
+
+def test_bounded_pool():
+    print("\n--- Testing Recipe Job Pool Bounds ---")
+    fake = FakeMistral(latency=0.2)
+    queue = RecipeJobQueue(MemoryJobStore(), fake, max_workers=2, max_pending=4)
+
+    job_ids = [queue.submit(f'key-{i}', meal_name=f'Meal {i}')[0] for i in range(4)]
+    try:
+        queue.submit('key-overflow')
+        raise AssertionError("Queue accepted more than max_pending jobs")
+    except QueueFull:
+        print("Overflow rejected with QueueFull")
+
+    start = time.perf_counter()
+    for job_id in job_ids:
+        wait_for(queue, job_id)
+    elapsed = time.perf_counter() - start
+    # 4 jobs of 0.2s on 2 workers take about two rounds
+    print(f"4 jobs on 2 workers finished in {elapsed:.2f}s")
+    assert fake.calls == 4 and elapsed < 0.6
+    queue.shutdown()
+
+
+if __name__ == "__main__":
+    test_single_flight()
+    test_bounded_pool()
@@ -0,0 +1,101 @@
+import json
+import time
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId, Decimal128
+import app as app_module
+from json_codec import dumps, ndjson_chunks
+from testing import memory_collection
+
+
+def make_docs(n):
+    return [{
+        '_id': ObjectId(), 'name': f'User {i}', 'email': f'u{i}@example.com', 'goal': 'cutting',
+        'created_at': datetime(2024, 5, 1, 12, 0, i % 60, 123000)
+    } for i in range(n)]
+
+
+def test_bson_encoding():
+    print("--- Testing BSON-Aware Encoding ---")
+    oid = ObjectId()
+    doc = {'_id': oid, 'at': datetime(2024, 5, 1, 12, 0, 0, 123000), 'day': datetime(2024, 5, 1),
+           'aware': datetime(2024, 5, 1, 14, tzinfo=timezone(timedelta(hours=2))),
+           'price': Decimal128('12.30'), 'ratio': Decimal('0.1'), 'tags': {'a'}, 'b': 1, 'a': None}
+    out = json.loads(dumps(doc))
+    print(out)
+    # Naive datetimes from the driver are UTC and say so; aware ones keep their offset
+    assert out == {'_id': str(oid), 'a': None, 'at': '2024-05-01T12:00:00.123000Z', 'aware': '2024-05-01T14:00:00+02:00',
+                   'b': 1, 'day': '2024-05-01T00:00:00Z', 'price': '12.30', 'ratio': '0.1', 'tags': ['a']}
+    assert datetime.fromisoformat(out['at'].replace('Z', '+00:00')) == doc['at'].replace(tzinfo=timezone.utc)
+    assert list(out) == sorted(out)  # Key order as before
+
+    with app_module.app.test_request_context():
+        response = app_module.jsonify({'user': doc})
+        assert response.mimetype == 'application/json'
+        assert response.get_json()['user']['_id'] == str(oid)
+    print("SUCCESS: ObjectId, datetime and decimals encode natively.")
+
+
+def test_list_and_stream_from_cursor():
+    print("\n--- Testing Admin Listing Without a Pre-Pass ---")
+    docs = make_docs(1200)
+    admin = {'_id': 'admin', 'is_admin': True}
+    saved = (app_module.verify_token, app_module.user_store, app_module.users_collection)
+    app_module.verify_token = lambda token: {'uid': 'admin', 'email': 'a@example.com'}
+    app_module.user_store = type('Admins', (), {'get': lambda self, uid: admin})()
+    app_module.users_collection = memory_collection('users', docs)
+    client = app_module.app.test_client()
+    headers = {'Authorization': 'Bearer t'}
+    try:
+        page = client.get('/api/admin/users?limit=2', headers=headers).get_json()
+        print(page['users'][0])
+        # Newest first: the last user created at second 59
+        newest = max(docs, key=lambda d: (d['created_at'], d['_id']))
+        assert page['users'][0] == {'_id': str(newest['_id']), 'name': newest['name'], 'email': newest['email'],
+                                    'goal': 'cutting', 'created_at': '2024-05-01T12:00:59.123000Z'}
+        assert page['next']
+
+        response = client.get('/api/admin/users?format=ndjson', headers=headers)
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data().decode().splitlines()
+        assert len(lines) == 1200
+        # Same shape as the paged JSON
+        assert json.loads(lines[0]) == page['users'][0]
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.users_collection = saved
+
+    assert sum(chunk.count(b'\n') for chunk in ndjson_chunks(iter(docs), chunk=500)) == 1200
+    assert len(list(ndjson_chunks(iter(docs), chunk=500))) == 3
+    print("SUCCESS: Listing and NDJSON stream encode cursor documents directly.")
+
+
+def test_encoding_speed():
+    print("\n--- Testing Encoding Speed ---")
+    docs = make_docs(20000)
+
+    def stdlib(batch):
+        # The old path: per-document pre-pass, then the stdlib encoder
+        out = []
+        for doc in batch:
+            doc = dict(doc)
+            doc['_id'] = str(doc['_id'])
+            doc['created_at'] = doc['created_at'].isoformat() + 'Z'
+            out.append(doc)
+        return json.dumps({'users': out}, sort_keys=True, separators=(',', ':')).encode()
+
+    start = time.perf_counter()
+    old = stdlib(docs)
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = dumps({'users': docs})
+    new_time = time.perf_counter() - start
+    print(f"stdlib + pre-pass: {old_time * 1000:.1f}ms, orjson: {new_time * 1000:.1f}ms")
+    assert json.loads(old) == json.loads(new)
+    assert new_time < old_time
+    print("SUCCESS: Same output, less CPU.")
+
+
+if __name__ == "__main__":
+    test_bson_encoding()
+    test_list_and_stream_from_cursor()
+    test_encoding_speed()
@@ -1,6 +1,8 @@
-
-from app import calculate_macros, generate_meal_plan_logic, get_tdee, get_bmr
-from constants import MEAL_DISTRIBUTION
+import time
+from calculations import calculate_macros, generate_meal_plan_logic, get_tdee, get_bmr, parse_meal_plan, profile_update
+from constants import MEAL_DISTRIBUTION, MAX_PLAN_MEALS
+from batch_macros import compute_targets_batch
+import app as app_module
 
 def test_calculations():
     print("--- Testing Calculations ---")
@@ -38,5 +40,136 @@ def test_calculations():
     total_cal = sum(m['calories'] for m in meal_plan)
     print(f"Total Plan Calories: {total_cal:.1f} (Should match {macros_cut['calories']:.1f})")
 
+def test_batch_calculations():
+    print("\n--- Testing Batch Calculations ---")
+
+    profiles = [
+        ('male', 80, 180, 25, 'moderately active', 'cutting', 4),
+        ('female', 62, 165, 31, 'sedentary', 'bulking', 3),
+        ('Male', 95, 190, 44, 'very active', 'maintenance', 5),
+        ('female', 55, 158, 22, 'unknown', 'unknown', 6),
+    ]
+    result = compute_targets_batch(*zip(*profiles))
+
+    mismatches = 0
+    for i, (sex, weight, height, age, a_level, goal, meals) in enumerate(profiles):
+        tdee = get_tdee(get_bmr(sex, weight, height, age), a_level)
+        macros = calculate_macros(tdee, goal)
+        plan = generate_meal_plan_logic(macros, meals)
+
+        for key in ('calories', 'protein', 'fat', 'carbs'):
+            if abs(result['daily'][key][i] - macros[key]) > 0.11:
+                mismatches += 1
+            for j, meal in enumerate(plan):
+                if abs(result['meals'][key][i, j] - meal[key]) > 0.11:
+                    mismatches += 1
+
+    print(f"Batch vs scalar mismatches: {mismatches}")
+    assert mismatches == 0
+
+def test_parse_meal_plan():
+    print("\n--- Testing Client Meal Plan Validation ---")
+    plan = generate_meal_plan_logic(calculate_macros(2500, 'maintenance'), 4)
+    parsed = parse_meal_plan(plan)
+    assert [m['name'] for m in parsed] == [m['name'] for m in plan]
+    assert parsed[0]['protein'] == plan[0]['protein']
+
+    bad_plans = [
+        'Breakfast', {}, [], [{'protein': 30, 'fat': 10, 'carbs': 40}], ['Lunch'],
+        [{'name': 'Lunch', 'protein': '30', 'fat': 10, 'carbs': 40}],
+        [{'name': 'Lunch', 'protein': 30, 'fat': -1, 'carbs': 40}],
+        [{'name': f'Meal {i}', 'protein': 30, 'fat': 10, 'carbs': 40} for i in range(50)],
+    ]
+    for bad in bad_plans:
+        try:
+            parse_meal_plan(bad)
+            assert False, bad
+        except ValueError as e:
+            print(f"Rejected: {e}")
+    print("SUCCESS: Malformed and oversized plans rejected.")
+
+def test_profile_update():
+    print("\n--- Testing Profile Update ---")
+    user = {'sex': 'female', 'weight': 65.0, 'height': 168, 'age': 30, 'a_level': 'moderate', 'meals': 3, 'goal': 'cutting'}
+    update_doc, log_entry = profile_update(user, {'weight': '70', 'meals': 4})
+    assert update_doc['weight'] == 70.0 and update_doc['goal'] == 'cutting' and update_doc['diet_type'] == 'Standard'
+    assert update_doc['bmr'] == get_bmr('female', 70.0, 168, 30)
+    assert len(update_doc['meal_plan']) == 4
+    assert log_entry['activity_level'] == 'moderate' and log_entry['carbs'] == update_doc['total_carbs']
+    assert 'updated_at' not in log_entry
+
+    # More meals than a day's recipe request may fan out to are clamped
+    update_doc, log_entry = profile_update(user, {'meals': 9})
+    assert update_doc['meals'] == log_entry['meals'] == MAX_PLAN_MEALS == len(update_doc['meal_plan'])
+
+    for bad in ({'weight': 'heavy'}, {'meals': None}, {'meals': 0}, {'meals': 'six'}, {'weight': -5}):
+        try:
+            profile_update(user, bad)
+            assert False, bad
+        except ValueError as e:
+            print(f"Rejected {bad}: {e}")
+    print("SUCCESS: Updates recompute targets from stored and new fields.")
+
+def test_signup_meal_count():
+    print("\n--- Testing Signup Meal Count ---")
+    saved_users = {}
+
+    class Users:
+        def update(self, uid, fields, upsert=False):
+            saved_users[uid] = fields
+            return fields
+
+    saved = app_module.verify_token, app_module.user_store
+    app_module.verify_token = lambda token: {'uid': 'sue', 'email': 'sue@example.com'}
+    app_module.user_store = Users()
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer t'}
+        profile = {'name': 'Sue', 'age': 30, 'height': 165, 'weight': 60, 'sex': 'female'}
+        response = client.post('/api/signup', headers=headers, json={**profile, 'meals': 12})
+        assert response.status_code == 200
+        assert saved_users['sue']['meals'] == MAX_PLAN_MEALS == len(saved_users['sue']['meal_plan'])
+        for bad in ('lots', 0, None):
+            response = client.post('/api/signup', headers=headers, json={**profile, 'meals': bad})
+            print(bad, response.status_code, response.get_json())
+            assert response.status_code == 400
+    finally:
+        app_module.verify_token, app_module.user_store = saved
+    print("SUCCESS: Signup clamps meals to the day plan limit and rejects bad counts.")
+
+def test_recompute_chunk_size():
+    print("\n--- Testing Recompute Chunk Size ---")
+    started = []
+    admin = {'_id': 'admin', 'is_admin': True}
+    saved = app_module.verify_token, app_module.user_store, app_module.run_recompute_job
+    app_module.verify_token = lambda token: {'uid': 'admin'}
+    app_module.user_store = type('Admins', (), {'get': lambda self, uid: admin})()
+    app_module.run_recompute_job = lambda chunk_size: (started.append(chunk_size), app_module.recompute_job.update(status='done'))
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer t'}
+        for bad in ('many', None, [5]):
+            response = client.post('/api/admin/recompute-targets', headers=headers, json={'chunk_size': bad})
+            assert response.status_code == 400, bad
+        for requested in (0, -20, 10 ** 9, '250'):
+            response = client.post('/api/admin/recompute-targets', headers=headers, json={'chunk_size': requested})
+            assert response.status_code == 202
+            app_module.recompute_job['status'] = 'done'
+        client.post('/api/admin/recompute-targets', headers=headers, json={})
+        app_module.recompute_job['status'] = 'done'
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.run_recompute_job = saved
+    deadline = time.monotonic() + 5
+    while len(started) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)  # The job runs on its own thread
+    print(f"Chunk sizes used: {sorted(started)}")
+    assert sorted(started) == sorted([1, 1, app_module.MAX_RECOMPUTE_CHUNK, 250, app_module.RECOMPUTE_CHUNK_SIZE])
+    print("SUCCESS: chunk_size is validated and clamped.")
+
 if __name__ == "__main__":
     test_calculations()
+    test_batch_calculations()
+    test_parse_meal_plan()
+    test_profile_update()
+    test_signup_meal_count()
+    test_recompute_chunk_size()
@@ -0,0 +1,150 @@
+import os
+import time
+import shutil
+import tempfile
+from types import SimpleNamespace
+import app as app_module
+import metrics
+from metrics import Counter, Histogram, MongoCommandMetrics, MONGO_COMMAND_SECONDS, MONGO_COMMAND_FAILURES
+
+
+def test_prometheus_format():
+    print("--- Testing Prometheus Text Format ---")
+    histogram = Histogram('test_latency_seconds', 'Test.', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, '/a"b')
+    counter = Counter('test_events_total', 'Test.')
+    counter.inc()
+    counter.inc(amount=2)
+
+    text = '\n'.join(histogram.render() + counter.render())
+    print(text)
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{route="/a\\"b"} 3' in text
+    assert 'test_events_total 3' in text
+    metrics._registry.remove(histogram)
+    metrics._registry.remove(counter)
+
+
+def test_mongo_command_listener():
+    print("\n--- Testing Mongo Command Metrics ---")
+    listener = MongoCommandMetrics()
+
+    def run(command_name, command, failed=False):
+        event = SimpleNamespace(command_name=command_name, command=command, connection_id=('db', 1),
+                                request_id=id(command), duration_micros=1500)
+        listener.started(event)
+        (listener.failed if failed else listener.succeeded)(event)
+
+    before = MONGO_COMMAND_SECONDS.count('users', 'find')
+    run('find', {'find': 'users', 'filter': {}})
+    run('getMore', {'getMore': 123, 'collection': 'users'})
+    run('insert', {'insert': 'suggestions'}, failed=True)
+
+    assert MONGO_COMMAND_SECONDS.count('users', 'find') == before + 1
+    assert MONGO_COMMAND_SECONDS.count('users', 'getMore') >= 1
+    assert MONGO_COMMAND_FAILURES.value('suggestions', 'insert') >= 1
+    assert not listener._pending
+    print("SUCCESS: Commands attributed to their collections.")
+
+
+def test_metrics_endpoint():
+    print("\n--- Testing /metrics Endpoint ---")
+    client = app_module.app.test_client()
+    client.get('/')
+    response = client.get('/metrics')
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in body
+    assert '# TYPE mongo_pool_connections gauge' in body
+
+    saved = app_module.METRICS_TOKEN
+    app_module.METRICS_TOKEN = 'secret'
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+    finally:
+        app_module.METRICS_TOKEN = saved
+    print("SUCCESS: Metrics exposed.")
+
+
+def test_observe_overhead():
+    print("\n--- Testing Instrumentation Overhead ---")
+    histogram = Histogram('test_overhead_seconds', 'Test.', ('route',))
+    n = 100000
+    start = time.perf_counter()
+    for i in range(n):
+        histogram.observe(0.01, '/api/user/profile')
+    per_call = (time.perf_counter() - start) / n
+    print(f"observe(): {per_call * 1e6:.2f}us per call")
+    assert per_call < 20e-6
+    metrics._registry.remove(histogram)
+
+
+def test_worker_aggregation():
+    print("\n--- Testing Aggregation Across Workers ---")
+    counter = Counter('test_worker_events_total', 'Test.', ('route',))
+    histogram = Histogram('test_worker_seconds', 'Test.', buckets=(1,))
+    gauge = metrics.Gauge('test_worker_size', 'Test.', collect=lambda: {(): 7})
+    directory = tempfile.mkdtemp()
+    saved = metrics.METRICS_DIR
+    metrics.METRICS_DIR = directory
+    try:
+        metrics.reset_workers_dir()
+
+        def worker(events, exit_after):
+            # A forked worker: counts, snapshots, then exits or stays up
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    counter.inc('/a', amount=events)
+                    histogram.observe(0.5)
+                    if exit_after:
+                        metrics.mark_process_dead()
+                    else:
+                        metrics.flush()
+                finally:
+                    os._exit(0)
+            return pid
+
+        exited = worker(3, exit_after=True)
+        os.waitpid(exited, 0)
+        # Crashed without retiring its snapshot: its gauges must not be reported
+        crashed = worker(5, exit_after=False)
+        os.waitpid(crashed, 0)
+        counter.inc('/a')
+
+        text = metrics.render()
+        print('\n'.join(line for line in text.splitlines() if 'test_worker' in line))
+        assert 'test_worker_events_total{route="/a"} 9' in text
+        assert 'test_worker_seconds_count 2' in text
+        assert f'test_worker_size{{pid="{os.getpid()}"}} 7' in text
+        assert f'pid="{exited}"' not in text and f'pid="{crashed}"' not in text
+
+        # A new worker that reuses a dead pid keeps that pid's counts in the totals
+        metrics._flusher_pid = None
+        os.replace(os.path.join(directory, f'{crashed}.json'), os.path.join(directory, f'{os.getpid()}.json'))
+        saved_interval = metrics.METRICS_FLUSH_INTERVAL
+        metrics.METRICS_FLUSH_INTERVAL = 3600
+        try:
+            metrics.start_flusher()
+        finally:
+            metrics.METRICS_FLUSH_INTERVAL = saved_interval
+        assert 'test_worker_events_total{route="/a"} 9' in metrics.render()
+    finally:
+        metrics.METRICS_DIR = saved
+        metrics._flusher_pid = None
+        shutil.rmtree(directory, ignore_errors=True)
+        for metric in (counter, histogram, gauge):
+            metrics._registry.remove(metric)
+    print("SUCCESS: Counters sum over live and exited workers; gauges only for live ones.")
+
+
+if __name__ == "__main__":
+    test_prometheus_format()
+    test_mongo_command_listener()
+    test_metrics_endpoint()
+    test_observe_overhead()
+    test_worker_aggregation()
@@ -0,0 +1,162 @@
+import json
+from datetime import datetime, timedelta
+from bson import ObjectId
+import mongomock
+import app as app_module
+from pagination import fetch_page, iter_all, decode_cursor, encode_cursor, page_size, MAX_PAGE_SIZE
+
+BASE = datetime(2024, 5, 1, 12, 0)
+
+
+def make_collection(docs):
+    collection = mongomock.MongoClient()['test']['items']
+    collection.insert_many(docs)
+    return collection
+
+
+def all_pages(collection, limit):
+    # Follows `next` until the last page, as the admin page does
+    pages, token = [], None
+    while True:
+        docs, token = fetch_page(collection, None, limit, token)
+        pages.append(docs)
+        if token is None:
+            return pages
+
+
+def test_page_chaining():
+    print("--- Testing Page Chaining ---")
+    docs = [{'_id': ObjectId(), 'n': i, 'created_at': BASE + timedelta(minutes=i)} for i in range(25)]
+    collection = make_collection(docs)
+    pages = all_pages(collection, 10)
+    print(f"Page sizes: {[len(p) for p in pages]}")
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert [d['n'] for p in pages for d in p] == list(range(24, -1, -1))
+
+    # An exact multiple of the limit ends without an empty page
+    assert [len(p) for p in all_pages(make_collection(docs[:20]), 10)] == [10, 10]
+    print("SUCCESS: Pages chain through `next` until it is None.")
+
+
+def test_ties_and_missing_created_at():
+    print("\n--- Testing Ties and Undated Documents ---")
+    ids = sorted(ObjectId() for _ in range(6))
+    docs = [{'_id': _id, 'created_at': BASE} for _id in ids[:4]]  # Same timestamp
+    docs.append({'_id': ids[4], 'created_at': BASE + timedelta(days=1)})
+    docs.append({'_id': ids[5]})  # No created_at, from before it was recorded
+    collection = make_collection(docs)
+
+    order = [d['_id'] for p in all_pages(collection, 2) for d in p]
+    print(order)
+    # Newest first, ties by _id descending, undated last; nothing skipped or repeated
+    assert order == [ids[4], ids[3], ids[2], ids[1], ids[0], ids[5]]
+
+    # A cursor taken on an undated document pages through the undated ones
+    undated = make_collection([{'_id': f'user-{i}'} for i in range(5)])
+    order = [d['_id'] for p in all_pages(undated, 2) for d in p]
+    assert order == [f'user-{i}' for i in range(4, -1, -1)]
+    print("SUCCESS: Equal timestamps break on _id; undated documents sort last.")
+
+
+def test_cursor_id_types():
+    print("\n--- Testing ObjectId and String _id Cursors ---")
+    oid = ObjectId()
+    created_at, _id = decode_cursor(encode_cursor({'_id': oid, 'created_at': BASE}))
+    assert created_at == BASE and _id == oid and isinstance(_id, ObjectId)
+
+    # Users are keyed by Firebase uid strings, which may look like hex
+    uid = '0123456789abcdef01234567'
+    created_at, _id = decode_cursor(encode_cursor({'_id': uid, 'created_at': BASE}))
+    assert _id == uid and isinstance(_id, str)
+
+    users = make_collection([{'_id': f'uid-{i:02d}', 'created_at': BASE} for i in range(7)])
+    order = [d['_id'] for p in all_pages(users, 3) for d in p]
+    assert order == [f'uid-{i:02d}' for i in range(6, -1, -1)]
+    print("SUCCESS: Cursors round-trip the _id type.")
+
+
+def test_invalid_cursor_and_limit():
+    print("\n--- Testing Invalid Cursor and Limit ---")
+    for bad in ('abc', '', '1.5'):
+        try:
+            page_size(bad)
+            assert False, "Expected ValueError"
+        except ValueError:
+            pass
+    assert page_size(None) > 0 and page_size('0') == 1 and page_size(str(MAX_PAGE_SIZE * 10)) == MAX_PAGE_SIZE
+
+    admin = {'_id': 'admin', 'is_admin': True}
+    saved = (app_module.verify_token, app_module.user_store, app_module.suggestions_collection)
+    app_module.verify_token = lambda token: {'uid': 'admin'}
+    app_module.user_store = type('Admins', (), {'get': lambda self, uid: admin})()
+    app_module.suggestions_collection = make_collection([{'suggestion': 'x', 'created_at': BASE}])
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer t'}
+        for query in ('cursor=garbage', 'limit=ten', 'cursor=e30='):  # e30= is "{}"
+            response = client.get(f'/api/admin/suggestions?{query}', headers=headers)
+            print(query, response.status_code, response.get_json())
+            assert response.status_code == 400
+        assert client.get('/api/admin/suggestions', headers=headers).status_code == 200
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.suggestions_collection = saved
+    print("SUCCESS: Malformed cursors and limits are rejected with 400.")
+
+
+def test_ndjson_stream():
+    print("\n--- Testing NDJSON Stream ---")
+    docs = [{'_id': ObjectId(), 'suggestion': f's{i}', 'created_at': BASE + timedelta(seconds=i)} for i in range(30)]
+    docs.append({'_id': ObjectId(), 'suggestion': 'undated'})
+    collection = make_collection(docs)
+
+    admin = {'_id': 'admin', 'is_admin': True}
+    saved = (app_module.verify_token, app_module.user_store, app_module.suggestions_collection)
+    app_module.verify_token = lambda token: {'uid': 'admin'}
+    app_module.user_store = type('Admins', (), {'get': lambda self, uid: admin})()
+    app_module.suggestions_collection = collection
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer t'}
+        response = client.get('/api/admin/suggestions?format=ndjson', headers=headers)
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data().decode().splitlines()]
+        assert [d['suggestion'] for d in lines] == [f's{i}' for i in range(29, -1, -1)] + ['undated']
+
+        # Accept header works too, and a cursor resumes the stream
+        first, token = fetch_page(collection, None, 10)
+        response = client.get(f'/api/admin/suggestions?cursor={token}',
+                              headers={**headers, 'Accept': 'application/x-ndjson'})
+        lines = [json.loads(line) for line in response.get_data().decode().splitlines()]
+        assert len(lines) == 21 and lines[0]['suggestion'] == 's19'
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.suggestions_collection = saved
+
+    assert len(list(iter_all(collection, {'_id': 1}))) == 31
+    print("SUCCESS: The NDJSON stream yields every document in page order.")
+
+
+def test_admin_counts():
+    print("\n--- Testing Admin Counts ---")
+    admin = {'_id': 'admin', 'is_admin': True}
+    saved = (app_module.verify_token, app_module.user_store, app_module.users_collection, app_module.suggestions_collection)
+    app_module.verify_token = lambda token: {'uid': 'admin'}
+    app_module.user_store = type('Admins', (), {'get': lambda self, uid: admin})()
+    app_module.users_collection = make_collection([{'_id': f'uid-{i}'} for i in range(12)])
+    app_module.suggestions_collection = make_collection([{'suggestion': f's{i}'} for i in range(3)])
+    try:
+        response = app_module.app.test_client().get('/api/admin/counts', headers={'Authorization': 'Bearer t'})
+        print(response.get_json())
+        assert response.status_code == 200
+        assert response.get_json() == {'users': 12, 'suggestions': 3}
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.users_collection, app_module.suggestions_collection = saved
+    print("SUCCESS: Listing totals come from the counts endpoint, not from paging.")
+
+
+if __name__ == "__main__":
+    test_page_chaining()
+    test_ties_and_missing_created_at()
+    test_cursor_id_types()
+    test_invalid_cursor_and_limit()
+    test_ndjson_stream()
+    test_admin_counts()
@@ -0,0 +1,133 @@
+import time
+import numpy as np
+import app as app_module
+from calculations import calculate_macros, generate_meal_plan_logic
+from portions import FoodTable, nnls_batch, plan_portions, compute_weekly_portions, PLAN_DAYS
+from testing import memory_collection, CountingCollection
+
+
+def make_user(uid, diet='Standard', disliked=None, goal='maintenance', meals=3, calories=2400):
+    daily = calculate_macros(calories, goal)
+    return {'_id': uid, 'meals': meals, 'meal_plan': generate_meal_plan_logic(daily, meals), 'diet_type': diet,
+            'disliked_ingredients': disliked or [], 'version': 1}
+
+
+def test_nnls_batch():
+    print("--- Testing Batched NNLS ---")
+    rng = np.random.default_rng(7)
+    A = rng.normal(size=(2000, 3, 3))
+    b = rng.normal(size=(2000, 3))
+    x = nnls_batch(A, b)
+    # KKT: x >= 0, zero gradient where x > 0, gradient >= 0 where x == 0
+    gradient = np.einsum('nmi,nm->ni', A, np.einsum('nmi,ni->nm', A, x) - b)
+    assert (x >= 0).all()
+    assert np.abs(gradient[x > 1e-9]).max() < 1e-6
+    assert gradient[x <= 1e-9].min() > -1e-6
+
+    capped = nnls_batch(A, b, upper=np.full((2000, 3), 0.5))
+    assert capped.max() <= 0.5 + 1e-9 and capped.min() >= 0
+    print("SUCCESS: Solutions satisfy the NNLS optimality conditions.")
+
+
+def test_diet_and_dislike_masks():
+    print("\n--- Testing Diet and Dislike Masks ---")
+    table = FoodTable()
+    vegan = table.mask('Vegan')
+    names = {name for name, allowed in zip(table.names, vegan) if allowed}
+    assert not names & {'Chicken breast', 'Salmon', 'Eggs', 'Greek yogurt', 'Butter'}
+    assert {'Firm tofu', 'Lentils', 'Olive oil'} <= names
+    assert not table.mask('Keto')[table.names.index('Cooked rice')]
+    assert table.mask('unknown diet').all()
+
+    # Dislikes match foods containing all of their words
+    mask = table.mask('Standard', ['chicken breast', 'Rice'])
+    assert not mask[table.names.index('Chicken breast')] and mask[table.names.index('Turkey breast')]
+    assert not mask[table.names.index('Cooked rice')] and not mask[table.names.index('Brown rice')]
+
+    plans = plan_portions([make_user('v', 'Vegan', ['tofu']), make_user('k', 'Keto', goal='cutting', meals=5)])
+    vegan_foods = {f['food'] for day in plans['v'] for meal in day['meals'] for f in meal['foods']}
+    print(f"Vegan week uses: {sorted(vegan_foods)}")
+    assert vegan_foods <= names and 'Firm tofu' not in vegan_foods
+    keto_foods = {f['food'] for day in plans['k'] for meal in day['meals'] for f in meal['foods']}
+    assert all(table.mask('Keto')[table.names.index(food)] for food in keto_foods)
+    print("SUCCESS: Plans only use foods the diet and dislikes allow.")
+
+
+def test_portions_hit_targets():
+    print("\n--- Testing Portion Accuracy ---")
+    users = [make_user(f'u{i}', goal=('cutting', 'maintenance', 'bulking')[i % 3], meals=3 + i % 3,
+                       calories=1800 + 50 * i) for i in range(30)]
+    plans = plan_portions(users)
+    assert len(plans) == 30 and all(len(days) == PLAN_DAYS for days in plans.values())
+
+    errors = []
+    for days in plans.values():
+        for meal in (m for day in days for m in day['meals']):
+            target = np.array([meal['target'][k] for k in ('protein', 'fat', 'carbs')])
+            achieved = np.array([meal['macros'][k] for k in ('protein', 'fat', 'carbs')])
+            errors.append(np.sqrt(np.mean(((achieved - target) / np.maximum(target, 10)) ** 2)))
+            assert all(f['grams'] > 0 and f['grams'] % 5 == 0 for f in meal['foods'])
+    print(f"Median RMS relative error: {np.median(errors):.3f}, 90th percentile: {np.percentile(errors, 90):.3f}")
+    assert np.median(errors) < 0.05
+
+    # Deterministic, with a different protein food day to day
+    again = plan_portions(users[:1])
+    assert again['u0'] == plans['u0']
+    breakfasts = [day['meals'][0]['foods'][0]['food'] for day in plans['u0']]
+    assert len(set(breakfasts)) > 1
+    print("SUCCESS: Standard-diet meals land close to their macro targets.")
+
+
+def test_weekly_portions_job_and_route():
+    print("\n--- Testing Weekly Portions Job ---")
+    users = memory_collection('users', [make_user(f'u{i}', ('Standard', 'Vegetarian', 'Paleo')[i % 3]) for i in range(10)]
+                              + [{'_id': 'new-user'}])
+    portions = memory_collection('weekly_portions')
+    commands = []
+    stats = compute_weekly_portions(users, CountingCollection(portions, commands), chunk_size=4)
+    print(stats)
+    assert stats == {'processed': 10, 'skipped': 1}
+    assert commands == ['update'] * 3  # One bulk write per chunk
+    stored_week = portions.find_one({'_id': 'u0'})
+    assert stored_week['version'] == 1 and len(stored_week['days']) == PLAN_DAYS
+    assert portions.count_documents({}) == 10
+
+    saved = app_module.verify_token, app_module.user_store, app_module.portions_collection
+    app_module.verify_token = lambda token: {'uid': token}
+    app_module.user_store = type('Users', (), {'get': lambda self, uid: users.find_one({'_id': uid})})()
+    app_module.portions_collection = portions
+    try:
+        client = app_module.app.test_client()
+        stored = client.get('/api/user/portions', headers={'Authorization': 'Bearer u0'}).get_json()
+        assert stored['source'] == 'stored' and stored['days'] == stored_week['days']
+
+        # A profile edit bumps the version; the stored week is stale
+        users.update_one({'_id': 'u0'}, {'$set': {'version': 2}})
+        fresh = client.get('/api/user/portions', headers={'Authorization': 'Bearer u0'}).get_json()
+        assert fresh['source'] == 'computed' and fresh['days'] == stored['days']
+
+        assert client.get('/api/user/portions', headers={'Authorization': 'Bearer new-user'}).status_code == 400
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.portions_collection = saved
+    print("SUCCESS: Batch job stores weekly plans; the route serves or recomputes them.")
+
+
+def test_batch_speed():
+    print("\n--- Testing Batch Speed ---")
+    diets = ('Standard', 'Vegetarian', 'Vegan', 'Keto', 'Paleo')
+    users = [make_user(f'u{i}', diets[i % 5], meals=3 + i % 3) for i in range(1000)]
+    start = time.perf_counter()
+    plans = plan_portions(users)
+    elapsed = time.perf_counter() - start
+    meals = sum(len(day['meals']) for days in plans.values() for day in days)
+    print(f"{len(plans)} users, {meals} meals in {elapsed:.2f}s")
+    assert elapsed < 10
+    print("SUCCESS: A week for a thousand users in one batch.")
+
+
+if __name__ == "__main__":
+    test_nnls_batch()
+    test_diet_and_dislike_masks()
+    test_portions_hit_targets()
+    test_weekly_portions_job_and_route()
+    test_batch_speed()
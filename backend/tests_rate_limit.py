@@ -0,0 +1,253 @@
+import time
+import asyncio
+import threading
+import mongomock
+from concurrent.futures import ThreadPoolExecutor
+import app as app_module
+from testing import get_test_db
+from rate_limit import (
+    RateLimiter, MemoryBucketStore, ConcurrencyLimiter, MemorySlots, MongoSlots, MongoBucketStore,
+    RateLimited, Overloaded
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket():
+    print("--- Testing Token Bucket ---")
+    clock = FakeClock()
+    limiter = RateLimiter(MemoryBucketStore(clock), per_minute=6, burst=3)
+
+    for _ in range(3):
+        limiter.check('alice')
+    try:
+        limiter.check('alice')
+        assert False, "Expected RateLimited"
+    except RateLimited as e:
+        print(f"Limited, retry after {e.retry_after:.1f}s")
+        assert abs(e.retry_after - 10) < 1e-6  # One token per 10s
+
+    # Other users have their own bucket
+    limiter.check('bob')
+
+    clock.now = 10
+    limiter.check('alice')
+    # Refill is capped at the burst
+    clock.now = 1000
+    for _ in range(3):
+        limiter.check('alice')
+    try:
+        limiter.check('alice', cost=2)
+        assert False, "Expected RateLimited"
+    except RateLimited as e:
+        assert abs(e.retry_after - 20) < 1e-6
+    # A cost above the burst could never be admitted
+    try:
+        limiter.check('alice', cost=4)
+        assert False, "Expected ValueError"
+    except ValueError as e:
+        print(f"Rejected: {e}")
+    print("SUCCESS: Bucket refills at the configured rate.")
+
+
+def test_concurrency_cap():
+    print("\n--- Testing LLM Concurrency Cap ---")
+    limiter = ConcurrencyLimiter(MemorySlots(2), max_waiting=10, timeout=5)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with limiter.slot():
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.pop()
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"Peak in flight: {max(peak)}")
+    assert max(peak) == 2
+    assert limiter.stats()['waiting'] == 0
+    print("SUCCESS: Never more than the limit in flight.")
+
+
+def test_overload_fails_fast():
+    print("\n--- Testing Bounded Wait Queue ---")
+    limiter = ConcurrencyLimiter(MemorySlots(1), max_waiting=1, timeout=0.2)
+    held = limiter.acquire()
+
+    # One caller may wait; it times out at the deadline
+    errors = []
+    def waiter():
+        try:
+            limiter.acquire()
+        except Overloaded as e:
+            errors.append(e)
+    t = threading.Thread(target=waiter)
+    t.start()
+    time.sleep(0.05)
+
+    # The queue is full: the next caller is refused immediately
+    start = time.perf_counter()
+    try:
+        limiter.acquire()
+        assert False, "Expected Overloaded"
+    except Overloaded:
+        assert time.perf_counter() - start < 0.05
+    t.join()
+    assert len(errors) == 1
+
+    limiter.release(held)
+    limiter.release(limiter.acquire())
+    print("SUCCESS: Full queue and deadline both raise Overloaded.")
+
+
+def test_routes_return_429():
+    print("\n--- Testing 429 Responses ---")
+    saved = (app_module.verify_token, app_module.user_store, app_module.ai_rate_limiter)
+    app_module.verify_token = lambda token: {'uid': token}
+    app_module.user_store = type('NoUsers', (), {'get': lambda self, uid: None})()
+    app_module.ai_rate_limiter = RateLimiter(MemoryBucketStore(), per_minute=1, burst=1)
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer carol'}
+        first = client.post('/api/ai/generate-recipes', json={'meal_name': 'Lunch'}, headers=headers)
+        assert first.status_code == 404  # Admitted; no such user
+        second = client.post('/api/ai/generate-recipes', json={'meal_name': 'Lunch'}, headers=headers)
+        print(second.status_code, second.headers.get('Retry-After'), second.get_json())
+        assert second.status_code == 429
+        assert 55 <= int(second.headers['Retry-After']) <= 60
+        assert second.get_json()['retry_after'] == int(second.headers['Retry-After'])
+
+        # A day plan is charged one token per meal; more meals than the burst is a 400
+        app_module.user_store = type('Users', (), {'get': lambda self, uid: {'_id': uid}})()
+        app_module.ai_rate_limiter = RateLimiter(MemoryBucketStore(), per_minute=1, burst=2)
+        plan = [{'name': f'Meal {i}', 'protein': 30, 'fat': 15, 'carbs': 50} for i in range(3)]
+        day = client.post('/api/ai/generate-day-recipes', json={'meal_plan': plan}, headers=headers)
+        print(day.status_code, day.get_json())
+        assert day.status_code == 400
+        app_module.ai_rate_limiter.check('carol', cost=2)  # Nothing was charged
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.ai_rate_limiter = saved
+    print("SUCCESS: Over-limit requests get 429 with Retry-After.")
+
+
+def test_mongo_backends():
+    print("\n--- Testing Shared (Mongo) Backends ---")
+    db = get_test_db('meal_plan_db_test_rate_limit')
+    try:
+        if isinstance(db.client, mongomock.MongoClient):
+            # Buckets refill in a pipeline update on the server clock ($$NOW), which mongomock doesn't evaluate
+            print("WARNING: mongomock, skipping the bucket store.")
+        else:
+            limiter = RateLimiter(MongoBucketStore(db['rate_limits']), per_minute=1, burst=2)
+            limiter.check('dave')
+            limiter.check('dave')
+            try:
+                limiter.check('dave')
+                assert False, "Expected RateLimited"
+            except RateLimited as e:
+                assert 0 < e.retry_after <= 60
+
+        # Two limiters over one collection behave like two workers
+        slots = [MongoSlots(db['llm_slots'], 'mistral', 1, lease=60) for _ in range(2)]
+        first = ConcurrencyLimiter(slots[0], timeout=0.1)
+        second = ConcurrencyLimiter(slots[1], timeout=0.1)
+        held = first.acquire()
+        try:
+            second.acquire()
+            assert False, "Expected Overloaded"
+        except Overloaded:
+            pass
+        first.release(held)
+        second.release(second.acquire())
+
+        # A slot whose lease ran out (holder died) is reclaimed
+        expired = MongoSlots(db['llm_slots'], 'expired', 1, lease=-1)
+        assert expired.try_acquire() and expired.try_acquire()
+        print("SUCCESS: Limits shared through Mongo.")
+    finally:
+        db.client.drop_database(db.name)
+        db.client.close()
+
+
+class AsyncCollection:
+    """
+    Awaitable wrapper over a mongomock collection, standing in for AsyncMongoClient.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def update_one(self, *args, **kwargs):
+        return self.collection.update_one(*args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return self.collection.find_one_and_update(*args, **kwargs)
+
+
+class ThreadlessExecutor(ThreadPoolExecutor):
+    def submit(self, *args, **kwargs):
+        raise AssertionError("acquire_async used an executor thread")
+
+
+def test_async_slots():
+    print("\n--- Testing Async Slot Acquisition ---")
+    collection = mongomock.MongoClient()['test']['llm_slots']
+    mongo_slots = MongoSlots(collection, 'mistral', 2, lease=60)
+    mongo_slots.bind_async(AsyncCollection(collection))
+
+    for slots in (MemorySlots(2), mongo_slots):
+        limiter = ConcurrencyLimiter(slots, max_waiting=20, timeout=5)
+        in_flight, peak = [0], [0]
+
+        async def call():
+            held = await limiter.acquire_async()
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.02)
+            in_flight[0] -= 1
+            await limiter.release_async(held)
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            # Waiters must not need executor threads: with none free, they still get through
+            loop.set_default_executor(ThreadlessExecutor())
+            await asyncio.gather(*(call() for _ in range(10)))
+
+            held = [await limiter.acquire_async() for _ in range(2)]
+            limiter.timeout = 0.05
+            try:
+                await limiter.acquire_async()
+                assert False, "Expected Overloaded"
+            except Overloaded:
+                pass
+            assert limiter.waiting == 0
+            for h in held:
+                await limiter.release_async(h)
+
+        asyncio.run(main())
+        print(f"{type(slots).__name__}: peak {peak[0]}")
+        assert peak[0] == 2
+    print("SUCCESS: Async callers queue for slots on the event loop.")
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_concurrency_cap()
+    test_overload_fails_fast()
+    test_routes_return_429()
+    test_mongo_backends()
+    test_async_slots()
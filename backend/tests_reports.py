@@ -0,0 +1,157 @@
+import io
+import os
+import weakref
+import tempfile
+import time
+from datetime import datetime, timedelta
+import app as app_module
+import reports
+from testing import mongomock_client
+from reports import ReportCache, render_updates_report, report_version, _update_tables
+from update_history import record_update
+
+
+def fake_updates(count):
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        yield {
+            'updated_at': start + timedelta(hours=i),
+            'weight': 80 - i * 0.01,
+            'goal': 'cutting',
+            'activity_level': 'moderately active',
+            'target_calories': 2479.6,
+            'protein': 248.0,
+            'fat': 55.1,
+            'carbs': 248.0
+        }
+
+
+def test_render_sizes():
+    print("--- Testing Report Rendering ---")
+    for count in (10, 1000, 10000):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        render_updates_report('user-1', fake_updates(count), buffer)
+        elapsed = time.perf_counter() - start
+        print(f"{count} rows: {len(buffer.getvalue()) // 1024}KB in {elapsed:.2f}s")
+        assert buffer.getvalue().startswith(b'%PDF')
+
+
+def test_streaming_layout():
+    print("\n--- Testing Streamed Report Layout ---")
+    import reportlab
+    from reportlab import rl_config
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+    print(f"reportlab {reportlab.Version}")
+
+    # Pins the build hooks the streaming template relies on: with output made
+    # deterministic, it must lay out exactly what reportlab's own
+    # SimpleDocTemplate does over the full flowable list
+    saved = rl_config.invariant
+    rl_config.invariant = 1
+    try:
+        streamed = io.BytesIO()
+        pages = render_updates_report('user-1', fake_updates(500), streamed)
+        styles = getSampleStyleSheet()
+        flowables = [Paragraph("User Updates Report", styles['Title']), Paragraph("User ID: user-1", styles['Normal'])]
+        for chunk in _update_tables(fake_updates(500)):
+            flowables.extend(chunk)
+        built = io.BytesIO()
+        doc = SimpleDocTemplate(built, pagesize=A4)
+        doc.build(flowables)
+    finally:
+        rl_config.invariant = saved
+    print(f"{pages} pages, {len(streamed.getvalue())} bytes")
+    assert pages == doc.page == 14
+    assert streamed.getvalue() == built.getvalue()
+
+    # Tables are made as the pages are laid out, not all up front
+    alive, peak = weakref.WeakSet(), [0]
+    make_table = reports._update_table
+
+    def tracked(rows):
+        table = make_table(rows)
+        alive.add(table)
+        peak[0] = max(peak[0], len(alive))
+        return table
+    reports._update_table = tracked
+    try:
+        render_updates_report('user-1', fake_updates(3000), io.BytesIO())
+    finally:
+        reports._update_table = make_table
+    print(f"Peak tables alive over 3000 rows: {peak[0]}")
+    assert peak[0] <= 3
+    print("SUCCESS: Streamed layout matches a full build and holds a page or two.")
+
+
+def test_report_cache():
+    print("\n--- Testing Report Cache ---")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ReportCache(directory)
+        v1 = report_version({'updated_at': datetime(2024, 1, 1)})
+        v2 = report_version({'updated_at': datetime(2024, 1, 2)})
+
+        assert cache.get('user-1', v1) is None
+        path = cache.render('user-1', v1, fake_updates(5))
+        assert cache.get('user-1', v1) == path
+
+        # A newer version replaces the old file
+        cache.render('user-1', v2, fake_updates(6))
+        assert cache.get('user-1', v1) is None and cache.get('user-1', v2)
+        print(f"Cached files: {os.listdir(directory)}")
+
+        # An open report survives a newer version's render removing its path
+        report = cache.open('user-1', v2)
+        cache.render('user-1', report_version({'updated_at': datetime(2024, 1, 3)}), fake_updates(7))
+        assert cache.get('user-1', v2) is None and report.read(4) == b'%PDF'
+        report.close()
+        assert cache.open('user-1', v1) is None
+
+
+class RacingCache(ReportCache):
+    """
+    Loses its first render to a concurrent newer version, which removes the file.
+    """
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.renders = 0
+
+    def render(self, uid, version, updates, period=None):
+        path = super().render(uid, version, updates, period)
+        self.renders += 1
+        if self.renders == 1:
+            os.remove(path)
+        return path
+
+
+def test_download_rerenders_removed_report():
+    print("\n--- Testing Report Download Race ---")
+    db = mongomock_client()['meal_plan_db_test']
+    for entry in fake_updates(3):
+        record_update(db['user_update_buckets'], 'racer', entry)
+    saved = app_module.verify_token, app_module.report_cache, app_module.update_buckets_collection
+    with tempfile.TemporaryDirectory() as directory:
+        app_module.verify_token = lambda token: {'uid': 'racer'}
+        app_module.report_cache = RacingCache(directory)
+        app_module.update_buckets_collection = db['user_update_buckets']
+        try:
+            response = app_module.app.test_client().get('/api/report/user-updates',
+                                                        headers={'Authorization': 'Bearer t'})
+            body = response.get_data()
+            print(f"{response.status_code}, {len(body)} bytes after {app_module.report_cache.renders} renders")
+            assert response.status_code == 200 and body.startswith(b'%PDF')
+            assert int(response.headers['Content-Length']) == len(body)
+            assert app_module.report_cache.renders == 2
+        finally:
+            app_module.verify_token, app_module.report_cache, app_module.update_buckets_collection = saved
+    print("SUCCESS: A report removed before it was opened is rendered again.")
+
+
+if __name__ == "__main__":
+    test_render_sizes()
+    test_streaming_layout()
+    test_report_cache()
+    test_download_rerenders_removed_report()
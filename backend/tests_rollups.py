@@ -0,0 +1,72 @@
+import mongomock
+from testing import get_test_db
+from workout_rollups import workout_metrics, rollup_updates, apply_workout_rollups, rebuild_workout_rollups
+
+
+WORKOUTS = [
+    {'user_id': 'u1', 'week_start': '2024-01-01', 'workout_type': 'Strength',
+     'week_data': {'mon': {'duration': 45, 'sets': 5, 'reps': 5, 'weight': 100},
+                   'wed': [{'duration': 30, 'volume': 1500, 'calories': 200}]}},
+    {'user_id': 'u1', 'week_start': '2024-01-01', 'workout_type': 'cardio',
+     'week_data': [{'duration': 20}]},
+    {'user_id': 'u1', 'week_start': '2024-01-08', 'workout_type': None, 'week_data': {}},
+    {'user_id': 'u2', 'week_start': '2024-01-01', 'workout_type': 'yoga',
+     'week_data': {'sun': {'duration': 'bad'}}},
+]
+
+
+def test_workout_metrics():
+    print("--- Testing Workout Metrics ---")
+    strength = workout_metrics(WORKOUTS[0])
+    print(f"Strength: {strength}")
+    assert strength == {'sessions': 2, 'volume': 4000.0, 'duration_min': 75.0, 'active_calories': 470.0}
+
+    # No sessions still counts as one; unparseable numbers count as zero
+    assert workout_metrics(WORKOUTS[2])['sessions'] == 1
+    assert workout_metrics(WORKOUTS[3])['duration_min'] == 0.0
+
+    ops = rollup_updates(WORKOUTS)
+    print(f"Upserts: {len(ops)}")
+    assert len(ops) == 3
+    inc = ops[0]._doc['$inc']
+    assert inc['workouts'] == 2 and inc['sessions'] == 3
+    assert inc['by_type.strength'] == 2 and inc['by_type.cardio'] == 1
+
+
+def test_rebuild_matches_incremental():
+    print("\n--- Testing Rollup Rebuild Matches Incremental Updates ---")
+    db = get_test_db()
+    try:
+        db['weekly_workout'].insert_many([dict(w) for w in WORKOUTS])
+        for workout in WORKOUTS:
+            apply_workout_rollups(db['workout_rollups'], [workout])
+        incremental = {d['_id']: d for d in db['workout_rollups'].find({}, {'updated_at': 0})}
+
+        # Upserts of repeated weeks add up to the per-workout metrics
+        assert sorted(incremental) == ['u1:2024-01-01', 'u1:2024-01-08', 'u2:2024-01-01']
+        for key, doc in incremental.items():
+            user_id, week_start = key.split(':')
+            metrics = [workout_metrics(w) for w in WORKOUTS if (w['user_id'], w['week_start']) == (user_id, week_start)]
+            assert doc['workouts'] == len(metrics)
+            for field in ('sessions', 'volume', 'duration_min', 'active_calories'):
+                assert doc[field] == sum(m[field] for m in metrics), (key, field)
+
+        if isinstance(db.client, mongomock.MongoClient):
+            # The rebuild is a server-side aggregation ($convert, $replaceAll) mongomock can't run
+            print("WARNING: mongomock, skipping the rebuild comparison.")
+            return
+        rebuild_workout_rollups(db['weekly_workout'], db['workout_rollups'])
+        rebuilt = {d['_id']: d for d in db['workout_rollups'].find({}, {'updated_at': 0})}
+        print(f"Incremental: {incremental}\nRebuilt: {rebuilt}")
+        assert incremental == rebuilt
+
+        rebuild_workout_rollups(db['weekly_workout'], db['workout_rollups'], user_id='u1')
+        assert {d['_id'] for d in db['workout_rollups'].find()} == set(rebuilt)
+        print("SUCCESS: Rebuild and incremental rollups agree.")
+    finally:
+        db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    test_workout_metrics()
+    test_rebuild_matches_incremental()
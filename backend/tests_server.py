@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_env(**extra):
+    # Fail fast instead of waiting on a MongoDB that isn't there
+    return {**os.environ, 'MONGO_SERVER_SELECTION_TIMEOUT_MS': '500', **extra}
+
+
+def test_import_has_no_side_effects():
+    print("--- Testing Side-Effect-Free Import ---")
+    script = (
+        "import sys, app, firebase_config\n"
+        "assert app.client is None and app.recipe_jobs is None\n"
+        "assert firebase_config.signing_keys is None\n"
+        "heavy = [m for m in ('reportlab', 'mistralai', 'firebase_admin', 'numpy', 'jwt') if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+        "assert app.create_app() is app.app\n"
+        "assert app.client is not None and app.recipe_jobs is not None\n"
+        "assert firebase_config.signing_keys is not None\n"
+        "app.close_clients()\n"
+        "print('ok')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script], cwd=BACKEND_DIR, capture_output=True, text=True,
+        env=server_env(), timeout=60
+    )
+    print(result.stdout.strip())
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith('ok')
+
+
+def test_prefork_workers():
+    print("\n--- Testing Pre-fork Workers and Graceful Shutdown ---")
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        env=server_env(BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY='2', WEB_GRACEFUL_TIMEOUT='5')
+    )
+    try:
+        deadline = time.monotonic() + 30
+        body = None
+        while time.monotonic() < deadline and body is None:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+                    body = response.read()
+            except OSError:
+                time.sleep(0.2)
+        assert body and b'Welcome' in body
+    finally:
+        server.send_signal(signal.SIGTERM)
+        output, _ = server.communicate(timeout=30)
+
+    print(output[-2000:])
+    assert server.returncode == 0
+    # Every worker built its own clients after fork; the master built none
+    assert output.count('initialized clients') == 2
+    assert output.count('Connected to MongoDB') == 2
+    print("SUCCESS: Workers initialized after fork and shut down cleanly.")
+
+
+if __name__ == "__main__":
+    test_import_has_no_side_effects()
+    test_prefork_workers()
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import time
+import jwt
+from jwt.algorithms import RSAAlgorithm
+from cryptography.hazmat.primitives.asymmetric import rsa
+from firebase_config import SigningKeys, TokenCache, TokenVerifier
+
+PROJECT_ID = 'balance-bite-test'
+
+
+def make_key_pair(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg='RS256', use='sig')
+    return private_key, jwk
+
+
+def make_token(private_key, kid, uid='user-1', **overrides):
+    now = int(time.time())
+    claims = {
+        'iss': f'https://securetoken.google.com/{PROJECT_ID}',
+        'aud': PROJECT_ID,
+        'sub': uid,
+        'iat': now,
+        'auth_time': now,
+        'exp': now + 3600,
+        'email': f'{uid}@example.com'
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+def test_token_verification():
+    print("--- Testing Local Token Verification ---")
+
+    private_key, jwk = make_key_pair('key-1')
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump({'keys': [jwk]}, f)
+        jwks_path = f.name
+
+    try:
+        keys = SigningKeys(path=jwks_path)
+        keys.refresh()
+        cache = TokenCache(max_size=2)
+        verifier = TokenVerifier(PROJECT_ID, keys, cache)
+
+        token = make_token(private_key, 'key-1')
+        claims = verifier.verify(token)
+        assert claims['uid'] == 'user-1'
+        assert verifier.verify(token) is claims
+        print(f"Cache after repeat: {cache.stats()}")
+        assert cache.stats()['hits'] == 1
+        # A lookup that verification will follow doesn't count its own miss
+        assert cache.get('unseen', count_miss=False) is None and cache.stats()['misses'] == 1
+
+        # Expired, wrong audience and unknown-key tokens are rejected
+        for bad in (
+            make_token(private_key, 'key-1', exp=int(time.time()) - 10),
+            make_token(private_key, 'key-1', aud='other-project'),
+            make_token(private_key, 'key-2'),
+        ):
+            try:
+                verifier.verify(bad)
+                raise AssertionError("Bad token was accepted")
+            except (jwt.InvalidTokenError, ValueError) as e:
+                print(f"Rejected: {e}")
+
+        # LRU eviction keeps the cache at its size cap
+        for i in range(3):
+            verifier.verify(make_token(private_key, 'key-1', uid=f'user-{i + 2}'))
+        assert cache.stats()['size'] == 2
+        print("SUCCESS: Local verification and cache behave correctly.")
+    finally:
+        os.remove(jwks_path)
+
+
+if __name__ == "__main__":
+    test_token_verification()
@@ -0,0 +1,86 @@
+import app as app_module
+from testing import get_test_db, CountingCollection
+from user_store import UserStore
+
+
+def signup_payload():
+    return {
+        'name': 'Test User', 'age': 30, 'height': 180, 'weight': 80, 'meals': 4,
+        'sex': 'male', 'a_level': 'moderately active', 'goal': 'cutting', 'is_admin': True
+    }
+
+
+def count_round_trips(client, commands, method, path, **kwargs):
+    commands.clear()
+    response = getattr(client, method)(path, headers={'Authorization': 'Bearer test'}, **kwargs)
+    assert response.status_code < 400, response.get_json()
+    return list(commands)
+
+
+def test_round_trips():
+    print("--- Testing Mongo Round Trips Per Request ---")
+    commands = []
+    db = get_test_db()
+
+    saved = app_module.verify_token, app_module.user_store, app_module.update_buckets_collection
+    app_module.verify_token = lambda token: {'uid': 'round-trip-user', 'email': 'rt@example.com'}
+    app_module.update_buckets_collection = CountingCollection(db['user_update_buckets'], commands)
+    try:
+        for ttl in (0, 30):
+            app_module.user_store = UserStore(CountingCollection(db['users'], commands), ttl=ttl)
+            client = app_module.app.test_client()
+            count_round_trips(client, commands, 'post', '/api/signup', json=signup_payload())
+
+            reads = {
+                path: count_round_trips(client, commands, 'get', path)
+                for path in ('/api/user/profile', '/api/user/meal-plan', '/api/admin/cache-stats')
+            }
+            update = count_round_trips(client, commands, 'post', '/api/user/update', json={'weight': 79})
+            print(f"ttl={ttl}: reads={reads} update={update}")
+
+            expected_reads = 0 if ttl else 1
+            assert all(len(c) == expected_reads for c in reads.values())
+            # At most two: the profile write, then the log bucket append and its
+            # week+month series in one bulk write. Without the process cache
+            # the update also reads the profile first.
+            writes = update if ttl else update[1:]
+            assert len(writes) <= 2 and writes == ['findAndModify', 'update']
+            assert ttl or update[0] == 'find'
+        print("SUCCESS: Round trips within budget.")
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.update_buckets_collection = saved
+        db.client.drop_database(db.name)
+
+
+def test_conditional_get():
+    print("\n--- Testing ETag / Conditional GET ---")
+    db = get_test_db()
+
+    saved = app_module.verify_token, app_module.user_store, app_module.update_buckets_collection
+    app_module.verify_token = lambda token: {'uid': 'etag-user', 'email': 'etag@example.com'}
+    app_module.update_buckets_collection = db['user_update_buckets']
+    app_module.user_store = UserStore(db['users'])
+    try:
+        client = app_module.app.test_client()
+        headers = {'Authorization': 'Bearer test'}
+        client.post('/api/signup', headers=headers, json=signup_payload())
+
+        first = client.get('/api/user/meal-plan', headers=headers)
+        etag = first.headers['ETag']
+        repeat = client.get('/api/user/meal-plan', headers={**headers, 'If-None-Match': etag})
+        print(f"First: {first.status_code}, repeat: {repeat.status_code}")
+        assert first.status_code == 200 and repeat.status_code == 304
+
+        # Any write bumps the version and invalidates the ETag
+        client.post('/api/user/update', headers=headers, json={'weight': 78})
+        changed = client.get('/api/user/meal-plan', headers={**headers, 'If-None-Match': etag})
+        assert changed.status_code == 200 and changed.headers['ETag'] != etag
+        print("SUCCESS: ETag revalidation works.")
+    finally:
+        app_module.verify_token, app_module.user_store, app_module.update_buckets_collection = saved
+        db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    test_round_trips()
+    test_conditional_get()
@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReplaceOne, DESCENDING
+
+# The profile update log, stored so storage and reads scale with time span
+# rather than with the number of edits. user_update_buckets holds two kinds
+# of document, so one bulk write both appends an update and folds it into
+# its series:
+#
+#   buckets: a user's updates for one month, in order, at most
+#     BUCKET_MAX_ENTRIES per document (a busy month spills into another):
+#     {user_id, month: 'YYYY-MM', count, first_at, last_at, entries: [entry]}
+#
+#   series: one document per user per week and per month:
+#     {_id: '<user_id>:<period>:<YYYY-MM-DD>', user_id, period, start, count,
+#      weight_sum, weight_min, weight_max, target_calories_sum, last_at,
+#      last: the period's latest entry}
+#
+# Only buckets have `month` and only series have `period`; every query
+# filters on one of them. An entry is the old user_updates row without
+# user_id (see ENTRY_FIELDS). Reports and trends read the series; the
+# buckets keep the full history.
+
+BUCKET_MAX_ENTRIES = 200
+PERIODS = ('week', 'month')
+ENTRY_FIELDS = ('weight', 'meals', 'activity_level', 'goal', 'diet_type', 'tdee', 'target_calories',
+                'carbs', 'protein', 'fat', 'updated_at')
+MIGRATE_BATCH = 1000
+BUCKET_FILTER = {'month': {'$exists': True}}  # Bucket documents, not series
+
+
+def period_start(ts, period):
+    """
+    Midnight on the Monday of ts's week, or on the first of its month.
+    """
+    day = datetime(ts.year, ts.month, ts.day)
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def series_id(user_id, period, start):
+    return f"{user_id}:{period}:{start.strftime('%Y-%m-%d')}"
+
+
+def make_entry(doc):
+    return {field: doc[field] for field in ENTRY_FIELDS if field in doc}
+
+
+def bucket_update(user_id, entry):
+    """
+    (filter, update) appending `entry` to the user's open bucket for its
+    month; with upsert=True a new bucket is started once that one is full.
+    """
+    ts = entry['updated_at']
+    return (
+        {'user_id': user_id, 'month': ts.strftime('%Y-%m'), 'count': {'$lt': BUCKET_MAX_ENTRIES}},
+        {
+            '$push': {'entries': entry},
+            '$inc': {'count': 1},
+            '$min': {'first_at': ts},
+            '$max': {'last_at': ts}
+        }
+    )
+
+
+def _fold(totals, user_id, entry):
+    # Adds one entry to the in-memory totals of its week and month
+    weight = float(entry.get('weight') or 0)
+    calories = float(entry.get('target_calories') or 0)
+    for period in PERIODS:
+        start = period_start(entry['updated_at'], period)
+        t = totals.get((user_id, period, start))
+        if t is None:
+            t = totals[(user_id, period, start)] = {
+                'count': 0, 'weight_sum': 0.0, 'weight_min': weight, 'weight_max': weight,
+                'target_calories_sum': 0.0, 'last_at': entry['updated_at'], 'last': entry
+            }
+        t['count'] += 1
+        t['weight_sum'] += weight
+        t['target_calories_sum'] += calories
+        t['weight_min'] = min(t['weight_min'], weight)
+        t['weight_max'] = max(t['weight_max'], weight)
+        if entry['updated_at'] >= t['last_at']:
+            t['last_at'], t['last'] = entry['updated_at'], entry
+
+
+def series_updates(user_id, entries):
+    """
+    Folds new entries into one upsert per (period, start).
+    """
+    totals = {}
+    for entry in entries:
+        _fold(totals, user_id, entry)
+    return [
+        UpdateOne(
+            {'_id': series_id(user_id, period, start)},
+            {
+                '$inc': {'count': t['count'], 'weight_sum': t['weight_sum'], 'target_calories_sum': t['target_calories_sum']},
+                '$min': {'weight_min': t['weight_min']},
+                '$max': {'weight_max': t['weight_max'], 'last_at': t['last_at']},
+                '$set': {'last': t['last']},
+                '$setOnInsert': {'user_id': user_id, 'period': period, 'start': start}
+            },
+            upsert=True
+        )
+        for (_, period, start), t in totals.items()
+    ]
+
+
+def update_ops(user_id, entry):
+    # The bucket append plus the week and month series upserts
+    return [UpdateOne(*bucket_update(user_id, entry), upsert=True)] + series_updates(user_id, [entry])
+
+
+def record_update(collection, user_id, entry):
+    """
+    Appends one update to the log and its week/month series: one round trip.
+    """
+    collection.bulk_write(update_ops(user_id, entry), ordered=False)
+
+
+async def record_update_async(collection, user_id, entry):
+    """
+    record_update for an async (AsyncMongoClient) collection.
+    """
+    await collection.bulk_write(update_ops(user_id, entry), ordered=False)
+
+
+def migrate_user_updates(source, buckets_collection, user_id=None):
+    """
+    Copies raw user_updates rows into month buckets. Migrated buckets have
+    deterministic ids, so running it again replaces rather than duplicates
+    them; buckets written live since are left alone. Returns rows copied.
+    """
+    query = {'user_id': user_id} if user_id else {}
+    # Served by the (user_id, updated_at desc) index; each month is put back in order below
+    cursor = source.find(query, {'_id': 0}).sort([('user_id', 1), ('updated_at', DESCENDING)]).batch_size(MIGRATE_BATCH)
+
+    ops = []
+    copied = 0
+    current, rows = None, []
+
+    def flush_month():
+        rows.reverse()
+        uid, month = current
+        for n in range(0, len(rows), BUCKET_MAX_ENTRIES):
+            chunk = rows[n:n + BUCKET_MAX_ENTRIES]
+            ops.append(ReplaceOne({'_id': f"{uid}:{month}:migrated-{n // BUCKET_MAX_ENTRIES}"}, {
+                'user_id': uid, 'month': month, 'count': BUCKET_MAX_ENTRIES,  # Closed to live appends
+                'first_at': chunk[0]['updated_at'], 'last_at': chunk[-1]['updated_at'], 'entries': chunk
+            }, upsert=True))
+
+    for doc in cursor:
+        if not isinstance(doc.get('updated_at'), datetime):
+            continue
+        key = (doc['user_id'], doc['updated_at'].strftime('%Y-%m'))
+        if key != current:
+            if rows:
+                flush_month()
+            current, rows = key, []
+        rows.append(make_entry(doc))
+        copied += 1
+        if len(ops) >= MIGRATE_BATCH // 10:
+            buckets_collection.bulk_write(ops, ordered=False)
+            ops = []
+    if rows:
+        flush_month()
+    if ops:
+        buckets_collection.bulk_write(ops, ordered=False)
+    return copied
+
+
+def rebuild_update_series(collection, user_id=None):
+    """
+    Recomputes the week and month series from the buckets, one user at a
+    time. Returns the number of series documents written.
+    """
+    query = {'user_id': user_id, **BUCKET_FILTER} if user_id else dict(BUCKET_FILTER)
+    cursor = collection.find(query, {'_id': 0, 'user_id': 1, 'entries': 1}).sort([('user_id', 1), ('month', 1)])
+
+    written = 0
+    current, totals = None, {}
+
+    def flush_user():
+        docs = [
+            ReplaceOne({'_id': series_id(uid, period, start)}, {
+                'user_id': uid, 'period': period, 'start': start, **t
+            }, upsert=True)
+            for (uid, period, start), t in totals.items()
+        ]
+        collection.delete_many({'user_id': current, 'period': {'$in': list(PERIODS)}})
+        if docs:
+            collection.bulk_write(docs, ordered=False)
+        return len(docs)
+
+    for bucket in cursor:
+        if bucket['user_id'] != current:
+            if current is not None:
+                written += flush_user()
+            current, totals = bucket['user_id'], {}
+        for entry in bucket.get('entries') or []:
+            _fold(totals, current, entry)
+    if current is not None:
+        written += flush_user()
+    return written
+
+
+def series_point(doc):
+    """
+    API shape of one series document.
+    """
+    count = doc.get('count') or 0
+    last = doc.get('last') or {}
+    return {
+        'start': doc['start'].strftime('%Y-%m-%d'),
+        'updates': count,
+        'weight_avg': round(doc['weight_sum'] / count, 2) if count else None,
+        'weight_min': doc.get('weight_min'),
+        'weight_max': doc.get('weight_max'),
+        'target_calories_avg': round(doc['target_calories_sum'] / count, 1) if count else None,
+        'goal': last.get('goal'),
+        'activity_level': last.get('activity_level')
+    }
+
+
+def series_report_rows(docs):
+    """
+    Maps series documents to the row shape reports.update_report_row takes:
+    average weight over the period, targets as of its last update.
+    """
+    for doc in docs:
+        last = doc.get('last') or {}
+        count = doc.get('count') or 0
+        yield {
+            'updated_at': doc['start'],
+            'weight': round(doc['weight_sum'] / count, 1) if count else last.get('weight', 0),
+            'goal': last.get('goal', 'N/A'),
+            'activity_level': last.get('activity_level', 'N/A'),
+            'target_calories': last.get('target_calories', last.get('tdee', 0)),
+            'protein': last.get('protein', 0),
+            'fat': last.get('fat', 0),
+            'carbs': last.get('carbs', 0)
+        }
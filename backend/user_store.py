@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+from datetime import datetime
+from flask import g, has_app_context
+from pymongo import ReturnDocument
+
+# Seconds a user document may be served from the process cache; 0 disables it.
+# Writes through this store invalidate it, but other processes only see a
+# change once their copy expires, so keep this short.
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 0))
+
+
+class UserStore:
+    """
+    Access layer for user documents. Each user is loaded at most once per
+    request (an identity map on flask.g), optionally backed by a short-TTL
+    process cache, and writes return the updated document in the same round trip.
+    """
+
+    def __init__(self, collection, ttl=USER_CACHE_TTL):
+        self.collection = collection
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _identity_map(self):
+        if not has_app_context():
+            return None
+        if 'users' not in g:
+            g.users = {}
+        return g.users
+
+    def _remember(self, uid, user):
+        identity_map = self._identity_map()
+        if identity_map is not None:
+            identity_map[uid] = user
+        if self.ttl > 0:
+            with self._lock:
+                if user is None:
+                    self._cache.pop(uid, None)
+                else:
+                    self._cache[uid] = (user, time.monotonic() + self.ttl)
+
+    def get(self, uid):
+        identity_map = self._identity_map()
+        if identity_map is not None and uid in identity_map:
+            return identity_map[uid]
+
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._cache.get(uid)
+            if entry and entry[1] > time.monotonic():
+                if identity_map is not None:
+                    identity_map[uid] = entry[0]
+                return entry[0]
+
+        user = self.collection.find_one({'_id': uid})
+        if user is None:
+            # Don't cache misses process-wide; the user may sign up next
+            if identity_map is not None:
+                identity_map[uid] = None
+            return None
+        self._remember(uid, user)
+        return user
+
+    def update(self, uid, set_doc, upsert=False):
+        """
+        Applies a $set, bumps the document's `version` and returns the updated
+        document (None if the user doesn't exist and upsert is off).
+        """
+        user = self.collection.find_one_and_update(
+            {'_id': uid},
+            # updated_at is the analytics snapshot's refresh watermark
+            {'$set': {**set_doc, 'updated_at': datetime.utcnow()}, '$inc': {'version': 1}},
+            upsert=upsert,
+            return_document=ReturnDocument.AFTER
+        )
+        self._remember(uid, user)
+        return user
+
+    def invalidate(self, uid):
+        identity_map = self._identity_map()
+        if identity_map is not None:
+            identity_map.pop(uid, None)
+        with self._lock:
+            self._cache.pop(uid, None)
+
+    def clear(self):
+        """
+        Drops the process cache, e.g. after a bulk write outside this store.
+        """
+        with self._lock:
+            self._cache.clear()
+
+
+class AsyncUserStore(UserStore):
+    """
+    UserStore over an async (AsyncMongoClient) collection, for the async app.
+    Shares the process cache logic; there is no flask.g identity map, so
+    routes load the user once and pass it along.
+    """
+
+    async def get(self, uid):
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._cache.get(uid)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+
+        user = await self.collection.find_one({'_id': uid})
+        if user is not None:
+            self._remember(uid, user)
+        return user
+
+    async def update(self, uid, set_doc, upsert=False):
+        user = await self.collection.find_one_and_update(
+            {'_id': uid},
+            {'$set': {**set_doc, 'updated_at': datetime.utcnow()}, '$inc': {'version': 1}},
+            upsert=upsert,
+            return_document=ReturnDocument.AFTER
+        )
+        self._remember(uid, user)
+        return user
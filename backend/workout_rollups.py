@@ -0,0 +1,226 @@
+import re
+from datetime import datetime
+from pymongo import UpdateOne
+
+from constants import WORKOUT_KCAL_PER_MIN, DEFAULT_WORKOUT_KCAL_PER_MIN
+
+# Rollups are one document per user per week:
+#   {_id: '<user_id>:<week_start>', user_id, week_start, workouts, sessions,
+#    volume, duration_min, active_calories, by_type: {type: sessions}, updated_at}
+#
+# `week_data` is free-form; sessions are read from it as follows:
+#   - a dict of day -> session, or day -> [sessions]
+#   - or a list of sessions
+# where a session is a dict that may carry `duration` (minutes), `calories`
+# (kcal) and `volume` (kg), or `sets`, `reps` and `weight` to derive volume.
+# A workout with no sessions in week_data still counts as one session.
+# The Python path (incremental) and the pipeline (backfill) must agree.
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _sessions(week_data):
+    entries = week_data.values() if isinstance(week_data, dict) else (week_data or [])
+    sessions = []
+    for entry in entries:
+        sessions.extend(entry if isinstance(entry, list) else [entry])
+    return [s for s in sessions if isinstance(s, dict)]
+
+
+def _type_key(workout_type):
+    # Field-name safe: no dots or leading $
+    return re.sub(r'[.$]', '_', str(workout_type).lower() if workout_type else 'other')
+
+
+def workout_metrics(workout):
+    """
+    Session count, volume, duration and estimated active calories for one workout document.
+    """
+    workout_type = str(workout.get('workout_type') or '').lower()
+    rate = WORKOUT_KCAL_PER_MIN.get(workout_type, DEFAULT_WORKOUT_KCAL_PER_MIN)
+    sessions = _sessions(workout.get('week_data'))
+
+    volume = duration = calories = 0.0
+    for s in sessions:
+        minutes = _number(s.get('duration'))
+        duration += minutes
+        calories += _number(s['calories']) if s.get('calories') is not None else minutes * rate
+        if s.get('volume') is not None:
+            volume += _number(s['volume'])
+        else:
+            volume += _number(s.get('sets')) * _number(s.get('reps')) * _number(s.get('weight'))
+
+    return {
+        'sessions': max(1, len(sessions)),
+        'volume': volume,
+        'duration_min': duration,
+        'active_calories': calories
+    }
+
+
+def rollup_id(user_id, week_start):
+    return f"{user_id}:{week_start}"
+
+
+def rollup_updates(workouts):
+    """
+    Folds newly inserted workouts into one $inc upsert per (user, week).
+    """
+    totals = {}
+    for workout in workouts:
+        key = (workout['user_id'], str(workout['week_start']))
+        metrics = workout_metrics(workout)
+        inc = totals.setdefault(key, {'workouts': 0, 'sessions': 0, 'volume': 0.0, 'duration_min': 0.0, 'active_calories': 0.0})
+        inc['workouts'] += 1
+        for field, value in metrics.items():
+            inc[field] += value
+        type_field = f"by_type.{_type_key(workout.get('workout_type'))}"
+        inc[type_field] = inc.get(type_field, 0) + metrics['sessions']
+
+    now = datetime.utcnow()
+    return [
+        UpdateOne(
+            {'_id': rollup_id(user_id, week_start)},
+            {
+                '$inc': inc,
+                '$set': {'updated_at': now},
+                '$setOnInsert': {'user_id': user_id, 'week_start': week_start}
+            },
+            upsert=True
+        )
+        for (user_id, week_start), inc in totals.items()
+    ]
+
+
+def apply_workout_rollups(rollups_collection, workouts):
+    ops = rollup_updates(workouts)
+    if ops:
+        rollups_collection.bulk_write(ops, ordered=False)
+
+
+def _num(expr):
+    return {'$convert': {'input': expr, 'to': 'double', 'onError': 0, 'onNull': 0}}
+
+
+def rollup_pipeline(target, user_id=None):
+    """
+    Aggregation that rebuilds rollups from raw weekly_workout documents.
+    Mirrors workout_metrics.
+    """
+    rate = {'$switch': {
+        'branches': [
+            {'case': {'$eq': [{'$toLower': {'$toString': {'$ifNull': ['$workout_type', '']}}}, name]}, 'then': value}
+            for name, value in WORKOUT_KCAL_PER_MIN.items()
+        ],
+        'default': DEFAULT_WORKOUT_KCAL_PER_MIN
+    }}
+
+    # Same as _type_key: lowercased, 'other' when missing, no dots or $
+    workout_type = {'$toLower': {'$toString': {'$ifNull': ['$workout_type', '']}}}
+    type_key = {'$replaceAll': {
+        'input': {'$replaceAll': {
+            'input': {'$cond': [{'$eq': [workout_type, '']}, 'other', workout_type]},
+            'find': '.', 'replacement': '_'
+        }},
+        'find': {'$literal': '$'}, 'replacement': '_'
+    }}
+
+    entries = {'$cond': [
+        {'$isArray': '$week_data'},
+        '$week_data',
+        {'$cond': [
+            {'$eq': [{'$type': '$week_data'}, 'object']},
+            {'$map': {'input': {'$objectToArray': '$week_data'}, 'in': '$$this.v'}},
+            []
+        ]}
+    ]}
+    flattened = {'$reduce': {
+        'input': entries,
+        'initialValue': [],
+        'in': {'$concatArrays': ['$$value', {'$cond': [{'$isArray': '$$this'}, '$$this', ['$$this']]}]}
+    }}
+
+    def session_sum(expr):
+        return {'$sum': {'$map': {'input': '$sessions', 'as': 's', 'in': expr}}}
+
+    pipeline = []
+    if user_id:
+        pipeline.append({'$match': {'user_id': user_id}})
+    pipeline += [
+        {'$project': {
+            'user_id': 1,
+            'week_start': {'$toString': '$week_start'},
+            'type': type_key,
+            'rate': rate,
+            'sessions': {'$filter': {'input': flattened, 'cond': {'$eq': [{'$type': '$$this'}, 'object']}}}
+        }},
+        {'$project': {
+            'user_id': 1,
+            'week_start': 1,
+            'type': 1,
+            'sessions_n': {'$max': [1, {'$size': '$sessions'}]},
+            'duration_min': session_sum(_num('$$s.duration')),
+            'active_calories': session_sum({'$cond': [
+                {'$eq': [{'$ifNull': ['$$s.calories', None]}, None]},
+                {'$multiply': [_num('$$s.duration'), '$rate']},
+                _num('$$s.calories')
+            ]}),
+            'volume': session_sum({'$cond': [
+                {'$eq': [{'$ifNull': ['$$s.volume', None]}, None]},
+                {'$multiply': [_num('$$s.sets'), _num('$$s.reps'), _num('$$s.weight')]},
+                _num('$$s.volume')
+            ]})
+        }},
+        # Per type first, so by_type can be built in the second group
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'week_start': '$week_start', 'type': '$type'},
+            'workouts': {'$sum': 1},
+            'sessions': {'$sum': '$sessions_n'},
+            'volume': {'$sum': '$volume'},
+            'duration_min': {'$sum': '$duration_min'},
+            'active_calories': {'$sum': '$active_calories'}
+        }},
+        {'$group': {
+            '_id': {'user_id': '$_id.user_id', 'week_start': '$_id.week_start'},
+            'workouts': {'$sum': '$workouts'},
+            'sessions': {'$sum': '$sessions'},
+            'volume': {'$sum': '$volume'},
+            'duration_min': {'$sum': '$duration_min'},
+            'active_calories': {'$sum': '$active_calories'},
+            'by_type': {'$push': {'k': '$_id.type', 'v': '$sessions'}}
+        }},
+        {'$project': {
+            '_id': {'$concat': ['$_id.user_id', ':', '$_id.week_start']},
+            'user_id': '$_id.user_id',
+            'week_start': '$_id.week_start',
+            'workouts': 1,
+            'sessions': 1,
+            'volume': 1,
+            'duration_min': 1,
+            'active_calories': 1,
+            'by_type': {'$arrayToObject': '$by_type'},
+            'updated_at': '$$NOW'
+        }},
+    ]
+    if user_id:
+        pipeline.append({'$merge': {'into': target, 'whenMatched': 'replace', 'whenNotMatched': 'insert'}})
+    else:
+        pipeline.append({'$out': target})
+    return pipeline
+
+
+def rebuild_workout_rollups(workouts_collection, rollups_collection, user_id=None):
+    """
+    Recomputes rollups from raw data. A full rebuild swaps the collection
+    atomically with $out; a per-user rebuild replaces that user's weeks.
+    """
+    if user_id:
+        rollups_collection.delete_many({'user_id': user_id})
+    workouts_collection.aggregate(rollup_pipeline(rollups_collection.name, user_id), allowDiskUse=True)
+    query = {'user_id': user_id} if user_id else {}
+    return rollups_collection.count_documents(query)
@@ -0,0 +1,119 @@
+import os
+import atexit
+import logging
+import threading
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_BATCH = int(os.getenv('WRITE_BEHIND_BATCH', 500))
+WRITE_BEHIND_DELAY = float(os.getenv('WRITE_BEHIND_DELAY', 1.0))  # Seconds
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', 10 * WRITE_BEHIND_BATCH))
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    """
+    Collects single-document inserts in memory and writes them with one
+    unordered insert_many, when `max_batch` documents are waiting or
+    `max_delay` seconds have passed. Anything still buffered is flushed on
+    close(), which runs at interpreter exit.
+
+    Documents accepted here are not durable until flushed; a hard crash
+    loses at most one batch window. At most `max_pending` documents are
+    held: add() raises BufferFull beyond that, and while Mongo is down a
+    failed batch is re-queued only up to the limit, oldest dropped first.
+    """
+
+    def __init__(self, collection, max_batch=WRITE_BEHIND_BATCH, max_delay=WRITE_BEHIND_DELAY, on_flush=None,
+                 max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.collection = collection
+        self.on_flush = on_flush  # Called with the documents each flush actually inserted
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, doc):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            if len(self._pending) >= self.max_pending:
+                raise BufferFull(f"{len(self._pending)} writes already waiting")
+            self._pending.append(doc)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        # One flush at a time keeps batches in arrival order
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                written = batch
+            except BulkWriteError as e:
+                failed = {err['index'] for err in e.details.get('writeErrors', [])}
+                written = [doc for i, doc in enumerate(batch) if i not in failed]
+                self.errors += len(failed)
+                logger.error(f"Write-behind flush had {len(failed)} errors")
+            except Exception as e:
+                # Keep the batch for the next attempt, up to max_pending
+                with self._lock:
+                    self._pending[:0] = batch
+                    overflow = len(self._pending) - self.max_pending
+                    if overflow > 0:
+                        del self._pending[:overflow]
+                        self.dropped += overflow
+                self.errors += 1
+                logger.error(f"Write-behind flush failed: {e}")
+                if overflow > 0:
+                    logger.error(f"Write-behind buffer full, dropped {overflow} oldest writes")
+                return 0
+            self.flushed += len(written)
+            self.batches += 1
+            if self.on_flush and written:
+                try:
+                    self.on_flush(written)
+                except Exception as e:
+                    logger.error(f"Write-behind on_flush failed: {e}")
+            return len(written)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.max_delay)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'flushed': self.flushed, 'batches': self.batches, 'errors': self.errors,
+                'dropped': self.dropped}
@@ -26,12 +26,34 @@ interface Suggestion {
     created_at?: string;
 }
 
+interface Totals {
+    users: number;
+    suggestions: number;
+}
+
+const PAGE_LIMIT = 100;
+
+// The admin listings are keyset-paginated: fetch one page and keep its `next` token
+async function fetchPage<T>(path: string, key: string, token: string, cursor: string | null = null) {
+    const params: Record<string, string | number> = { limit: PAGE_LIMIT };
+    if (cursor) params.cursor = cursor;
+    const res = await axios.get(`${API_BASE}${path}`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params
+    });
+    return { items: (res.data[key] || []) as T[], next: (res.data.next ?? null) as string | null };
+}
+
 export default function AdminDashboard() {
     const { user, loading } = useAuth();
     const { showToast } = useToast();
     const router = useRouter();
     const [users, setUsers] = useState<User[]>([]);
     const [suggestions, setSuggestions] = useState<Suggestion[]>([]);
+    const [usersNext, setUsersNext] = useState<string | null>(null);
+    const [suggestionsNext, setSuggestionsNext] = useState<string | null>(null);
+    const [totals, setTotals] = useState<Totals | null>(null);
+    const [loadingMore, setLoadingMore] = useState<"users" | "suggestions" | null>(null);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
 
@@ -51,17 +73,19 @@ export default function AdminDashboard() {
         try {
             const token = await user.getIdToken();
 
-            const [usersRes, suggestionsRes] = await Promise.all([
-                axios.get(`${API_BASE}/api/admin/users`, {
-                    headers: { Authorization: `Bearer ${token}` }
-                }),
-                axios.get(`${API_BASE}/api/admin/suggestions`, {
+            const [usersPage, suggestionsPage, countsRes] = await Promise.all([
+                fetchPage<User>("/api/admin/users", "users", token),
+                fetchPage<Suggestion>("/api/admin/suggestions", "suggestions", token),
+                axios.get(`${API_BASE}/api/admin/counts`, {
                     headers: { Authorization: `Bearer ${token}` }
                 })
             ]);
 
-            setUsers(usersRes.data.users || []);
-            setSuggestions(suggestionsRes.data.suggestions || []);
+            setUsers(usersPage.items);
+            setUsersNext(usersPage.next);
+            setSuggestions(suggestionsPage.items);
+            setSuggestionsNext(suggestionsPage.next);
+            setTotals(countsRes.data);
         } catch (err: any) {
             console.error("Error fetching admin data:", err);
             if (err.response?.status === 403) {
@@ -76,6 +100,38 @@ export default function AdminDashboard() {
         }
     };
 
+    const loadMoreUsers = async () => {
+        if (!user || !usersNext) return;
+        setLoadingMore("users");
+        try {
+            const token = await user.getIdToken();
+            const page = await fetchPage<User>("/api/admin/users", "users", token, usersNext);
+            setUsers((prev) => [...prev, ...page.items]);
+            setUsersNext(page.next);
+        } catch (err: any) {
+            console.error("Error loading users:", err);
+            showToast("Failed to load more users", "error");
+        } finally {
+            setLoadingMore(null);
+        }
+    };
+
+    const loadMoreSuggestions = async () => {
+        if (!user || !suggestionsNext) return;
+        setLoadingMore("suggestions");
+        try {
+            const token = await user.getIdToken();
+            const page = await fetchPage<Suggestion>("/api/admin/suggestions", "suggestions", token, suggestionsNext);
+            setSuggestions((prev) => [...prev, ...page.items]);
+            setSuggestionsNext(page.next);
+        } catch (err: any) {
+            console.error("Error loading feedback:", err);
+            showToast("Failed to load more feedback", "error");
+        } finally {
+            setLoadingMore(null);
+        }
+    };
+
     if (loading) {
         return (
             <div className="min-h-screen flex items-center justify-center bg-[#0B0D12] text-white">
@@ -138,7 +194,7 @@ export default function AdminDashboard() {
                         <h2 className="text-lg font-bold mb-6 flex items-center gap-2">
                             <Users className="text-blue-400" size={20} />
                             Registered Users
-                            <span className="ml-auto text-sm text-gray-500 font-normal">{users.length} total</span>
+                            <span className="ml-auto text-sm text-gray-500 font-normal">{totals?.users ?? users.length} total</span>
                         </h2>
 
                         {isLoading ? (
@@ -178,6 +234,15 @@ export default function AdminDashboard() {
                                         </div>
                                     </div>
                                 ))}
+                                {usersNext && (
+                                    <button
+                                        onClick={loadMoreUsers}
+                                        disabled={loadingMore === "users"}
+                                        className="w-full py-3 text-sm text-gray-400 bg-white/5 rounded-xl border border-white/10 hover:bg-white/10 transition disabled:opacity-50"
+                                    >
+                                        {loadingMore === "users" ? "Loading..." : "Load more"}
+                                    </button>
+                                )}
                             </div>
                         )}
                     </motion.section>
@@ -192,7 +257,7 @@ export default function AdminDashboard() {
                         <h2 className="text-lg font-bold mb-6 flex items-center gap-2">
                             <MessageSquare className="text-green-400" size={20} />
                             User Feedback
-                            <span className="ml-auto text-sm text-gray-500 font-normal">{suggestions.length} total</span>
+                            <span className="ml-auto text-sm text-gray-500 font-normal">{totals?.suggestions ?? suggestions.length} total</span>
                         </h2>
 
                         {isLoading ? (
@@ -220,6 +285,15 @@ export default function AdminDashboard() {
                                         </div>
                                     </div>
                                 ))}
+                                {suggestionsNext && (
+                                    <button
+                                        onClick={loadMoreSuggestions}
+                                        disabled={loadingMore === "suggestions"}
+                                        className="w-full py-3 text-sm text-gray-400 bg-white/5 rounded-xl border border-white/10 hover:bg-white/10 transition disabled:opacity-50"
+                                    >
+                                        {loadingMore === "suggestions" ? "Loading..." : "Load more"}
+                                    </button>
+                                )}
                             </div>
                         )}
                     </motion.section>